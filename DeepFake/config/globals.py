@@ -1,3 +1,6 @@
+from typing import Dict, List, Optional
+import os
+
 import DeepFake.config.type as type
 
 PJ_NAME: str = 'df_inference'
@@ -6,6 +9,7 @@ CROP_FRAME_DIR: str = '/crop_frames'
 MASK_DIR: str = '/masks'
 MATRIX_DIR: str = '/matrices'
 SOURCE_EMBEDDING_DIR: str = '/embedding'
+ARTIFACT_DIR: str = '/artifacts'
 SWAPPED_FRAME_DIR: str = '/swapped'
 TEMP_DIR: str = '/temp'
 FRAME_EXTENSION: str = '.jpg'
@@ -13,9 +17,141 @@ VIDEO_EXTENSION: str = '.mp4'
 MASK_EXTENSION: str = '.npy'
 MATRIX_EXTENSION: str = '.npy'
 EMBEDDING_EXTENSION: str = '.npy'
+PART_EXTENSION: str = '.part'
+LATENT_SUFFIX: str = '_latent'
 
 
 VIDEO_FPS: int = 30
 VIDEO_QUALITY: int = 70
 VIDEO_ENCODER: type.OutputVideoEncoder = 'libx264'
-VIDEO_PRESET: type.OutputVideoPreset = 'veryfast'
\ No newline at end of file
+VIDEO_PRESET: type.OutputVideoPreset = 'veryfast'
+FRAME_DECODE_MODE: type.FrameDecodeMode = 'stream'
+FRAME_ENCODE_MODE: type.FrameEncodeMode = 'stream'
+
+
+SWAP_BATCH_SIZE: int = 8
+SWAP_BATCH_TIMEOUT: float = 0.005
+MASK_BATCH_FRAMES: int = 4
+STREAM_CHUNK_SIZE: int = 4
+STREAM_WINDOW_PER_THREAD: int = 2
+FRAME_SINK_MAX_PENDING: int = 32
+EXECUTION_BACKEND: type.ExecutionBackend = 'thread'
+PROCESS_WORKERS: int = 0
+PROCESS_WORKER_THREADS: int = 2
+SHARED_FRAME_MEMORY: int = 1024
+AUTOTUNE: bool = False
+AUTOTUNE_WORKER_FACTORS: List[float] = [ 0.25, 0.5, 1, 2 ]
+AUTOTUNE_CHUNK_SIZES: List[int] = [ 1, 2, 4, 8 ]
+AUTOTUNE_TRIAL_FRAMES: int = 32
+AUTOTUNE_MAX_TRIAL_FRAMES: int = 128
+AUTOTUNE_MAX_FRAMES: int = 384
+AUTOTUNE_CACHE_PATH: str = '/tmp/df_inference/autotune.json'
+LOG_LEVEL: type.LogLevel = 'info'
+METRICS_INTERVAL: float = 1.0
+METRICS_WINDOW: int = 60
+TRACE: bool = os.environ.get('DF_TRACE') == '1'
+TRACE_EXPORT: bool = False
+TRACE_MAX_EVENTS: int = 100000
+TRACE_DIR: str = '/tmp/df_inference/traces'
+DETECTION_CACHE_SIZE: int = 256
+DETECTION_CACHE_STRIDE: int = 8
+DETECTION_CACHE_DIR: Optional[str] = None
+FACE_TRACKING: bool = False
+TRACKING_KEYFRAME_INTERVAL: int = 8
+TRACKING_CHUNK_SIZE: int = 32
+TRACKING_MIN_POINTS: int = 3
+TRACKING_MAX_ERROR: float = 1.0
+TRACKING_SMOOTHING: float = 0.5
+DUPLICATE_SKIPPING: bool = True
+DUPLICATE_SIGNATURE_SIZE: type.Size = (64, 64)
+DUPLICATE_MAX_DIFF: int = 2
+JOB_CONCURRENCY: int = 1
+JOB_HISTORY_SIZE: int = 256
+PIPELINED_TRANSFER: bool = True
+
+
+MODEL_CONCURRENCY: Dict[type.ModelType, int] =\
+{
+    'detector': 2,
+    'masker': 2,
+    'embedder': 1,
+    'swapper': 2,
+    'enhancer': 1
+}
+MODEL_REPLICAS: Dict[type.ModelType, int] =\
+{
+    'detector': 1,
+    'masker': 1,
+    'embedder': 1,
+    'swapper': 1,
+    'enhancer': 1
+}
+MODEL_PIN_CORES: bool = False
+MODEL_PRECISION: Dict[type.ModelType, type.ModelPrecision] =\
+{
+    'detector': 'fp32',
+    'masker': 'fp32',
+    'embedder': 'fp32',
+    'swapper': 'fp32',
+    'enhancer': 'fp32'
+}
+MODEL_DYNAMIC_BATCH: Dict[type.ModelType, bool] =\
+{
+    'detector': True,
+    'masker': False,
+    'embedder': False,
+    'swapper': True,
+    'enhancer': False
+}
+
+
+SESSION_PROFILES: Dict[type.SessionProfileName, type.SessionProfile] =\
+{
+    'default':
+    {
+        'graph_optimization_level': 'all',
+        'intra_op_threads': 0,
+        'inter_op_threads': 0,
+        'partition_threads': False,
+        'execution_mode': 'sequential',
+        'enable_cpu_mem_arena': True,
+        'enable_mem_pattern': True,
+        'use_io_binding': False,
+        'cache_optimized_model': False
+    },
+    'throughput':
+    {
+        'graph_optimization_level': 'all',
+        'intra_op_threads': 0,
+        'inter_op_threads': 1,
+        'partition_threads': True,
+        'execution_mode': 'sequential',
+        'enable_cpu_mem_arena': True,
+        'enable_mem_pattern': True,
+        'use_io_binding': True,
+        'cache_optimized_model': True
+    },
+    'latency':
+    {
+        'graph_optimization_level': 'all',
+        'intra_op_threads': 0,
+        'inter_op_threads': 0,
+        'partition_threads': False,
+        'execution_mode': 'parallel',
+        'enable_cpu_mem_arena': True,
+        'enable_mem_pattern': True,
+        'use_io_binding': True,
+        'cache_optimized_model': True
+    }
+}
+MODEL_SESSION_PROFILE: Dict[type.ModelType, type.SessionProfileName] =\
+{
+    'detector': 'throughput',
+    'masker': 'throughput',
+    'embedder': 'latency',
+    'swapper': 'throughput',
+    'enhancer': 'latency'
+}
+SESSION_CACHE_DIR: str = '/tmp/df_inference/sessions'
+SESSION_PROFILING: bool = False
+SESSION_PROFILE_DIR: str = '/tmp/df_inference/profiles'
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 from threading import Lock
 
 import onnxruntime
@@ -9,7 +9,7 @@ import DeepFake.config.type as type
 _MODEL_TYPES = tuple(type.ModelType.__args__)
 
 
-_instances: dict[str, Optional[onnxruntime.InferenceSession]] = {
+_instances: dict[str, Optional[List[onnxruntime.InferenceSession]]] = {
     model_type: None for model_type in _MODEL_TYPES
 }
 
@@ -19,11 +19,11 @@ _locks: dict[str, Lock] = {
 }
 
 
-def get_instance(model_type: type.ModelType) -> Optional[onnxruntime.InferenceSession]:
+def get_instance(model_type: type.ModelType) -> Optional[List[onnxruntime.InferenceSession]]:
     global _instances
     return _instances.get(model_type)
 
 
-def set_instance(model_type: type.ModelType, session: onnxruntime.InferenceSession) -> None:
+def set_instance(model_type: type.ModelType, sessions: List[onnxruntime.InferenceSession]) -> None:
     global _instances
-    _instances[model_type] = session
\ No newline at end of file
+    _instances[model_type] = sessions
\ No newline at end of file
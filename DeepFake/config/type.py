@@ -1,16 +1,18 @@
-from typing import List, Any, Tuple, TypedDict, Annotated,  Literal,  Callable, TypeVar
+from typing import List, Any, Tuple, TypedDict, Annotated,  Literal,  Callable, TypeVar, Optional
 
 import numpy as np
 from numpy.typing import NDArray
 
 
 Frame = Annotated[NDArray[Any], (Any, Any, 3)]
+Frames = Annotated[NDArray[Any], (Any, Any, Any, 3)]
 Bbox = Annotated[NDArray[np.float64], (4,)]
 BboxList = Annotated[NDArray[np.float64], (Any, 4)] | List[Bbox]
 Kp = Annotated[NDArray[np.float64], (2,)]
 Kps = Annotated[NDArray[np.float64], (Any, 2)] | List[Kp]
 KpsList = Annotated[NDArray[np.float64], (Any, Any, 2)] | List[Kps]
 Embedding = np.ndarray[Any, Any]
+Latent = np.ndarray[Any, Any]
 Output = np.ndarray[Any, Any]
 Mask = np.ndarray[Any, Any]
 Matrix = np.ndarray[Any, Any]
@@ -21,10 +23,12 @@ Size = Tuple[int, int]
 
 Args = tuple[TypeVar('T'), ...]
 UpdateProcess = Callable[[], Any]
-ProcessFrames = Callable[[UpdateProcess, List[str], *tuple[str, ...]], None]
+ProcessFrames = Callable[[UpdateProcess, List[Any], *tuple[Any, ...]], None]
+FrameItem = Tuple[str, Frame]
 Resolution = Tuple[int, int]
 
 ModelType = Literal['detector', 'masker', 'embedder', 'swapper', 'enhancer']
+ModelPrecision = Literal['fp32', 'int8_dynamic', 'int8_static']
 Process = Literal['swap', 'blur']
 DetectFaceModel = Literal['yolov8', 'yolox']
 MaskFaceModel = Literal['face_occluder', 'face_parser', 'box']
@@ -35,8 +39,15 @@ TempFrameFormat = Literal['jpg', 'png', 'bmp']
 OutputVideoEncoder = Literal['libx264', 'libx265', 'libvpx-vp9', 'h264_nvenc', 'hevc_nvenc']
 OutputVideoPreset = Literal['ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow', 'slower', 'veryslow']
 ProcessMode = Literal['output', 'preview', 'stream']
+FrameDecodeMode = Literal['extract', 'stream']
+FrameEncodeMode = Literal['merge', 'stream']
+ExecutionBackend = Literal['thread', 'process']
 LogLevel = Literal['error', 'warn', 'info', 'debug']
 VideoMemoryStrategy = Literal['strict', 'moderate', 'tolerant']
+GraphOptimizationLevel = Literal['disable', 'basic', 'extended', 'all']
+ExecutionMode = Literal['sequential', 'parallel']
+SessionProfileName = Literal['default', 'throughput', 'latency']
+JobStatus = Literal['queued', 'running', 'cancelling', 'succeeded', 'failed', 'cancelled']
 Fps = float
 
 class Face(TypedDict):
@@ -48,4 +59,42 @@ class SystemResources(TypedDict):
     memory_available: float
     cpu_usage: float
     memory_usage: float
-    io_usage: float
\ No newline at end of file
+    io_usage: float
+    disk_read_rate: float
+    disk_write_rate: float
+
+class JobInfo(TypedDict):
+    job_id: str
+    user: str
+    kind: str
+    status: JobStatus
+    stage: Optional[str]
+    frame_count: int
+    frame_total: int
+    progress: float
+    error: Optional[str]
+    created_at: float
+    started_at: Optional[float]
+    finished_at: Optional[float]
+
+class SchedulerStats(TypedDict):
+    concurrency: int
+    replicas: int
+    waiting: int
+    running: int
+    run_count: int
+    wait_time_mean: float
+    wait_time_max: float
+    run_time_mean: float
+
+
+class SessionProfile(TypedDict):
+    graph_optimization_level: GraphOptimizationLevel
+    intra_op_threads: int
+    inter_op_threads: int
+    partition_threads: bool
+    execution_mode: ExecutionMode
+    enable_cpu_mem_arena: bool
+    enable_mem_pattern: bool
+    use_io_binding: bool
+    cache_optimized_model: bool
@@ -1,9 +1,17 @@
 WORDING =\
 {
-    'box2point/_eye_post': 'invalid eyes',
+	'fuse/encode_video': 'Failed to encode video',
+	'ffmpeg/read_frames': 'Failed to read frames',
 	'inference/get_session': 'invalid execution providers',
+	'inference/resolve_batch_path': 'Model cannot run batches, falling back to one row per run',
+	'inference/resolve_model_path': 'Quantized model not found, falling back to fp32',
+	'job_queue/run': 'Job failed',
+	'multi_process/run_process': 'Arguments cannot cross processes, falling back to threads',
+	'swap/encode_video': 'Failed to encode video',
 	'swap/merge_video': 'Failed to merge video',
+	'swap/read_frames': 'No frames to swap',
 	'swap/restore_audio': 'Failed to restore audio',
+	'vision/read_image': 'Failed to read image',
 }
 
 
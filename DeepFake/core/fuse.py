@@ -0,0 +1,59 @@
+from typing import Any, List
+
+import numpy as np
+
+import DeepFake.config.type as type
+import DeepFake.config.globals as globals
+import DeepFake.config.words as words
+import DeepFake.utils.log as log
+import DeepFake.utils.filesystem as filesystem
+import DeepFake.utils.vision as vision
+import DeepFake.utils.inference as inference
+import DeepFake.utils.ffmpeg as ffmpeg
+import DeepFake.utils.multi_process as multi_process
+import DeepFake.utils.job_queue as job_queue
+import DeepFake.utils.trace as trace
+import DeepFake.utils.frame_sink as frame_sink
+import DeepFake.core.mask as mask
+import DeepFake.core.swap as swap
+
+
+@trace.job('fuse')
+def run(source_frame_dir: str, video_path: str, output_dir: str) -> None:
+    source_latent_path = swap.prepare_source_latent(source_frame_dir, output_dir, video_path)
+    target_video_resolution = vision.detect_video_resolution(video_path)
+    output_video_resolution = vision.pack_resolution(target_video_resolution)
+    output_path = filesystem.get_save_path(output_dir, '/', video_path, globals.VIDEO_EXTENSION)
+    frame_items = mask.read_frame_items(video_path, output_video_resolution)
+    frame_total = vision.estimate_video_frame_total(video_path, globals.VIDEO_FPS)
+    sink = frame_sink.FrameSink(ffmpeg.open_video_encoder(output_path, output_video_resolution, globals.VIDEO_FPS, video_path))
+    try:
+        multi_process.run_stream(process_frames, frame_items, frame_total, source_latent_path, sink)
+    except BaseException:
+        sink.abort()
+        raise
+    if not sink.close():
+        log.error(words.get('fuse/encode_video'), __name__.upper())
+    inference.log_scheduler_stats()
+
+
+def process_frames(update_progress: type.UpdateProcess, frame_items: List[type.FrameItem], *args: Any) -> None:
+    source_latent_path, sink = args
+    source_latent = np.load(source_latent_path)
+    duplicate_filter = mask.create_duplicate_filter()
+    previous_frame = None
+    for start in range(0, len(frame_items), globals.MASK_BATCH_FRAMES):
+        job_queue.raise_if_cancelled()
+        window_frame_items = frame_items[start:start + globals.MASK_BATCH_FRAMES]
+        source_frame_numbers = [ duplicate_filter.check(mask.get_frame_number(frame_name), frame) if duplicate_filter else None for frame_name, frame in window_frame_items ]
+        frames = [ frame for (_, frame), source_frame_number in zip(window_frame_items, source_frame_numbers) if source_frame_number is None ]
+        targets = iter(mask.mask_targets(frames))
+        for (frame_name, frame), source_frame_number in zip(window_frame_items, source_frame_numbers):
+            if source_frame_number is None:
+                mask_list, crop_frame_list, affine_matrix_list = next(targets)
+                for target_mask, crop_frame, affine_matrix in zip(mask_list, crop_frame_list, affine_matrix_list):
+                    encoded_mask, inverse_matrix = mask.encode_target(target_mask, affine_matrix)
+                    frame = swap.swap(source_latent, frame, crop_frame, inverse_matrix, encoded_mask)
+                previous_frame = frame
+            sink.write(mask.get_frame_number(frame_name), previous_frame)
+            update_progress()
@@ -1,4 +1,5 @@
-from typing import List, Tuple
+from typing import Any, Iterator, List, Optional, Tuple
+import os
 
 import cv2
 import numpy as np
@@ -7,52 +8,135 @@ import DeepFake.config.type as type
 import DeepFake.config.globals as globals
 import DeepFake.utils.filesystem as filesystem
 import DeepFake.utils.swap_util as swap_util
+import DeepFake.utils.detection_cache as detection_cache
+import DeepFake.utils.tracker as tracker
+import DeepFake.utils.duplicate as duplicate
 import DeepFake.utils.ffmpeg as ffmpeg
 import DeepFake.utils.vision as vision
+import DeepFake.utils.inference as inference
 import DeepFake.utils.multi_process as multi_process
+import DeepFake.utils.job_queue as job_queue
+import DeepFake.utils.trace as trace
+import DeepFake.utils.artifact_store as artifact_store
 import DeepFake.core.model_zoo.face_occluder as masker
 import DeepFake.core.model_zoo.inswapper as swapper
 
 
+@trace.job('mask')
 def run(video_path: str, output_path: str):
-    filesystem.clear_temp(video_path)
-    filesystem.create_temp(video_path)
     target_video_resolution = vision.detect_video_resolution(video_path)
     output_video_resolution = vision.pack_resolution(target_video_resolution)
-    ffmpeg.extract_frames(video_path, output_video_resolution, globals.VIDEO_FPS)
-    frame_paths = filesystem.get_temp_frame_paths(video_path)
-    multi_process.run(process_frames, frame_paths, output_path)
-
-
-def process_frames(update_progress: type.UpdateProcess, frame_paths: List[str], *args: str) -> None:
-    output_path = args[0]
-    for frame_path in frame_paths:
-        frame = vision.read_static_image(frame_path)
-        mask_list, crop_frame_list, affine_matrix_list = mask_target(frame)
-        idx = 0
-        for mask, crop_frame, affine_matrix in zip(mask_list, crop_frame_list, affine_matrix_list):
-            inverse_matrix = cv2.invertAffineTransform(affine_matrix)
-            temp_frame_size = frame.shape[:2][::-1]
-            inverse_crop_mask = cv2.warpAffine(mask, inverse_matrix, temp_frame_size).clip(0, 1)
-            crop_frame_save_path = filesystem.get_save_path(output_path, globals.CROP_FRAME_DIR, frame_path, globals.FRAME_EXTENSION, idx)
-            mask_save_path = filesystem.get_save_path(output_path, globals.MASK_DIR, frame_path, globals.MASK_EXTENSION, idx)
-            matrix_save_path = filesystem.get_save_path(output_path, globals.MATRIX_DIR, frame_path, globals.MATRIX_EXTENSION, idx)
-            vision.write_image(crop_frame_save_path, crop_frame)
-            np.save(mask_save_path, inverse_crop_mask)
-            np.save(matrix_save_path, inverse_matrix)
-            idx += 1
-        frame_save_path = filesystem.get_save_path(output_path, globals.FRAME_DIR, frame_path, globals.FRAME_EXTENSION)
-        vision.write_image(frame_save_path, frame)
+    writer = artifact_store.ArtifactWriter(output_path + globals.ARTIFACT_DIR, swapper.MODEL_SIZE)
+    try:
+        if globals.FRAME_DECODE_MODE == 'stream':
+            frame_items = read_frame_items(video_path, output_video_resolution)
+            frame_total = vision.estimate_video_frame_total(video_path, globals.VIDEO_FPS)
+            multi_process.run_stream(process_stream_frames, frame_items, frame_total, output_path, writer, chunk_size = globals.TRACKING_CHUNK_SIZE if globals.FACE_TRACKING else None)
+        else:
+            filesystem.clear_temp(video_path)
+            filesystem.create_temp(video_path)
+            ffmpeg.extract_frames(video_path, output_video_resolution, globals.VIDEO_FPS)
+            frame_paths = filesystem.get_temp_frame_paths(video_path)
+            multi_process.run(process_frames, frame_paths, output_path, writer, chunk_size = globals.TRACKING_CHUNK_SIZE if globals.FACE_TRACKING else None)
+    finally:
+        writer.close()
+    inference.log_scheduler_stats()
+
+
+def read_frame_items(video_path: str, video_resolution: str) -> Iterator[type.FrameItem]:
+    frames = ffmpeg.read_frames(video_path, video_resolution, globals.VIDEO_FPS)
+    for frame_number, frame in enumerate(frames, 1):
+        yield str(frame_number).zfill(5) + globals.FRAME_EXTENSION, frame
+
+
+def process_frames(update_progress: type.UpdateProcess, frame_paths: List[str], *args: Any) -> None:
+    output_path, writer = args
+    face_tracker = create_tracker()
+    duplicate_filter = create_duplicate_filter()
+    for start in range(0, len(frame_paths), globals.MASK_BATCH_FRAMES):
+        job_queue.raise_if_cancelled()
+        window_frame_paths = frame_paths[start:start + globals.MASK_BATCH_FRAMES]
+        frames = [ vision.read_static_image(frame_path) for frame_path in window_frame_paths ]
+        process_window(update_progress, window_frame_paths, frames, output_path, writer, face_tracker, duplicate_filter)
+
+
+def process_stream_frames(update_progress: type.UpdateProcess, frame_items: List[type.FrameItem], *args: Any) -> None:
+    output_path, writer = args
+    face_tracker = create_tracker()
+    duplicate_filter = create_duplicate_filter()
+    for start in range(0, len(frame_items), globals.MASK_BATCH_FRAMES):
+        job_queue.raise_if_cancelled()
+        window_frame_items = frame_items[start:start + globals.MASK_BATCH_FRAMES]
+        window_frame_paths = [ frame_path for frame_path, _ in window_frame_items ]
+        frames = [ frame for _, frame in window_frame_items ]
+        process_window(update_progress, window_frame_paths, frames, output_path, writer, face_tracker, duplicate_filter)
+
+
+def create_tracker() -> Optional[tracker.FaceTracker]:
+    # chunks hold consecutive frames, one tracker follows the faces through a chunk
+    if globals.FACE_TRACKING:
+        return tracker.FaceTracker(swapper.MODEL_SIZE, swapper.MODEL_TEMPLATE)
+    return None
+
+
+def create_duplicate_filter() -> Optional[duplicate.DuplicateFilter]:
+    # duplicates are found within a chunk, the first frame of every chunk runs the models
+    if globals.DUPLICATE_SKIPPING:
+        return duplicate.DuplicateFilter()
+    return None
+
+
+def process_window(update_progress: type.UpdateProcess, frame_paths: List[str], frames: List[type.Frame], output_path: str, writer: artifact_store.ArtifactWriter, face_tracker: Optional[tracker.FaceTracker] = None, duplicate_filter: Optional[duplicate.DuplicateFilter] = None) -> None:
+    source_frame_numbers = [ duplicate_filter.check(get_frame_number(frame_path), frame) if duplicate_filter else None for frame_path, frame in zip(frame_paths, frames) ]
+    computed_frames = [ frame for frame, source_frame_number in zip(frames, source_frame_numbers) if source_frame_number is None ]
+    targets = iter(mask_crop_results([ face_tracker.crop_frame(frame) for frame in computed_frames ]) if face_tracker else mask_targets(computed_frames))
+    for frame_path, frame, source_frame_number in zip(frame_paths, frames, source_frame_numbers):
+        if source_frame_number is None:
+            save_target(output_path, writer, frame_path, frame, *next(targets))
+        else:
+            save_duplicate(output_path, writer, frame_path, source_frame_number)
         update_progress()
 
 
+def get_frame_number(frame_path: str) -> int:
+    return int(os.path.basename(frame_path).split('.')[0])
+
+
+def save_target(output_path: str, writer: artifact_store.ArtifactWriter, frame_path: str, frame: type.Frame, mask_list: List[type.Mask], crop_frame_list: List[type.Frame], affine_matrix_list: List[type.Matrix]) -> None:
+    frame_number = get_frame_number(frame_path)
+    encoded_targets = [ encode_target(mask, affine_matrix) for mask, affine_matrix in zip(mask_list, affine_matrix_list) ]
+    writer.write(frame_number, crop_frame_list, [ encoded_mask for encoded_mask, _ in encoded_targets ], [ inverse_matrix for _, inverse_matrix in encoded_targets ])
+    frame_save_path = filesystem.get_save_path(output_path, globals.FRAME_DIR, frame_path, globals.FRAME_EXTENSION)
+    vision.write_image(frame_save_path, frame)
+
+
+def save_duplicate(output_path: str, writer: artifact_store.ArtifactWriter, frame_path: str, source_frame_number: int) -> None:
+    writer.write(get_frame_number(frame_path), [], [], [], source_frame_number)
+    # the source image is stored so swap sees identical pixels and can reuse its output
+    source_frame_path = str(source_frame_number).zfill(5) + globals.FRAME_EXTENSION
+    source_save_path = filesystem.get_save_path(output_path, globals.FRAME_DIR, source_frame_path, globals.FRAME_EXTENSION)
+    frame_save_path = filesystem.get_save_path(output_path, globals.FRAME_DIR, frame_path, globals.FRAME_EXTENSION)
+    filesystem.link_file(source_save_path, frame_save_path)
+
+
+def encode_target(mask: type.Mask, affine_matrix: type.Matrix) -> Tuple[type.Mask, type.Matrix]:
+    inverse_matrix = cv2.invertAffineTransform(affine_matrix)
+    encoded_mask = (mask.clip(0, 1) * 255).round().astype(np.uint8)
+    return encoded_mask, inverse_matrix
+
+
+def mask_targets(target_frames: List[type.Frame]) -> List[Tuple[List[type.Mask], List[type.Frame], List[type.Matrix]]]:
+    crop_results = swap_util.crop_frames(target_frames, swapper.MODEL_SIZE, swapper.MODEL_TEMPLATE, detection_cache.detect(target_frames))
+    return mask_crop_results(crop_results)
+
 
-def mask_target(target_frame: type.Frame) -> Tuple[List[type.Mask], List[type.Frame], List[type.Matrix]]:
-    cropped_frames, affine_matrices = swap_util.crop_frame(target_frame, swapper.MODEL_SIZE, swapper.MODEL_TEMPLATE)
-    if len(cropped_frames) == 0:
-        return [], [], []
-    mask_list = []
-    for cropped_frame in cropped_frames:
-        mask = masker.run(cropped_frame)
-        mask_list.append(mask)
-    return mask_list, cropped_frames, affine_matrices
\ No newline at end of file
+def mask_crop_results(crop_results: List[Tuple[List[type.Frame], List[type.Matrix]]]) -> List[Tuple[List[type.Mask], List[type.Frame], List[type.Matrix]]]:
+    all_cropped_frames = [ cropped_frame for cropped_frames, _ in crop_results for cropped_frame in cropped_frames ]
+    all_masks = masker.run_batch(all_cropped_frames)
+    targets = []
+    start = 0
+    for cropped_frames, affine_matrices in crop_results:
+        end = start + len(cropped_frames)
+        targets.append((all_masks[start:end], cropped_frames, affine_matrices))
+        start = end
+    return targets
\ No newline at end of file
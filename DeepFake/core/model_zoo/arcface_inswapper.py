@@ -1,8 +1,11 @@
+from typing import List
+
 import numpy as np
 
 import DeepFake.config.type as type
 import DeepFake.utils.filesystem as filesystem
 import DeepFake.utils.inference as inference
+import DeepFake.utils.trace as trace
 
 
 '''
@@ -33,6 +36,10 @@ def run(frame: type.Frame) -> type.Embedding:
     return embedding
 
 
+def prepare_calibration(crop_frames: List[type.Frame]) -> List[List[type.Frame]]:
+    return [ [ _preprocess(crop_frame) ] for crop_frame in crop_frames ]
+
+
 def _preprocess(crop_frame: type.Frame) -> type.Frame:
     crop_frame = crop_frame.astype(np.float32) / 127.5 - 1
     crop_frame = crop_frame[:, :, ::-1].transpose(2, 0, 1)
@@ -40,11 +47,12 @@ def _preprocess(crop_frame: type.Frame) -> type.Frame:
     return crop_frame
 
 
+@trace.span('arcface_inswapper/forward', 'model')
 def _forward(frame: type.Frame) -> type.Output:
     session = inference.get_session(MODEL_PATH, 'embedder')
     input_names = inference.get_input_names(session)
-    with inference.thread_semaphore():
-        output = session.run(None,
+    with inference.acquire_session(MODEL_PATH, 'embedder') as session:
+        output = inference.run_session(session, 'embedder',
         {
             input_names[0]: frame,
         })
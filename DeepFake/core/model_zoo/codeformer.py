@@ -5,6 +5,7 @@ import numpy as np
 import DeepFake.config.type as type
 import DeepFake.utils.filesystem as filesystem
 import DeepFake.utils.inference as inference
+import DeepFake.utils.trace as trace
 import DeepFake.utils.swap_util as swap_util
 
 
@@ -40,12 +41,13 @@ def run(crop_frame: type.Frame) -> type.Frame:
     return crop_frame
 
 
+@trace.span('codeformer/forward', 'model')
 def _forward(crop_frame : type.Frame) -> type.Output:
     session = inference.get_session(MODEL_PATH, 'enhancer')
     input_names = inference.get_input_names(session)
     weight = np.array([ 1 ], dtype = np.double)
-    with inference.thread_semaphore():
-        output = session.run(None,
+    with inference.acquire_session(MODEL_PATH, 'enhancer') as session:
+        output = inference.run_session(session, 'enhancer',
         {
             input_names[0]: crop_frame,
             input_names[1]: weight,
@@ -1,9 +1,12 @@
-import cv2
+from typing import List
+
 import numpy as np
 
 import DeepFake.config.type as type
 import DeepFake.utils.filesystem as filesystem
 import DeepFake.utils.inference as inference
+import DeepFake.utils.trace as trace
+import DeepFake.utils.vision as vision
 
 
 '''
@@ -20,31 +23,42 @@ MODEL_PATH = filesystem.resolve_relative_path('../../models/face_occluder.onnx')
 
 
 def run(frame: type.Frame) -> type.Mask:
-    prepare_frame = _preprocess(frame)
-    output = _forward(prepare_frame)
-    mask = _postprocess(output, frame)
-    return mask
+    return run_batch([ frame ])[0]
+
+
+def run_batch(frames: List[type.Frame]) -> List[type.Mask]:
+    if len(frames) == 0:
+        return []
+    frames = np.stack(frames)
+    prepare_frames = _preprocess(frames)
+    output = _forward(prepare_frames)
+    masks = _postprocess(output, frames)
+    return masks
+
+
+def prepare_calibration(frames: List[type.Frame]) -> List[List[type.Frames]]:
+    return [ [ _preprocess(np.stack([ frame ])) ] for frame in frames ]
 
 
-def _preprocess(frame: type.Frame) -> type.Frame:
-    frame = cv2.resize(frame, MODEL_SIZE, interpolation = cv2.INTER_LINEAR)
-    frame = np.expand_dims(frame, axis = 0).astype(np.float32) / 255
-    return frame
+def _preprocess(frames: type.Frames) -> type.Frames:
+    frames = vision.resize_frames(frames, MODEL_SIZE)
+    frames = frames.astype(np.float32) / 255
+    return frames
 
 
+@trace.span('face_occluder/forward', 'model')
 def _forward(frame: type.Frame) -> type.Output:
     session = inference.get_session(MODEL_PATH, 'masker')
     input_names = inference.get_input_names(session)
-    with inference.thread_semaphore():
-        output = session.run(None,
+    with inference.acquire_session(MODEL_PATH, 'masker') as session:
+        output = inference.run_session(session, 'masker',
         {
             input_names[0]: frame,
         })
     return output
 
 
-def _postprocess(output: type.Output, frame: type.Frame) -> type.Mask:
-    mask = output[0][0]
-    occlusion_mask = mask.transpose(0, 1, 2).clip(0, 1).astype(np.float32)
-    occlusion_mask = cv2.resize(occlusion_mask, frame.shape[:2][::-1])
-    return occlusion_mask
\ No newline at end of file
+def _postprocess(output: type.Output, frames: type.Frames) -> List[type.Mask]:
+    masks = output[0].clip(0, 1).astype(np.float32)
+    occlusion_masks = vision.resize_frames(masks, frames.shape[1:3][::-1])
+    return list(occlusion_masks[:, :, :, 0])
\ No newline at end of file
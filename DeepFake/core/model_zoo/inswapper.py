@@ -1,9 +1,15 @@
+from typing import List, Optional
+from threading import Lock
+
 import numpy as np
 import onnx
 
 import DeepFake.config.type as type
+import DeepFake.config.globals as globals
 import DeepFake.utils.filesystem as filesystem
 import DeepFake.utils.inference as inference
+import DeepFake.utils.trace as trace
+import DeepFake.utils.batch as batch
 
 
 '''
@@ -28,39 +34,71 @@ MODEL_TEMPLATE = np.array(
 ])
 
 
-def run(target_crop_frame: type.Frame, source_embedding: type.Embedding) -> type.Frame:
-    source_embedding = _prepare_source(source_embedding)
-    target_frame = _prepare_target(target_crop_frame)
+_model_matrix: Optional[type.Matrix] = None
+_model_matrix_lock = Lock()
+
+
+def run(target_crop_frame: type.Frame, source_latent: type.Latent) -> type.Frame:
+    return run_batch([ target_crop_frame ], [ source_latent ])[0]
+
+
+def run_batch(target_crop_frames: List[type.Frame], source_latents: List[type.Latent]) -> List[type.Frame]:
+    source_embedding = np.concatenate(source_latents).astype(np.float32)
+    target_frame = np.concatenate([ _prepare_target(target_crop_frame) for target_crop_frame in target_crop_frames ])
     output = _forward(target_frame, source_embedding)
-    crop_frame = _postprocess(output)
-    return crop_frame
+    crop_frames = _postprocess(output)
+    return crop_frames
+
+
+def run_queued(target_crop_frame: type.Frame, source_latent: type.Latent) -> type.Frame:
+    # a fixed batch model runs row by row anyway, queueing would only serialise the callers
+    if inference.supports_batch(MODEL_PATH, 'swapper'):
+        return _batcher.submit(target_crop_frame, source_latent)
+    return run(target_crop_frame, source_latent)
+
 
+def prepare_calibration(target_crop_frames: List[type.Frame], source_latents: List[type.Latent]) -> List[List[np.ndarray]]:
+    return [ [ _prepare_target(target_crop_frame), source_latent.astype(np.float32) ] for target_crop_frame, source_latent in zip(target_crop_frames, source_latents) ]
 
+
+@trace.span('inswapper/forward', 'model')
 def _forward(target_frame: type.Frame, source_embedding: type.Embedding) -> type.Output:
     session = inference.get_session(MODEL_PATH, 'swapper')
     input_names = inference.get_input_names(session)
-    with inference.thread_semaphore():
-        output = session.run(None,
-        {
-            input_names[0]: target_frame,
-            input_names[1]: source_embedding,
-        })
-    return output
-
-
-def _postprocess(output: type.Output) -> type.Frame:
-    crop_frame = output[0][0]
-    crop_frame = (crop_frame.astype(np.float32) * 255.0).round()
-    crop_frame = crop_frame.transpose(1, 2, 0)
-    crop_frame = crop_frame[:, :, ::-1]
-    return crop_frame
-
-
-def _prepare_source(embedding: type.Embedding) -> type.Embedding:
+    if inference.supports_batch(MODEL_PATH, 'swapper'):
+        with inference.acquire_session(MODEL_PATH, 'swapper') as session:
+            output = inference.run_session(session, 'swapper',
+            {
+                input_names[0]: target_frame,
+                input_names[1]: source_embedding,
+            })
+        return output
+    outputs = []
+    for index in range(target_frame.shape[0]):
+        with inference.acquire_session(MODEL_PATH, 'swapper') as session:
+            outputs.append(inference.run_session(session, 'swapper',
+            {
+                input_names[0]: target_frame[index:index + 1],
+                input_names[1]: source_embedding[index:index + 1],
+            })[0])
+    return [ np.concatenate(outputs) ]
+
+
+def _postprocess(output: type.Output) -> List[type.Frame]:
+    crop_frames = []
+    for crop_frame in output[0]:
+        crop_frame = (crop_frame.astype(np.float32) * 255.0).round()
+        crop_frame = crop_frame.transpose(1, 2, 0)
+        crop_frame = crop_frame[:, :, ::-1]
+        crop_frames.append(crop_frame)
+    return crop_frames
+
+
+def prepare_source(embedding: type.Embedding) -> type.Latent:
     embedding = embedding.reshape((1, -1))
-    model_matrix = get_model_matrix(onnx.load(MODEL_PATH))
-    embedding = np.dot(embedding, model_matrix) / np.linalg.norm(embedding)
-    return embedding
+    model_matrix = get_cached_model_matrix()
+    latent = np.dot(embedding, model_matrix) / np.linalg.norm(embedding)
+    return latent.astype(np.float32)
 
 
 def _prepare_target(crop_frame: type.Frame) -> type.Frame:
@@ -73,4 +111,17 @@ def _prepare_target(crop_frame: type.Frame) -> type.Frame:
 
 def get_model_matrix(model: onnx.ModelProto) -> type.Matrix:
     model_matrix = onnx.numpy_helper.to_array(model.graph.initializer[-1])
-    return model_matrix
\ No newline at end of file
+    return model_matrix
+
+
+def get_cached_model_matrix() -> type.Matrix:
+    global _model_matrix
+    if _model_matrix is not None:
+        return _model_matrix
+    with _model_matrix_lock:
+        if _model_matrix is None:
+            _model_matrix = get_model_matrix(onnx.load(MODEL_PATH))
+        return _model_matrix
+
+
+_batcher = batch.MicroBatcher(run_batch, globals.SWAP_BATCH_SIZE, globals.SWAP_BATCH_TIMEOUT)
\ No newline at end of file
@@ -2,7 +2,7 @@
 # output: kps[5, 2]
 # kps: [left_eye, right_eye, nose, left_mouth, right_mouth]
 
-from typing import Tuple
+from typing import List, Tuple
 
 import cv2
 import numpy as np
@@ -11,6 +11,7 @@ import DeepFake.config.type as type
 import DeepFake.config.instance as instance
 import DeepFake.utils.filesystem as filesystem
 import DeepFake.utils.inference as inference
+import DeepFake.utils.trace as trace
 import DeepFake.utils.box2point as box2point
 
 
@@ -28,12 +29,24 @@ MODEL_PATH = filesystem.resolve_relative_path('../../models/yolox.onnx')
 
 
 def run(frame: type.Frame) -> type.KpsList:
-    frame, resize_data = _preprocess(frame)
-    output = _forward(frame)
-    results = _postprocess(output, resize_data)
+    return run_batch([ frame ])[0]
+
+
+def run_batch(frames: List[type.Frame]) -> List[type.KpsList]:
+    if len(frames) == 0:
+        return []
+    if len(frames) > 1 and not inference.supports_batch(MODEL_PATH, 'detector'):
+        return [ run(frame) for frame in frames ]
+    prepare_frames, resize_data_list = zip(*[ _preprocess(frame) for frame in frames ])
+    output = _forward(np.concatenate(prepare_frames))
+    results = [ _postprocess(output, resize_data, batch_index) for batch_index, resize_data in enumerate(resize_data_list) ]
     return results
 
 
+def prepare_calibration(frames: List[type.Frame]) -> List[List[type.Frame]]:
+    return [ [ _preprocess(frame)[0] ] for frame in frames ]
+
+
 def _preprocess(frame: type.Frame) -> Tuple[type.Frame, type.ResizeData]:
     frame_height, frame_width = frame.shape[:2]
     resize_ratio = min(MODEL_SIZE[0] / frame_height, MODEL_SIZE[1] / frame_width)
@@ -50,28 +63,30 @@ def _preprocess(frame: type.Frame) -> Tuple[type.Frame, type.ResizeData]:
     return frame, resize_data
 
 
+@trace.span('yolox/forward', 'model')
 def _forward(frame: type.Frame) -> type.Output:
     session = inference.get_session(MODEL_PATH, 'detector')
     input_names = inference.get_input_names(session)
-    with inference.thread_semaphore():
-        output = session.run(None,
+    with inference.acquire_session(MODEL_PATH, 'detector') as session:
+        output = inference.run_session(session, 'detector',
         {
             input_names[0]: frame
         })
     return output
 
 
-def _postprocess(detections: type.Output, resize_data: type.ResizeData) -> type.KpsList:
+def _postprocess(output: type.Output, resize_data: type.ResizeData, batch_index: int) -> type.KpsList:
     offset_height, offset_width, resize_ratio = resize_data[0], resize_data[1], resize_data[2]
-    detections = np.array(detections)
-    detections[:, :, 3::2] = (detections[:, :, 3::2] - offset_width) / resize_ratio
-    detections[:, :, 4::2] = (detections[:, :, 4::2] - offset_height) / resize_ratio
-    face_boxes = detections[detections[:, :, 1] == 3]
+    detections = output[0]
+    detections = detections[detections[:, 0] == batch_index]
+    detections[:, 3::2] = (detections[:, 3::2] - offset_width) / resize_ratio
+    detections[:, 4::2] = (detections[:, 4::2] - offset_height) / resize_ratio
+    face_boxes = detections[detections[:, 1] == 3]
     if len(face_boxes) == 0:
         return []
-    eye_boxes = detections[detections[:, :, 1] == 4]
-    nose_boxes = detections[detections[:, :, 1] == 5]
-    mouth_boxes = detections[detections[:, :, 1] == 6]
+    eye_boxes = detections[detections[:, 1] == 4]
+    nose_boxes = detections[detections[:, 1] == 5]
+    mouth_boxes = detections[detections[:, 1] == 6]
     face_boxes = face_boxes[:, 3:]
     eye_boxes = eye_boxes[:, 3:]
     nose_boxes = nose_boxes[:, 3:]
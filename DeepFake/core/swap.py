@@ -1,5 +1,5 @@
 import os
-from typing import List
+from typing import Any, List, Tuple
 import glob
 
 import cv2
@@ -11,69 +11,137 @@ import DeepFake.config.words as words
 import DeepFake.utils.log as log
 import DeepFake.utils.filesystem as filesystem
 import DeepFake.utils.vision as vision
+import DeepFake.utils.inference as inference
 import DeepFake.utils.ffmpeg as ffmpeg
 import DeepFake.utils.swap_util as swap_util
 import DeepFake.utils.multi_process as multi_process
+import DeepFake.utils.job_queue as job_queue
+import DeepFake.utils.trace as trace
+import DeepFake.utils.frame_sink as frame_sink
+import DeepFake.utils.artifact_store as artifact_store
+import DeepFake.utils.blend as blend
 import DeepFake.core.model_zoo.arcface_inswapper as embedder
 import DeepFake.core.model_zoo.inswapper as swapper
 
 
+@trace.job('swap')
 def run(source_frame_dir: str, target_face_dir: str, output_dir: str, original_video_path: str) -> None:
-    source_frame_paths = sorted(glob.glob(os.path.join(source_frame_dir, '*')))
-    source_frames = vision.read_static_images(source_frame_paths)
     temp_dir = output_dir + globals.TEMP_DIR
     target_frame_dir = target_face_dir + globals.FRAME_DIR
     swapped_dir = output_dir + globals.SWAPPED_FRAME_DIR
-    parent_dir = filesystem.get_parent_dir(original_video_path)
-    source_embedding_path = filesystem.get_save_path(output_dir, globals.SOURCE_EMBEDDING_DIR, parent_dir, globals.EMBEDDING_EXTENSION)
     output_path = filesystem.get_save_path(output_dir, '/', original_video_path, globals.VIDEO_EXTENSION)
     temp_output_path = filesystem.get_save_path(output_dir, globals.TEMP_DIR, original_video_path, globals.VIDEO_EXTENSION)
-    frame_paths = sorted(glob.glob(os.path.join(target_frame_dir, '*')))
-    if not filesystem.is_file(source_embedding_path):
-        create_source_embedding(source_frames, source_embedding_path)
-    multi_process.run(process_frames, frame_paths, source_embedding_path, target_face_dir, output_dir)
-    if not ffmpeg.merge_video(swapped_dir, temp_output_path, globals.VIDEO_FPS):
-        log.error(words.get('swap/merge_video'), __name__.upper())
-    if not ffmpeg.restore_audio(original_video_path, temp_output_path, output_path):
-        log.error(words.get('swap/restore_audio'), __name__.upper())
-        filesystem.move_file(temp_output_path, output_path)
+    frame_paths = filesystem.list_landing_files(target_frame_dir)
+    if not frame_paths:
+        log.error(words.get('swap/read_frames'), __name__.upper())
+        return
+    source_latent_path = prepare_source_latent(source_frame_dir, output_dir, original_video_path)
+    artifact_dir = target_face_dir + globals.ARTIFACT_DIR
+    artifacts = artifact_store.ArtifactReader(artifact_dir) if artifact_store.is_store(artifact_dir) else None
+    if globals.FRAME_ENCODE_MODE == 'stream':
+        frame_shape = vision.read_image(frame_paths[0]).shape
+        output_video_resolution = vision.pack_resolution(frame_shape[:2][::-1])
+        sink = frame_sink.FrameSink(ffmpeg.open_video_encoder(output_path, output_video_resolution, globals.VIDEO_FPS, original_video_path))
+        try:
+            multi_process.run_stream(process_frames, frame_paths, len(frame_paths), source_latent_path, artifacts, target_face_dir, output_dir, sink, frame_shape = frame_shape)
+        except BaseException:
+            sink.abort()
+            raise
+        if not sink.close():
+            log.error(words.get('swap/encode_video'), __name__.upper())
+    else:
+        multi_process.run(process_frames, frame_paths, source_latent_path, artifacts, target_face_dir, output_dir, None)
+        if not ffmpeg.merge_video(swapped_dir, temp_output_path, globals.VIDEO_FPS):
+            log.error(words.get('swap/merge_video'), __name__.upper())
+        if not ffmpeg.restore_audio(original_video_path, temp_output_path, output_path):
+            log.error(words.get('swap/restore_audio'), __name__.upper())
+            filesystem.move_file(temp_output_path, output_path)
     filesystem.clear_directory(swapped_dir)
     filesystem.clear_directory(temp_dir)
+    inference.log_scheduler_stats()
 
 
-def process_frames(update_progress: type.UpdateProcess, frame_paths: List[str], *args: str) -> None:
-    source_embedding_path, target_face_dir, output_dir = args
-    source_embedding = np.load(source_embedding_path)
-    target_crop_frame_dir = target_face_dir + globals.CROP_FRAME_DIR
-    target_mask_dir = target_face_dir + globals.MASK_DIR
-    target_matrix_dir = target_face_dir + globals.MATRIX_DIR
+def process_frames(update_progress: type.UpdateProcess, frame_paths: List[str], *args: Any) -> None:
+    source_latent_path, artifacts, target_face_dir, output_dir, sink = args
+    source_latent = np.load(source_latent_path)
+    previous_frame_number, previous_frame, previous_output_path = None, None, None
     for frame_path in frame_paths:
+        job_queue.raise_if_cancelled()
         frame_name = os.path.basename(frame_path).split('.')[0]
-        frame = vision.read_static_image(frame_path)
-        face_pattern = f"{frame_name}_*"
-        crop_face_paths = sorted(glob.glob(os.path.join(target_crop_frame_dir, face_pattern)))
-        for crop_face_path in crop_face_paths:
-            frame_face_id = os.path.basename(crop_face_path).split('.')[0]
-            matrix_path = os.path.join(target_matrix_dir, frame_face_id + globals.MATRIX_EXTENSION)
-            mask_path = os.path.join(target_mask_dir, frame_face_id + globals.MASK_EXTENSION)
-            crop_frame = vision.read_static_image(crop_face_path)
-            matrix = np.load(matrix_path)
-            mask = np.load(mask_path)
-            swapped_frame = swap(source_embedding, frame, crop_frame, matrix, mask)
-            output_path = filesystem.get_save_path(output_dir, globals.SWAPPED_FRAME_DIR, frame_path, globals.FRAME_EXTENSION)
-            vision.write_image(output_path, swapped_frame)
+        output_path = None if sink else filesystem.get_save_path(output_dir, globals.SWAPPED_FRAME_DIR, frame_path, globals.FRAME_EXTENSION)
+        # mask stored the source image for a duplicate frame, the swapped source is the output
+        if artifacts and previous_frame_number is not None and artifacts.get_source(int(frame_name)) == previous_frame_number:
+            trace.count('swap/reused_frames')
+            if sink:
+                sink.write(int(frame_name), previous_frame)
+            else:
+                filesystem.link_file(previous_output_path, output_path)
+            update_progress()
+            continue
+        frame = vision.read_image(frame_path)
+        if artifacts:
+            crop_frames, masks, matrices = artifacts.read(int(frame_name))
+        else:
+            crop_frames, masks, matrices = read_legacy_targets(target_face_dir, frame_name)
+        for crop_frame, mask, matrix in zip(crop_frames, masks, matrices):
+            frame = swap(source_latent, frame, crop_frame, matrix, mask)
+        if sink:
+            sink.write(int(frame_name), frame)
+        else:
+            vision.write_image(output_path, frame)
+        previous_frame_number, previous_frame, previous_output_path = int(frame_name), frame, output_path
         update_progress()
 
 
-def swap(source_embedding: type.Embedding, target_frame: type.Frame, target_crop_frame: type.Frame, target_matrix: type.Matrix, target_mask: type.Mask) -> type.Frame:
-    swapped_crop_frame = swapper.run(target_crop_frame, source_embedding)
-    temp_frame_size = target_frame.shape[:2][::-1]
-    inverse_crop_frame = cv2.warpAffine(swapped_crop_frame, target_matrix, temp_frame_size, borderMode = cv2.BORDER_REPLICATE)
-    paste_frame = target_frame.copy()
-    paste_frame[:, :, 0] = target_mask * inverse_crop_frame[:, :, 0] + (1 - target_mask) * target_frame[:, :, 0]
-    paste_frame[:, :, 1] = target_mask * inverse_crop_frame[:, :, 1] + (1 - target_mask) * target_frame[:, :, 1]
-    paste_frame[:, :, 2] = target_mask * inverse_crop_frame[:, :, 2] + (1 - target_mask) * target_frame[:, :, 2]
-    return paste_frame
+def read_legacy_targets(target_face_dir: str, frame_name: str) -> Tuple[List[type.Frame], List[type.Mask], List[type.Matrix]]:
+    target_crop_frame_dir = target_face_dir + globals.CROP_FRAME_DIR
+    target_mask_dir = target_face_dir + globals.MASK_DIR
+    target_matrix_dir = target_face_dir + globals.MATRIX_DIR
+    face_pattern = f"{frame_name}_*"
+    crop_face_paths = sorted(glob.glob(os.path.join(target_crop_frame_dir, face_pattern)))
+    crop_frames, masks, matrices = [], [], []
+    for crop_face_path in crop_face_paths:
+        frame_face_id = os.path.basename(crop_face_path).split('.')[0]
+        matrix_path = os.path.join(target_matrix_dir, frame_face_id + globals.MATRIX_EXTENSION)
+        mask_path = os.path.join(target_mask_dir, frame_face_id + globals.MASK_EXTENSION)
+        crop_frame = vision.read_image(crop_face_path)
+        matrix = np.load(matrix_path)
+        mask = cv2.warpAffine(np.load(mask_path), cv2.invertAffineTransform(matrix), crop_frame.shape[:2][::-1])
+        crop_frames.append(crop_frame)
+        masks.append((mask.clip(0, 1) * 255).round().astype(np.uint8))
+        matrices.append(matrix)
+    return crop_frames, masks, matrices
+
+
+def swap(source_latent: type.Latent, target_frame: type.Frame, target_crop_frame: type.Frame, target_matrix: type.Matrix, target_mask: type.Mask) -> type.Frame:
+    swapped_crop_frame = swapper.run_queued(target_crop_frame, source_latent)
+    swapped_crop_frame = np.clip(swapped_crop_frame, 0, 255).astype(np.uint8)
+    x1, y1, x2, y2 = swap_util.get_paste_box(target_matrix, swapped_crop_frame.shape[:2][::-1], target_frame.shape[:2][::-1])
+    if x1 >= x2 or y1 >= y2:
+        return target_frame
+    if not target_frame.flags.writeable:
+        target_frame = target_frame.copy()
+    paste_matrix = target_matrix.copy()
+    paste_matrix[:, 2] -= [ x1, y1 ]
+    paste_size = (x2 - x1, y2 - y1)
+    inverse_crop_frame = cv2.warpAffine(swapped_crop_frame, paste_matrix, paste_size, borderMode = cv2.BORDER_REPLICATE)
+    inverse_mask = cv2.warpAffine(target_mask, paste_matrix, paste_size)
+    blend.paste(target_frame[y1:y2, x1:x2], inverse_crop_frame, inverse_mask)
+    return target_frame
+
+
+def prepare_source_latent(source_frame_dir: str, output_dir: str, original_video_path: str) -> str:
+    parent_dir = filesystem.get_parent_dir(original_video_path)
+    source_embedding_path = filesystem.get_save_path(output_dir, globals.SOURCE_EMBEDDING_DIR, parent_dir, globals.EMBEDDING_EXTENSION)
+    source_latent_path = filesystem.get_save_path(output_dir, globals.SOURCE_EMBEDDING_DIR, parent_dir + globals.LATENT_SUFFIX, globals.EMBEDDING_EXTENSION)
+    if not filesystem.is_file(source_embedding_path):
+        source_frame_paths = sorted(glob.glob(os.path.join(source_frame_dir, '*')))
+        source_frames = vision.read_static_images(source_frame_paths)
+        create_source_embedding(source_frames, source_embedding_path)
+        create_source_latent(source_embedding_path, source_latent_path)
+    if not filesystem.is_file(source_latent_path):
+        create_source_latent(source_embedding_path, source_latent_path)
+    return source_latent_path
 
 
 def create_source_embedding(source_frames: List[type.Frame], output_path) -> None:
@@ -83,4 +151,10 @@ def create_source_embedding(source_frames: List[type.Frame], output_path) -> Non
         source_embedding = embedder.run(source_crop_frame[0])
         source_embedding_list.append(source_embedding)
     mean_embedding = np.mean(source_embedding_list, axis=0)
-    np.save(output_path, mean_embedding)
\ No newline at end of file
+    np.save(output_path, mean_embedding)
+
+
+def create_source_latent(source_embedding_path: str, output_path: str) -> None:
+    source_embedding = np.load(source_embedding_path)
+    source_latent = swapper.prepare_source(source_embedding)
+    np.save(output_path, source_latent)
\ No newline at end of file
@@ -0,0 +1,124 @@
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import os
+import threading
+
+import numpy as np
+
+import DeepFake.config.type as type
+import DeepFake.utils.trace as trace
+
+
+'''
+store
+crops.bin: [K, H, W, 3] uint8
+masks.bin: [K, H, W] uint8
+matrices.bin: [K, 2, 3] float64
+index.npy: [F, 3] int64 (frame_number, first_row, face_count)
+aliases.npy: [A, 2] int64 (frame_number, source_frame_number), optional
+meta.json: crop_size, count
+'''
+
+
+CROP_FILE = 'crops.bin'
+MASK_FILE = 'masks.bin'
+MATRIX_FILE = 'matrices.bin'
+INDEX_FILE = 'index.npy'
+ALIAS_FILE = 'aliases.npy'
+META_FILE = 'meta.json'
+
+
+class ArtifactWriter:
+
+    def __init__(self, store_dir: str, crop_size: type.Size) -> None:
+        os.makedirs(store_dir, exist_ok = True)
+        self._store_dir = store_dir
+        self._crop_size = crop_size
+        self._crop_file = open(os.path.join(store_dir, CROP_FILE), 'wb')
+        self._mask_file = open(os.path.join(store_dir, MASK_FILE), 'wb')
+        self._matrix_file = open(os.path.join(store_dir, MATRIX_FILE), 'wb')
+        self._index: List[Tuple[int, int, int]] = []
+        self._rows: Dict[int, Tuple[int, int]] = {}
+        self._aliases: List[Tuple[int, int]] = []
+        self._count = 0
+        self._lock = threading.Lock()
+
+
+    def write(self, frame_number: int, crop_frames: List[type.Frame], masks: List[type.Mask], matrices: List[type.Matrix], source_frame_number: Optional[int] = None) -> None:
+        if source_frame_number is not None:
+            self.alias(frame_number, source_frame_number)
+            return
+        crop_data = b''.join(np.ascontiguousarray(crop_frame, dtype = np.uint8).tobytes() for crop_frame in crop_frames)
+        mask_data = b''.join(np.ascontiguousarray(mask, dtype = np.uint8).tobytes() for mask in masks)
+        matrix_data = b''.join(np.ascontiguousarray(matrix, dtype = np.float64).tobytes() for matrix in matrices)
+        with trace.span('artifact_store/write', 'io') as span, self._lock:
+            span.bytes = len(crop_data) + len(mask_data) + len(matrix_data)
+            self._crop_file.write(crop_data)
+            self._mask_file.write(mask_data)
+            self._matrix_file.write(matrix_data)
+            self._index.append((frame_number, self._count, len(crop_frames)))
+            self._rows[frame_number] = (self._count, len(crop_frames))
+            self._count += len(crop_frames)
+
+
+    def alias(self, frame_number: int, source_frame_number: int) -> None:
+        with self._lock:
+            first_row, face_count = self._rows[source_frame_number]
+            self._index.append((frame_number, first_row, face_count))
+            self._rows[frame_number] = (first_row, face_count)
+            self._aliases.append((frame_number, source_frame_number))
+
+
+    def close(self) -> None:
+        with self._lock:
+            self._crop_file.close()
+            self._mask_file.close()
+            self._matrix_file.close()
+            index = np.array(sorted(self._index), dtype = np.int64).reshape(-1, 3)
+            np.save(os.path.join(self._store_dir, INDEX_FILE), index)
+            if self._aliases:
+                np.save(os.path.join(self._store_dir, ALIAS_FILE), np.array(sorted(self._aliases), dtype = np.int64))
+            with open(os.path.join(self._store_dir, META_FILE), 'w') as meta_file:
+                json.dump({ 'crop_size': list(self._crop_size), 'count': self._count }, meta_file)
+
+
+class ArtifactReader:
+
+    def __init__(self, store_dir: str) -> None:
+        self._store_dir = store_dir
+        with open(os.path.join(store_dir, META_FILE)) as meta_file:
+            meta = json.load(meta_file)
+        crop_width, crop_height = meta['crop_size']
+        count = meta['count']
+        self._crop_frames = _open_memmap(os.path.join(store_dir, CROP_FILE), np.uint8, (count, crop_height, crop_width, 3))
+        self._masks = _open_memmap(os.path.join(store_dir, MASK_FILE), np.uint8, (count, crop_height, crop_width))
+        self._matrices = _open_memmap(os.path.join(store_dir, MATRIX_FILE), np.float64, (count, 2, 3))
+        index = np.load(os.path.join(store_dir, INDEX_FILE))
+        self._rows: Dict[int, Tuple[int, int]] = { int(frame_number): (int(first_row), int(face_count)) for frame_number, first_row, face_count in index }
+        alias_path = os.path.join(store_dir, ALIAS_FILE)
+        aliases = np.load(alias_path) if os.path.isfile(alias_path) else np.empty((0, 2), dtype = np.int64)
+        self._sources: Dict[int, int] = { int(frame_number): int(source_frame_number) for frame_number, source_frame_number in aliases }
+
+
+    def __reduce__(self) -> Tuple[Any, Tuple[str]]:
+        return ArtifactReader, (self._store_dir,)
+
+
+    def read(self, frame_number: int) -> Tuple[type.Frames, type.Mask, type.Matrix]:
+        first_row, face_count = self._rows.get(frame_number, (0, 0))
+        rows = slice(first_row, first_row + face_count)
+        return self._crop_frames[rows], self._masks[rows], self._matrices[rows]
+
+
+    def get_source(self, frame_number: int) -> Optional[int]:
+        return self._sources.get(frame_number)
+
+
+def is_store(store_dir: str) -> bool:
+    return os.path.isfile(os.path.join(store_dir, META_FILE))
+
+
+def _open_memmap(file_path: str, dtype: Any, shape: Tuple[int, ...]) -> np.ndarray:
+    if shape[0] == 0:
+        return np.empty(shape, dtype = dtype)
+    return np.memmap(file_path, dtype = dtype, mode = 'r', shape = shape)
@@ -0,0 +1,115 @@
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from itertools import islice
+import json
+import os
+import socket
+import threading
+import time
+
+import DeepFake.config.type as type
+import DeepFake.config.globals as globals
+import DeepFake.utils.log as log
+
+
+'''
+trial: workers * chunk_size frames of the job, the first chunk is warm-up
+cache: AUTOTUNE_CACHE_PATH, { host|cpus|stage|backend|precision: [workers, chunk_size] }
+'''
+
+
+RunTrial = Callable[[List[Any], int, int], None]
+
+
+_cache_lock = threading.Lock()
+
+
+def tune(process_frames: type.ProcessFrames, frame_items: Iterator[Any], run_trial: RunTrial) -> Tuple[int, int]:
+    cache_key = get_cache_key(process_frames)
+    params = read_cache(cache_key)
+    if params:
+        return params
+    default_workers, default_chunk_size = get_default_params()
+    warmup_items = list(islice(frame_items, default_chunk_size))
+    if not warmup_items:
+        return default_workers, default_chunk_size
+    run_trial(warmup_items, 1, default_chunk_size)
+    budget = [ globals.AUTOTUNE_MAX_FRAMES - len(warmup_items) ]
+    worker_params = search(frame_items, run_trial, prune_candidates([ (workers, default_chunk_size) for workers in get_worker_candidates() ]), budget)
+    if worker_params is None:
+        return default_workers, default_chunk_size
+    chunk_params = search(frame_items, run_trial, prune_candidates([ (worker_params[0], chunk_size) for chunk_size in globals.AUTOTUNE_CHUNK_SIZES ]), budget)
+    if chunk_params is None:
+        return worker_params
+    log.info(f'workers {chunk_params[0]}, chunk size {chunk_params[1]}', __name__.upper())
+    write_cache(cache_key, chunk_params)
+    return chunk_params
+
+
+def search(frame_items: Iterator[Any], run_trial: RunTrial, candidates: List[Tuple[int, int]], budget: List[int]) -> Optional[Tuple[int, int]]:
+    best_params = None
+    best_fps = 0.0
+    for workers, chunk_size in candidates:
+        trial_frame_total = get_trial_frame_total(workers, chunk_size)
+        if trial_frame_total > budget[0]:
+            break
+        trial_items = list(islice(frame_items, trial_frame_total))
+        if not trial_items:
+            return best_params
+        budget[0] -= len(trial_items)
+        start = time.perf_counter()
+        run_trial(trial_items, workers, chunk_size)
+        fps = len(trial_items) / (time.perf_counter() - start)
+        log.debug(f'workers {workers}, chunk size {chunk_size}: {fps:.1f} frame/s', __name__.upper())
+        if fps <= best_fps:
+            break
+        best_params, best_fps = (workers, chunk_size), fps
+    return best_params
+
+
+def prune_candidates(candidates: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    pruned_candidates = [ (workers, chunk_size) for workers, chunk_size in candidates if workers * chunk_size <= globals.AUTOTUNE_MAX_TRIAL_FRAMES ]
+    return pruned_candidates or candidates[:1]
+
+
+def get_trial_frame_total(workers: int, chunk_size: int) -> int:
+    return min(max(globals.AUTOTUNE_TRIAL_FRAMES, workers * chunk_size), globals.AUTOTUNE_MAX_TRIAL_FRAMES)
+
+
+def get_default_params() -> Tuple[int, int]:
+    return 20, globals.STREAM_CHUNK_SIZE
+
+
+def get_worker_candidates() -> List[int]:
+    cpu_count = os.cpu_count() or 1
+    return sorted({ max(1, int(cpu_count * factor)) for factor in globals.AUTOTUNE_WORKER_FACTORS })
+
+
+def get_cache_key(process_frames: type.ProcessFrames) -> str:
+    precision = ','.join(model_type + '=' + model_precision for model_type, model_precision in sorted(globals.MODEL_PRECISION.items()))
+    return '|'.join([ socket.gethostname(), str(os.cpu_count()), process_frames.__module__ + '.' + process_frames.__qualname__, globals.EXECUTION_BACKEND, precision ])
+
+
+def read_cache(cache_key: str) -> Optional[Tuple[int, int]]:
+    params = load_cache().get(cache_key)
+    if params:
+        return params[0], params[1]
+    return None
+
+
+def write_cache(cache_key: str, params: Tuple[int, int]) -> None:
+    with _cache_lock:
+        cache = load_cache()
+        cache[cache_key] = list(params)
+        os.makedirs(os.path.dirname(globals.AUTOTUNE_CACHE_PATH), exist_ok = True)
+        temp_path = globals.AUTOTUNE_CACHE_PATH + '.' + str(os.getpid())
+        with open(temp_path, 'w') as cache_file:
+            json.dump(cache, cache_file, indent = 4)
+        os.replace(temp_path, globals.AUTOTUNE_CACHE_PATH)
+
+
+def load_cache() -> Dict[str, List[int]]:
+    try:
+        with open(globals.AUTOTUNE_CACHE_PATH) as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
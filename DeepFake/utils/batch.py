@@ -0,0 +1,72 @@
+from typing import Any, Callable, List, Optional, Tuple
+from concurrent.futures import Future
+from contextvars import Context, copy_context
+from queue import Queue, Empty
+import threading
+import time
+
+
+RunBatch = Callable[..., List[Any]]
+
+
+class MicroBatcher:
+    '''
+    requests from many threads -> one run_batch(*lists) call once batch_size are pending or timeout passes,
+    one result per request in request order
+    '''
+
+    def __init__(self, run_batch: RunBatch, batch_size: int, timeout: float) -> None:
+        self._run_batch = run_batch
+        self._batch_size = max(1, batch_size)
+        self._timeout = timeout
+        self._requests: Queue[Tuple[Tuple[Any, ...], Future[Any], Context]] = Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+
+    def submit(self, *args: Any) -> Any:
+        future: Future[Any] = Future()
+        self._ensure_worker()
+        self._requests.put((args, future, copy_context()))
+        return future.result()
+
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target = self._loop, daemon = True)
+                self._worker.start()
+
+
+    def _loop(self) -> None:
+        while True:
+            batch = [ self._requests.get() ]
+            deadline = time.monotonic() + self._timeout
+            while len(batch) < self._batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout = remaining))
+                except Empty:
+                    break
+            self._dispatch(batch)
+
+
+    def _dispatch(self, batch: List[Tuple[Tuple[Any, ...], Future[Any], Context]]) -> None:
+        columns = [ list(column) for column in zip(*[ args for args, _, _ in batch ]) ]
+        try:
+            results = batch[0][2].run(self._run_batch, *columns)
+        except Exception as exception:
+            for _, future, _ in batch:
+                future.set_exception(exception)
+            return
+        if len(results) != len(batch):
+            exception = ValueError(f'run_batch returned {len(results)} results for {len(batch)} requests')
+            for _, future, _ in batch:
+                future.set_exception(exception)
+            return
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
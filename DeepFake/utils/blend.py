@@ -0,0 +1,56 @@
+from typing import Tuple
+import threading
+
+import cv2
+import numpy as np
+
+import DeepFake.config.type as type
+
+
+'''
+input
+target_frame: [H, W, 3] uint8, blended in place unless read only
+source_frame: [H, W, 3] uint8
+mask: [H, W] uint8, 255 keeps source
+
+output
+target_frame: [H, W, 3] uint8
+'''
+
+
+_scratch = threading.local()
+
+
+def paste(target_frame: type.Frame, source_frame: type.Frame, mask: type.Mask) -> type.Frame:
+    if not target_frame.flags.writeable:
+        target_frame = target_frame.copy()
+    mask_buffer, source_buffer, target_buffer = _get_scratch(mask.shape[0], mask.shape[1])
+    cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR, dst = mask_buffer)
+    cv2.multiply(source_frame, mask_buffer, dst = source_buffer, dtype = cv2.CV_16U)
+    cv2.bitwise_not(mask_buffer, dst = mask_buffer)
+    cv2.multiply(target_frame, mask_buffer, dst = target_buffer, dtype = cv2.CV_16U)
+    cv2.add(source_buffer, target_buffer, dst = source_buffer)
+    cv2.convertScaleAbs(source_buffer, dst = target_frame, alpha = 1 / 255)
+    return target_frame
+
+
+def paste_float(target_frame: type.Frame, source_frame: type.Frame, mask: type.Mask) -> type.Frame:
+    mask = mask.astype(np.float32) / 255
+    paste_frame = target_frame.copy()
+    paste_frame[:, :, 0] = mask * source_frame[:, :, 0] + (1 - mask) * target_frame[:, :, 0]
+    paste_frame[:, :, 1] = mask * source_frame[:, :, 1] + (1 - mask) * target_frame[:, :, 1]
+    paste_frame[:, :, 2] = mask * source_frame[:, :, 2] + (1 - mask) * target_frame[:, :, 2]
+    target_frame[:] = paste_frame
+    return target_frame
+
+
+def _get_scratch(height: int, width: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    size = height * width * 3
+    if getattr(_scratch, 'size', 0) < size:
+        _scratch.size = size
+        _scratch.mask_buffer = np.empty(size, dtype = np.uint8)
+        _scratch.blend_buffers = np.empty((2, size), dtype = np.uint16)
+    mask_buffer = _scratch.mask_buffer[:size].reshape(height, width, 3)
+    source_buffer = _scratch.blend_buffers[0, :size].reshape(height, width, 3)
+    target_buffer = _scratch.blend_buffers[1, :size].reshape(height, width, 3)
+    return mask_buffer, source_buffer, target_buffer
@@ -3,185 +3,112 @@ from typing import Tuple
 import numpy as np
 
 import DeepFake.config.type as type
-import DeepFake.config.words as words
-import DeepFake.utils.log as log
 
 
 '''
 input
 face_boxes: [N, 4]
-eye_boxes: [N, 4]
-nose_boxes: [N, 4]
-mouth_boxes: [N, 4]
+eye_boxes: [E, 4]
+nose_boxes: [B, 4]
+mouth_boxes: [M, 4]
 
 type.Output
-kps: [N, 5, 2]
+kps: [N, 5, 2], nan for missing points
 '''
 
 
 def run(face_boxes: type.BboxList, eye_boxes: type.BboxList, nose_boxes: type.BboxList, mouth_boxes: type.BboxList) -> type.KpsList:
-    results = []
+    face_boxes = _to_boxes(face_boxes)
     if len(face_boxes) == 0:
-        return results
-    # len(face_boxes) >= 1
-    for face_box in face_boxes:
-        eye_left_point, eye_right_point, nose_point, mouth_left_point, mouth_right_point = None, None, None, None, None
-        # 0 <= len(eye_boxes) <= 2
-        eye_boxes_filtered = _filter_boxes(eye_boxes, face_box, max_items=2)
-        # 0 <= len(nose_boxes) <= 1
-        nose_boxes_filtered = _filter_boxes(nose_boxes, face_box, max_items=1)
-        # 0 <= len(mouth_boxes) <= 1
-        mouth_boxes_filtered = _filter_boxes(mouth_boxes, face_box, max_items=1)
-        # bottom to top, vertical angle
-        face_angle = _calc_face_angle(face_box, eye_boxes_filtered, nose_boxes_filtered, mouth_boxes_filtered)
-        nose_point = _nose_post(nose_boxes_filtered, face_angle)
-        mouth_left_point, mouth_right_point = _mouth_post(mouth_boxes_filtered, face_angle)
-        eye_left_point, eye_right_point = _eye_post(face_box, eye_boxes_filtered, nose_boxes_filtered , mouth_boxes_filtered, face_angle)
-        kps = np.zeros((5, 2))
-        kps[0] = eye_left_point
-        kps[1] = eye_right_point
-        kps[2] = nose_point
-        kps[3] = mouth_left_point
-        kps[4] = mouth_right_point
-        results.append(kps)
-    return results
-
-
-def _filter_boxes(boxes: type.BboxList, face_box: type.Bbox, max_items: int) -> type.BboxList:
-    if len(boxes) == 0:
-        return []
-    x1, y1, x2, y2 = face_box[0], face_box[1], face_box[2], face_box[3]
-    inface_boxes = []
-    for box in boxes:
-        box_cx = (box[0] + box[2]) / 2
-        box_cy = (box[1] + box[3]) / 2
-        if x1 <= box_cx <= x2 and y1 <= box_cy <= y2:
-            inface_boxes.append(box)
-    if len(inface_boxes) > max_items:
-        distances = []
-        face_cx = (x1 + x2) / 2
-        face_cy = (y1 + y2) / 2
-        for box in inface_boxes:
-            box_cx = (box[0] + box[2]) / 2
-            box_cy = (box[1] + box[3]) / 2
-            distance = (box_cx - face_cx) ** 2 + (box_cy - face_cy) ** 2
-            distances.append((distance, box))
-        distances.sort(key=lambda x: x[0]) 
-        filtered_boxes = [box for _, box in distances[:max_items]]
-    else:
-        filtered_boxes = inface_boxes
-    return filtered_boxes
-
-
-def _calc_face_angle(face_box: type.Bbox, eye_boxes: type.BboxList, nose_boxes: type.BboxList, mouth_boxes: type.BboxList) -> type.Angle:
-    eyes_center = None
-    nose_center = None
-    mouth_center = None
-    if len(eye_boxes) == 2:
-        eye_1_center =  [(eye_boxes[0][0] + eye_boxes[0][2]) / 2, (eye_boxes[0][1] + eye_boxes[0][3]) / 2]
-        eye_2_center =  [(eye_boxes[1][0] + eye_boxes[1][2]) / 2, (eye_boxes[1][1] + eye_boxes[1][3]) / 2]
-        eyes_center = [(eye_1_center[0] + eye_2_center[0]) / 2, (eye_1_center[1] + eye_2_center[1]) / 2]
-    if len(nose_boxes) == 1:
-        nose_box = nose_boxes[0]
-        nose_center = [(nose_box[0] + nose_box[2]) / 2, (nose_box[1] + nose_box[3]) / 2]
-    if len(mouth_boxes) == 1:
-        mouth_box = mouth_boxes[0]
-        mouth_center = [(mouth_box[0] + mouth_box[2]) / 2, (mouth_box[1] + mouth_box[3]) / 2]
-    if eyes_center is not None:
-        if nose_center is not None:
-            dx = eyes_center[0] - nose_center[0]
-            dy = eyes_center[1] - nose_center[1]
-            return np.arctan2(dy, dx)
-        if mouth_center is not None:
-            dx = eyes_center[0] - mouth_center[0]
-            dy = eyes_center[1] - mouth_center[1]
-            return np.arctan2(dy, dx)
-        dx = eyes_center[0] - face_box[0]
-        dy = eyes_center[1] - face_box[1]
-        return np.arctan2(dy, dx)
-    if mouth_center is not None:
-        if nose_center is not None:
-            dx = nose_center[0] - mouth_center[0]
-            dy = nose_center[1] - mouth_center[1]
-            return np.arctan2(dy, dx)
-        dx = face_box[0] - mouth_center[0]
-        dy = face_box[1] - mouth_center[1]
-        return np.arctan2(dy, dx)
-    return np.pi / 2
-
-
-def _eye_post(face_box: type.Bbox, eye_boxes: type.BboxList, nose_boxes_filtered: type.BboxList, mouth_boxes_filtered: type.BboxList, face_angle: float) -> Tuple[type.Kp | None, type.Kp | None]:
-    if len(eye_boxes) == 0:
-        return None, None
-    eyes_centers = []
-    for eye in eye_boxes:
-        eye_center = [(eye[0] + eye[2]) / 2, (eye[1] + eye[3]) / 2]
-        eyes_centers.append(eye_center)
-    face_center = [(face_box[0] + face_box[2]) / 2, (face_box[1] + face_box[3]) / 2]
-    if len(eye_boxes) == 1:
-        eye_center = eyes_centers[0]
-        if len(nose_boxes_filtered) == 1:
-            dx = eye_center[0] - nose_boxes_filtered[0][0]
-            dy = eye_center[1] - nose_boxes_filtered[0][1]
-        elif len(mouth_boxes_filtered) == 1:
-            dx = eye_center[0] - mouth_boxes_filtered[0][0]
-            dy = eye_center[1] - mouth_boxes_filtered[0][1]
-        else:
-            dx = eye_center[0] - face_center[0]
-            dy = eye_center[1] - face_center[1]
-        eye_angle = np.arctan2(dy, dx)
-        if eye_angle > face_angle:
-            left_eye_point = eye_center
-            right_eye_point = None
-        else:
-            left_eye_point = None
-            right_eye_point = eye_center
-        return left_eye_point, right_eye_point
-    if len(eye_boxes) == 2:
-        angles = []
-        for eye_center in eyes_centers:
-            if len(mouth_boxes_filtered) == 1:
-                dx = eye_center[0] - mouth_boxes_filtered[0][0]
-                dy = eye_center[1] - mouth_boxes_filtered[0][1]
-            elif len(nose_boxes_filtered) == 1:
-                dx = eye_center[0] - nose_boxes_filtered[0][0]
-                dy = eye_center[1] - nose_boxes_filtered[0][1]
-            else:
-                dx = eye_center[0] - face_center[0]
-                dy = eye_center[1] - face_center[1]
-            angle = np.arctan2(dy, dx)
-            angles.append(angle)
-        if angles[0] < angles[1]:
-            left_eye_point, right_eye_point = eyes_centers
-        else:
-            left_eye_point, right_eye_point = eyes_centers[::-1]
-        return left_eye_point, right_eye_point
-    log.error(words.get('box2point/eye_post'), __name__.upper())
-    raise
-    
-
-def _nose_post(nose_boxes: type.BboxList, face_angle: type.Angle) -> type.Kp | None:
-    if len(nose_boxes) == 0:
-        return None
+        return np.empty((0, 5, 2))
+    eye_boxes, nose_boxes, mouth_boxes = _to_boxes(eye_boxes), _to_boxes(nose_boxes), _to_boxes(mouth_boxes)
+    eye_boxes = _pad_boxes(eye_boxes)[_assign_boxes(eye_boxes, face_boxes, max_items = 2)]
+    nose_boxes = _pad_boxes(nose_boxes)[_assign_boxes(nose_boxes, face_boxes, max_items = 1)[:, 0]]
+    mouth_boxes = _pad_boxes(mouth_boxes)[_assign_boxes(mouth_boxes, face_boxes, max_items = 1)[:, 0]]
+    # bottom to top, vertical angle
+    face_angles = _calc_face_angles(face_boxes, eye_boxes, nose_boxes, mouth_boxes)
+    nose_points = _nose_post(nose_boxes, face_angles)
+    mouth_left_points, mouth_right_points = _mouth_post(mouth_boxes, face_angles)
+    eye_left_points, eye_right_points = _eye_post(face_boxes, eye_boxes, nose_boxes, mouth_boxes, face_angles)
+    return np.stack([ eye_left_points, eye_right_points, nose_points, mouth_left_points, mouth_right_points ], axis = 1)
+
+
+def _to_boxes(boxes: type.BboxList) -> type.BboxList:
+    return np.asarray(boxes, dtype = np.float64).reshape(-1, 4)
+
+
+def _pad_boxes(boxes: type.BboxList) -> type.BboxList:
+    return np.concatenate([ boxes, np.full((1, 4), np.nan) ])
+
+
+def _get_centers(boxes: type.BboxList) -> type.Kps:
+    return (boxes[..., :2] + boxes[..., 2:]) / 2
+
+
+def _assign_boxes(boxes: type.BboxList, face_boxes: type.BboxList, max_items: int) -> np.ndarray:
+    box_total = len(boxes)
+    if box_total == 0:
+        return np.full((len(face_boxes), max_items), box_total)
+    centers = _get_centers(boxes)[np.newaxis]
+    face_boxes = face_boxes[:, np.newaxis]
+    is_inside = np.all((face_boxes[..., :2] <= centers) & (centers <= face_boxes[..., 2:]), axis = 2)
+    distances = np.where(is_inside, np.sum((centers - _get_centers(face_boxes)) ** 2, axis = 2), np.inf)
+    indices = np.argsort(distances, axis = 1, kind = 'stable')[:, :max_items]
+    inside_totals = is_inside.sum(axis = 1, keepdims = True)
+    indices = np.where(np.arange(indices.shape[1]) < inside_totals, indices, box_total)
+    # faces with no more parts than max_items keep detection order, crowded faces keep distance order
+    indices = np.where(inside_totals <= max_items, np.sort(indices, axis = 1), indices)
+    if indices.shape[1] < max_items:
+        indices = np.pad(indices, ((0, 0), (0, max_items - indices.shape[1])), constant_values = box_total)
+    return indices
+
+
+def _calc_face_angles(face_boxes: type.BboxList, eye_boxes: type.BboxList, nose_boxes: type.BboxList, mouth_boxes: type.BboxList) -> np.ndarray:
+    has_eyes = ~np.isnan(eye_boxes[:, :, 0]).any(axis = 1, keepdims = True)
+    has_nose = ~np.isnan(nose_boxes[:, :1])
+    has_mouth = ~np.isnan(mouth_boxes[:, :1])
+    eyes_centers = _get_centers(eye_boxes).mean(axis = 1)
+    nose_centers = _get_centers(nose_boxes)
+    mouth_centers = _get_centers(mouth_boxes)
+    eye_vectors = eyes_centers - np.where(has_nose, nose_centers, np.where(has_mouth, mouth_centers, face_boxes[:, :2]))
+    mouth_vectors = np.where(has_nose, nose_centers, face_boxes[:, :2]) - mouth_centers
+    eye_angles = np.arctan2(eye_vectors[:, 1], eye_vectors[:, 0])
+    mouth_angles = np.arctan2(mouth_vectors[:, 1], mouth_vectors[:, 0])
+    return np.where(has_eyes[:, 0], eye_angles, np.where(has_mouth[:, 0], mouth_angles, np.pi / 2))
+
+
+def _eye_post(face_boxes: type.BboxList, eye_boxes: type.BboxList, nose_boxes: type.BboxList, mouth_boxes: type.BboxList, face_angles: np.ndarray) -> Tuple[type.Kps, type.Kps]:
+    eye_totals = (~np.isnan(eye_boxes[:, :, 0])).sum(axis = 1)[:, np.newaxis]
+    has_nose = ~np.isnan(nose_boxes[:, :1])
+    has_mouth = ~np.isnan(mouth_boxes[:, :1])
+    eye_centers = _get_centers(eye_boxes)
+    face_centers = _get_centers(face_boxes)
+    # one eye measures from the nose box corner first, two eyes from the mouth box corner first
+    single_references = np.where(has_nose, nose_boxes[:, :2], np.where(has_mouth, mouth_boxes[:, :2], face_centers))
+    pair_references = np.where(has_mouth, mouth_boxes[:, :2], np.where(has_nose, nose_boxes[:, :2], face_centers))
+    single_vectors = eye_centers[:, 0] - single_references
+    is_left = np.arctan2(single_vectors[:, 1], single_vectors[:, 0])[:, np.newaxis] > face_angles[:, np.newaxis]
+    pair_vectors = eye_centers - pair_references[:, np.newaxis]
+    pair_angles = np.arctan2(pair_vectors[..., 1], pair_vectors[..., 0])
+    is_ordered = pair_angles[:, :1] < pair_angles[:, 1:]
+    pair_left_points = np.where(is_ordered, eye_centers[:, 0], eye_centers[:, 1])
+    pair_right_points = np.where(is_ordered, eye_centers[:, 1], eye_centers[:, 0])
+    left_points = np.where(eye_totals == 2, pair_left_points, np.where((eye_totals == 1) & is_left, eye_centers[:, 0], np.nan))
+    right_points = np.where(eye_totals == 2, pair_right_points, np.where((eye_totals == 1) & ~is_left, eye_centers[:, 0], np.nan))
+    return left_points, right_points
+
+
+def _nose_post(nose_boxes: type.BboxList, face_angles: np.ndarray) -> type.Kps:
     coef = 0.25
-    nose_box = nose_boxes[0]
-    dx = np.cos(face_angle) * (nose_box[2] - nose_box[0]) / 2
-    dy = np.sin(face_angle) * (nose_box[3] - nose_box[1]) / 2
-    nose_center = [(nose_box[0] + nose_box[2]) / 2, (nose_box[1] + nose_box[3]) / 2]
-    nose_point = np.array([nose_center[0] - dx * coef, nose_center[1] - dy * coef])
-    return nose_point
-
-
-def _mouth_post(mouth_boxes: type.BboxList, face_angle: type.Angle) -> Tuple[type.Kp | None, type.Kp | None]:
-    if len(mouth_boxes) == 0:
-        return None, None
-    mouth_box = mouth_boxes[0]
-    h_angle = face_angle - np.pi / 2
-    mouth_center = [(mouth_box[0] + mouth_box[2]) / 2, (mouth_box[1] + mouth_box[3]) / 2]
-    dx = np.cos(h_angle) * (mouth_box[2] - mouth_box[0]) / 2
-    dy = np.sin(h_angle) * (mouth_box[3] - mouth_box[1]) / 2
-    mouth_left_point = np.array([mouth_center[0] - dx, mouth_center[1] - dy])
-    mouth_right_point = np.array([mouth_center[0] + dx, mouth_center[1] + dy])
-    if h_angle < -np.pi / 2 or h_angle > np.pi / 2:
-        mouth_left_point, mouth_right_point = mouth_right_point, mouth_left_point
-    return mouth_left_point, mouth_right_point
\ No newline at end of file
+    offsets = np.stack([ np.cos(face_angles), np.sin(face_angles) ], axis = 1) * (nose_boxes[:, 2:] - nose_boxes[:, :2]) / 2
+    return _get_centers(nose_boxes) - offsets * coef
+
+
+def _mouth_post(mouth_boxes: type.BboxList, face_angles: np.ndarray) -> Tuple[type.Kps, type.Kps]:
+    h_angles = face_angles - np.pi / 2
+    mouth_centers = _get_centers(mouth_boxes)
+    offsets = np.stack([ np.cos(h_angles), np.sin(h_angles) ], axis = 1) * (mouth_boxes[:, 2:] - mouth_boxes[:, :2]) / 2
+    mouth_left_points = mouth_centers - offsets
+    mouth_right_points = mouth_centers + offsets
+    is_flipped = ((h_angles < -np.pi / 2) | (h_angles > np.pi / 2))[:, np.newaxis]
+    return np.where(is_flipped, mouth_right_points, mouth_left_points), np.where(is_flipped, mouth_left_points, mouth_right_points)
@@ -0,0 +1,98 @@
+from typing import List, Optional
+from collections import OrderedDict
+from functools import lru_cache
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+import DeepFake.config.type as type
+import DeepFake.config.globals as globals
+import DeepFake.utils.inference as inference
+import DeepFake.core.model_zoo.yolox as detector
+
+
+'''
+key: blake2b of every DETECTION_CACHE_STRIDE row and column, the frame shape and the detector config
+memory: DETECTION_CACHE_SIZE most recent kps [N, 5, 2]
+disk: DETECTION_CACHE_DIR/<key>.npy when set
+'''
+
+
+_lock = threading.Lock()
+_entries: OrderedDict[str, type.KpsList] = OrderedDict()
+
+
+def detect(frames: List[type.Frame]) -> List[type.KpsList]:
+    keys = [ get_key(frame) for frame in frames ]
+    kps_lists: List[Optional[type.KpsList]] = [ read(key) for key in keys ]
+    miss_indices = [ index for index, kps_list in enumerate(kps_lists) if kps_list is None ]
+    if miss_indices:
+        for index, kps_list in zip(miss_indices, detector.run_batch([ frames[index] for index in miss_indices ])):
+            kps_lists[index] = write(keys[index], kps_list)
+    return kps_lists # type: ignore
+
+
+def read(key: str) -> Optional[type.KpsList]:
+    with _lock:
+        kps_list = _entries.get(key)
+        if kps_list is not None:
+            _entries.move_to_end(key)
+            return kps_list
+    cache_path = get_cache_path(key)
+    if cache_path and os.path.isfile(cache_path):
+        try:
+            return remember(key, np.load(cache_path))
+        except (OSError, ValueError):
+            return None
+    return None
+
+
+def write(key: str, kps_list: type.KpsList) -> type.KpsList:
+    kps_list = remember(key, np.asarray(kps_list, dtype = np.float64).reshape(-1, 5, 2))
+    cache_path = get_cache_path(key)
+    if cache_path:
+        os.makedirs(globals.DETECTION_CACHE_DIR, exist_ok = True) # type: ignore
+        temp_path = cache_path + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.npy'
+        np.save(temp_path, kps_list)
+        os.replace(temp_path, cache_path)
+    return kps_list
+
+
+def remember(key: str, kps_list: type.KpsList) -> type.KpsList:
+    kps_list.setflags(write = False) # type: ignore
+    with _lock:
+        _entries[key] = kps_list
+        _entries.move_to_end(key)
+        while len(_entries) > globals.DETECTION_CACHE_SIZE:
+            _entries.popitem(last = False)
+    return kps_list
+
+
+def clear() -> None:
+    with _lock:
+        _entries.clear()
+
+
+def get_key(frame: type.Frame) -> str:
+    stride = globals.DETECTION_CACHE_STRIDE
+    frame_hash = hashlib.blake2b(np.ascontiguousarray(frame[::stride, ::stride]).data, digest_size = 16)
+    frame_hash.update(str((frame.shape, frame.dtype.str)).encode())
+    frame_hash.update(get_config_key(detector.MODEL_PATH, globals.MODEL_PRECISION.get('detector', 'fp32')).encode())
+    return frame_hash.hexdigest()
+
+
+@lru_cache(maxsize = None)
+def get_config_key(model_path: str, model_precision: type.ModelPrecision) -> str:
+    # sessions load once per process, the model they loaded is resolved and stat-ed once as well
+    variant_path = inference.get_variant_path(model_path, model_precision)
+    model_path = variant_path if os.path.isfile(variant_path) else model_path
+    model_stat = os.stat(model_path) if os.path.isfile(model_path) else None
+    return '|'.join([ os.path.realpath(model_path), str(model_stat.st_size if model_stat else 0), str(model_stat.st_mtime_ns if model_stat else 0), str(detector.MODEL_SIZE), model_precision ])
+
+
+def get_cache_path(key: str) -> Optional[str]:
+    if globals.DETECTION_CACHE_DIR:
+        return os.path.join(globals.DETECTION_CACHE_DIR, key + '.npy')
+    return None
@@ -0,0 +1,41 @@
+from typing import Optional
+
+import cv2
+import numpy as np
+
+import DeepFake.config.type as type
+import DeepFake.config.globals as globals
+import DeepFake.utils.trace as trace
+
+
+'''
+signature: grayscale [DUPLICATE_SIGNATURE_SIZE] uint8, area averaged
+duplicate: every cell within DUPLICATE_MAX_DIFF of the last computed frame
+'''
+
+
+class DuplicateFilter:
+
+    def __init__(self) -> None:
+        self._signature: Optional[np.ndarray] = None
+        self._frame_number: Optional[int] = None
+
+
+    def check(self, frame_number: int, frame: type.Frame) -> Optional[int]:
+        signature = get_signature(frame)
+        trace.count('duplicate/frames')
+        if self._signature is not None and is_duplicate(self._signature, signature):
+            trace.count('duplicate/skipped_frames')
+            return self._frame_number
+        self._signature = signature
+        self._frame_number = frame_number
+        return None
+
+
+def get_signature(frame: type.Frame) -> np.ndarray:
+    gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    return cv2.resize(gray_frame, globals.DUPLICATE_SIGNATURE_SIZE, interpolation = cv2.INTER_AREA).astype(np.int16)
+
+
+def is_duplicate(signature: np.ndarray, other_signature: np.ndarray) -> bool:
+    return signature.shape == other_signature.shape and int(np.abs(signature - other_signature).max()) <= globals.DUPLICATE_MAX_DIFF
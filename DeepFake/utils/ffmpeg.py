@@ -1,16 +1,28 @@
-from typing import List
+from typing import Callable, Deque, Iterator, List, Optional
+from collections import deque
 import subprocess
+import threading
 import os
 
+import numpy as np
+
 import DeepFake.config.type as type
 import DeepFake.config.globals as globals
+import DeepFake.config.words as words
 import DeepFake.utils.log as log
 import DeepFake.utils.filesystem as filesystem
+import DeepFake.utils.vision as vision
+import DeepFake.utils.trace as trace
 
 
-def run_ffmpeg(args: List[str]) -> bool:
+def get_ffmpeg_commands(args: List[str]) -> List[str]:
 	commands = [ 'ffmpeg', '-hide_banner', '-loglevel', 'error' ]
 	commands.extend(args)
+	return commands
+
+
+def run_ffmpeg(args: List[str]) -> bool:
+	commands = get_ffmpeg_commands(args)
 	try:
 		subprocess.run(commands, stderr = subprocess.PIPE, check = True)
 		return True
@@ -19,15 +31,73 @@ def run_ffmpeg(args: List[str]) -> bool:
 		return False
 
 
+@trace.span('ffmpeg/extract_frames', 'io')
 def extract_frames(video_path: str, video_resolution: str, video_fps: type.Fps) -> bool:
     frame_pattern = filesystem.get_temp_frames_pattern(video_path, '%5d')
     commands = ['-hwaccel', 'auto', '-i', video_path, '-q:v', '2', '-pix_fmt', 'rgb24', '-vf', f'scale={video_resolution}, fps={video_fps}', '-vsync', '0', frame_pattern]
     return run_ffmpeg(commands)
 
 
+def read_frames(video_path: str, video_resolution: str, video_fps: type.Fps) -> Iterator[type.Frame]:
+	width, height = vision.unpack_resolution(video_resolution)
+	frame_size = width * height * 3
+	commands = get_ffmpeg_commands(['-hwaccel', 'auto', '-i', video_path, '-vf', f'scale={video_resolution}, fps={video_fps}', '-vsync', '0', '-f', 'rawvideo', '-pix_fmt', 'bgr24', 'pipe:1'])
+	process = subprocess.Popen(commands, stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+	read_stderr = drain_stderr(process)
+	is_complete = False
+	try:
+		while True:
+			buffer = bytearray(frame_size)
+			with trace.span('ffmpeg/read_frame', 'io') as span:
+				span.bytes = process.stdout.readinto(buffer) # type: ignore
+			if span.bytes < frame_size:
+				is_complete = True
+				break
+			yield np.frombuffer(buffer, dtype = np.uint8).reshape(height, width, 3)
+	finally:
+		process.stdout.close() # type: ignore
+		if not is_complete:
+			process.kill()
+		stderr = read_stderr()
+		if process.wait() != 0 and is_complete:
+			log.debug(stderr, __name__.upper())
+			log.error(words.get('ffmpeg/read_frames'), __name__.upper())
+
+
+def drain_stderr(process: subprocess.Popen) -> Callable[[], str]:
+	# ffmpeg blocks once its stderr pipe is full, a thread keeps reading and holds the last lines for the log
+	lines: Deque[bytes] = deque(maxlen = 64)
+	reader = threading.Thread(target = lines.extend, args = (process.stderr,), daemon = True)
+	reader.start()
+
+	def read_stderr() -> str:
+		reader.join()
+		process.stderr.close() # type: ignore
+		return b''.join(lines).decode(errors = 'replace').strip()
+
+	return read_stderr
+
+
+@trace.span('ffmpeg/merge_video', 'io')
 def merge_video(frames_dir: str, output_path: str, video_fps: type.Fps) -> bool:
 	frames_pattern = os.path.join(frames_dir, '%5d' + globals.FRAME_EXTENSION)
-	commands = [ '-hwaccel', 'auto', '-r', str(video_fps), '-i', frames_pattern, '-c:v', globals.VIDEO_ENCODER ]
+	commands = [ '-hwaccel', 'auto', '-r', str(video_fps), '-i', frames_pattern ]
+	commands.extend(get_encoder_commands())
+	commands.extend([ '-pix_fmt', 'yuv420p', '-colorspace', 'bt709', '-y', output_path ])
+	return run_ffmpeg(commands)
+
+
+def open_video_encoder(output_path: str, video_resolution: str, video_fps: type.Fps, audio_path: Optional[str] = None) -> subprocess.Popen:
+	commands = [ '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', video_resolution, '-r', str(video_fps), '-i', 'pipe:0' ]
+	if audio_path:
+		commands.extend([ '-i', audio_path, '-map', '0:v:0', '-map', '1:a:0?', '-c:a', 'copy', '-shortest' ])
+	commands.extend(get_encoder_commands())
+	commands.extend([ '-pix_fmt', 'yuv420p', '-colorspace', 'bt709', '-y', output_path ])
+	return subprocess.Popen(get_ffmpeg_commands(commands), stdin = subprocess.PIPE, stderr = subprocess.PIPE)
+
+
+def get_encoder_commands() -> List[str]:
+	commands = [ '-c:v', globals.VIDEO_ENCODER ]
 	if globals.VIDEO_ENCODER in [ 'libx264', 'libx265' ]:
 		output_video_compression = round(51 - (globals.VIDEO_QUALITY * 0.51))
 		commands.extend([ '-crf', str(output_video_compression), '-preset', globals.VIDEO_PRESET ])
@@ -37,10 +107,10 @@ def merge_video(frames_dir: str, output_path: str, video_fps: type.Fps) -> bool:
 	if globals.VIDEO_ENCODER in [ 'h264_nvenc', 'hevc_nvenc' ]:
 		output_video_compression = round(51 - (globals.VIDEO_QUALITY * 0.51))
 		commands.extend([ '-cq', str(output_video_compression), '-preset', map_nvenc_preset(globals.VIDEO_PRESET) ])
-	commands.extend([ '-pix_fmt', 'yuv420p', '-colorspace', 'bt709', '-y', output_path ])
-	return run_ffmpeg(commands)
+	return commands
 
 
+@trace.span('ffmpeg/restore_audio', 'io')
 def restore_audio(original_video_path: str, temp_output_path: str, output_path: str) -> bool:
     commands = ['-hwaccel', 'auto', '-i', temp_output_path]
     commands.extend(['-i', original_video_path, '-c', 'copy', '-map', '0:v:0', '-map', '1:a:0', '-shortest', '-y', output_path])
@@ -1,8 +1,11 @@
-from typing import List, Optional
+from typing import Any, Callable, Iterator, List, Optional, Set
+from contextvars import ContextVar
+import contextlib
 import glob
 import os
 import shutil
 import tempfile
+import threading
 from pathlib import Path
 import inspect
 
@@ -16,6 +19,18 @@ TEMP_OUTPUT_VIDEO_NAME = 'temp.mp4'
 TEMP_OUTPUT_IMAGE_NAME = 'temp' + globals.FRAME_EXTENSION
 
 
+'''
+landing: files from expect_files are pending until mark_file, wait_for_file blocks on pending files only
+listener: listen_files receives every path passed to notify_file in the current context
+'''
+
+
+_landing = threading.Condition()
+_pending_files: Set[str] = set()
+_failed_files: Set[str] = set()
+_file_listener: ContextVar[Optional[Callable[[str], Any]]] = ContextVar('file_listener', default = None)
+
+
 def get_save_path(parent_dir: str, dir_name: str, file_path: str, extension: str, idx=None) -> str:
 	name = os.path.basename(file_path).split('.')[0]
 	output_dir = parent_dir + dir_name
@@ -77,6 +92,63 @@ def move_file(target_path: str, output_path: str) -> None:
 		shutil.move(target_path, output_path)
 
 
+def link_file(source_path: str, target_path: str) -> None:
+	if is_file(target_path):
+		os.remove(target_path)
+	try:
+		os.link(source_path, target_path)
+	except OSError:
+		shutil.copyfile(source_path, target_path)
+	notify_file(target_path)
+
+
+def expect_files(file_paths: List[str]) -> None:
+	with _landing:
+		for file_path in file_paths:
+			file_path = os.path.abspath(file_path)
+			_pending_files.add(file_path)
+			_failed_files.discard(file_path)
+
+
+def mark_file(file_path: str, is_landed: bool = True) -> None:
+	file_path = os.path.abspath(file_path)
+	with _landing:
+		_pending_files.discard(file_path)
+		if not is_landed:
+			_failed_files.add(file_path)
+		_landing.notify_all()
+
+
+def wait_for_file(file_path: str) -> bool:
+	file_path = os.path.abspath(file_path)
+	with _landing:
+		_landing.wait_for(lambda: file_path not in _pending_files)
+		return file_path not in _failed_files
+
+
+def list_landing_files(directory_path: str) -> List[str]:
+	absolute_directory_path = os.path.abspath(directory_path)
+	with _landing:
+		file_names = { os.path.basename(file_path) for file_path in _pending_files if os.path.dirname(file_path) == absolute_directory_path }
+	file_names.update(os.path.basename(file_path) for file_path in glob.glob(os.path.join(directory_path, '*')) if not file_path.endswith(globals.PART_EXTENSION))
+	return sorted(os.path.join(directory_path, file_name) for file_name in file_names)
+
+
+@contextlib.contextmanager
+def listen_files(listener: Callable[[str], Any]) -> Iterator[None]:
+	token = _file_listener.set(listener)
+	try:
+		yield
+	finally:
+		_file_listener.reset(token)
+
+
+def notify_file(file_path: str) -> None:
+	listener = _file_listener.get()
+	if listener:
+		listener(file_path)
+
+
 def clear_temp(target_path: str) -> None:
 	temp_directory_path = get_temp_directory_path(target_path)
 	parent_directory_path = os.path.dirname(temp_directory_path)
@@ -0,0 +1,107 @@
+from typing import Dict, Optional
+import contextvars
+import subprocess
+import threading
+
+import numpy as np
+
+import DeepFake.config.type as type
+import DeepFake.config.globals as globals
+import DeepFake.utils.log as log
+import DeepFake.utils.trace as trace
+import DeepFake.utils.ffmpeg as ffmpeg
+
+
+class FrameSink:
+    '''
+    frames in any order from any thread -> encoder stdin in frame number order,
+    writers block once max_pending frames wait, except for the next frame in order
+    '''
+
+    def __init__(self, process: subprocess.Popen, first_frame_number: int = 1, max_pending: Optional[int] = None) -> None:
+        self._process = process
+        self._next_frame_number = first_frame_number
+        self._max_pending = max_pending or globals.FRAME_SINK_MAX_PENDING
+        self._pending: Dict[int, type.Frame] = {}
+        self._condition = threading.Condition()
+        self._is_closed = False
+        self._is_aborted = False
+        self._error: Optional[Exception] = None
+        self._read_stderr = ffmpeg.drain_stderr(process) if process.stderr else lambda: ''
+        self._writer = threading.Thread(target = contextvars.copy_context().run, args = (self._loop,), daemon = True)
+        self._writer.start()
+
+
+    def write(self, frame_number: int, frame: type.Frame, wait: bool = True) -> None:
+        with self._condition:
+            while wait and frame_number != self._next_frame_number and not self.has_capacity():
+                self._condition.wait()
+            if self._is_aborted:
+                return
+            self._pending[frame_number] = frame
+            self._condition.notify_all()
+
+
+    def wait_for_capacity(self) -> None:
+        with self._condition:
+            while not self.has_capacity():
+                self._condition.wait()
+
+
+    def has_capacity(self) -> bool:
+        return len(self._pending) < self._max_pending or self._is_closed
+
+
+    def close(self) -> bool:
+        with self._condition:
+            self._is_closed = True
+            self._condition.notify_all()
+        self._writer.join()
+        self._process.stdin.close() # type: ignore
+        stderr = self._read_stderr()
+        if self._process.wait() != 0 or self._error:
+            log.debug(stderr or str(self._error), __name__.upper())
+            return False
+        return True
+
+
+    def abort(self) -> None:
+        with self._condition:
+            self._is_closed = True
+            self._is_aborted = True
+            self._pending.clear()
+            self._condition.notify_all()
+        self._process.kill()
+        self._writer.join()
+        try:
+            self._process.stdin.close() # type: ignore
+        except OSError:
+            pass
+        self._read_stderr()
+        self._process.wait()
+
+
+    def _loop(self) -> None:
+        while True:
+            with self._condition:
+                while self._next_frame_number not in self._pending and not (self._is_closed and self._pending):
+                    if self._is_closed:
+                        return
+                    self._condition.wait()
+                if self._next_frame_number not in self._pending:
+                    self._next_frame_number = min(self._pending)
+                frame = self._pending.pop(self._next_frame_number)
+                self._next_frame_number += 1
+                self._condition.notify_all()
+            self._write_frame(frame)
+
+
+    def _write_frame(self, frame: type.Frame) -> None:
+        if self._error:
+            return
+        try:
+            with trace.span('frame_sink/write_frame', 'io') as span:
+                span.bytes = frame.nbytes
+                self._process.stdin.write(np.ascontiguousarray(frame).data) # type: ignore
+        except (BrokenPipeError, OSError) as exception:
+            self._error = exception
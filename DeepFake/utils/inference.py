@@ -1,13 +1,23 @@
+import atexit
+import contextlib
+import hashlib
+import os
 import platform
+import queue
 import subprocess
 import threading
-from typing import List
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from functools import lru_cache
 
+import numpy as np
+import onnx
 import onnxruntime
 
 import DeepFake.config.instance as instance
 import DeepFake.config.device as device
 import DeepFake.config.type as type
+import DeepFake.config.globals as globals
 import DeepFake.config.words as words
 import DeepFake.utils.log as log
 
@@ -19,8 +29,96 @@ def thread_lock() -> threading.Lock:
     return threading.Lock()
 
 
-def thread_semaphore() -> threading.Semaphore:
-    return threading.Semaphore()
+class ModelScheduler:
+    '''
+    bounded concurrent runs per model type, slots go round robin over the session replicas
+    '''
+
+    def __init__(self, model_type: type.ModelType) -> None:
+        self._model_type = model_type
+        self._concurrency = max(1, globals.MODEL_CONCURRENCY.get(model_type, 1))
+        self._slots: queue.Queue[onnxruntime.InferenceSession] = queue.Queue()
+        self._replica_total = 0
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._running = 0
+        self._run_count = 0
+        self._wait_time = 0.0
+        self._wait_time_max = 0.0
+        self._run_time = 0.0
+
+
+    @contextlib.contextmanager
+    def schedule(self, sessions: List[onnxruntime.InferenceSession]) -> Iterator[onnxruntime.InferenceSession]:
+        with self._lock:
+            if self._replica_total == 0:
+                for slot_index in range(self._concurrency):
+                    self._slots.put(sessions[slot_index % len(sessions)])
+                self._replica_total = len(sessions)
+            self._waiting += 1
+        start = time.perf_counter()
+        session = self._slots.get()
+        wait_time = time.perf_counter() - start
+        with self._lock:
+            self._waiting -= 1
+            self._running += 1
+            self._wait_time += wait_time
+            self._wait_time_max = max(self._wait_time_max, wait_time)
+        start = time.perf_counter()
+        try:
+            yield session
+        finally:
+            run_time = time.perf_counter() - start
+            self._slots.put(session)
+            with self._lock:
+                self._running -= 1
+                self._run_count += 1
+                self._run_time += run_time
+
+
+    def get_stats(self) -> type.SchedulerStats:
+        with self._lock:
+            run_count = max(self._run_count, 1)
+            return\
+            {
+                'concurrency': self._concurrency,
+                'replicas': self._replica_total,
+                'waiting': self._waiting,
+                'running': self._running,
+                'run_count': self._run_count,
+                'wait_time_mean': self._wait_time / run_count,
+                'wait_time_max': self._wait_time_max,
+                'run_time_mean': self._run_time / run_count
+            }
+
+
+_schedulers: Dict[type.ModelType, ModelScheduler] = {
+    model_type: ModelScheduler(model_type) for model_type in type.ModelType.__args__ # type: ignore
+}
+_batch_support: Dict[type.ModelType, bool] = {}
+
+
+_GRAPH_OPTIMIZATION_LEVELS: Dict[type.GraphOptimizationLevel, onnxruntime.GraphOptimizationLevel] =\
+{
+    'disable': onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+}
+_EXECUTION_MODES: Dict[type.ExecutionMode, onnxruntime.ExecutionMode] =\
+{
+    'sequential': onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    'parallel': onnxruntime.ExecutionMode.ORT_PARALLEL
+}
+_TENSOR_DTYPES: Dict[str, Any] =\
+{
+    'tensor(float)': np.float32,
+    'tensor(float16)': np.float16,
+    'tensor(double)': np.float64,
+    'tensor(int32)': np.int32,
+    'tensor(int64)': np.int64,
+    'tensor(uint8)': np.uint8
+}
 
 
 def _has_nvidia_gpu() -> bool:
@@ -75,21 +173,220 @@ def get_execution_providers() -> List[str]:
 
 
 def get_session(model_path: str, model_type: type.ModelType) -> onnxruntime.InferenceSession:
-    session = instance.get_instance(model_type)
-    if session:
-        return session
+    return get_sessions(model_path, model_type)[0]
+
+
+def get_sessions(model_path: str, model_type: type.ModelType) -> List[onnxruntime.InferenceSession]:
+    sessions = instance.get_instance(model_type)
+    if sessions:
+        return sessions
     with instance._locks[model_type]:
-        session = instance.get_instance(model_type)
-        if session:
-            return session
+        sessions = instance.get_instance(model_type)
+        if sessions:
+            return sessions
+        model_path = resolve_model_path(model_path, model_type)
         execution_providers = get_execution_providers()
-        try:
-            session = onnxruntime.InferenceSession(str(model_path), providers=execution_providers)
-        except:
-            log.error(words.get('inference/get_session'), __name__.upper())
-            session = onnxruntime.InferenceSession(str(model_path), providers=['CPUExecutionProvider'])
-        instance.set_instance(model_type, session)
-        return session
+        if globals.MODEL_DYNAMIC_BATCH.get(model_type):
+            model_path = resolve_batch_path(model_path, execution_providers)
+        sessions = [ _create_session(model_path, model_type, execution_providers, session_options) for session_options in _create_session_options(model_type) ]
+        _batch_support[model_type] = has_dynamic_batch(sessions[0])
+        instance.set_instance(model_type, sessions)
+        return sessions
+
+
+def supports_batch(model_path: str, model_type: type.ModelType) -> bool:
+    get_sessions(model_path, model_type)
+    return _batch_support.get(model_type, False)
+
+
+def resolve_model_path(model_path: str, model_type: type.ModelType) -> str:
+    variant_path = get_variant_path(model_path, globals.MODEL_PRECISION.get(model_type, 'fp32'))
+    if variant_path == model_path or os.path.isfile(variant_path):
+        return variant_path
+    log.warn(words.get('inference/resolve_model_path'), __name__.upper())
+    return model_path
+
+
+def get_variant_path(model_path: str, model_precision: type.ModelPrecision) -> str:
+    if model_precision == 'fp32':
+        return model_path
+    return os.path.splitext(model_path)[0] + '.' + model_precision + '.onnx'
+
+
+def resolve_batch_path(model_path: str, execution_providers: List[str]) -> str:
+    batch_path = _get_batch_path(model_path)
+    if batch_path is None or os.path.isfile(batch_path + '.fixed'):
+        return model_path
+    if os.path.isfile(batch_path):
+        return batch_path
+    model = onnx.load(model_path)
+    if not _set_batch_dim(model):
+        return model_path
+    os.makedirs(os.path.dirname(batch_path), exist_ok = True)
+    temp_path = batch_path + '.' + str(os.getpid())
+    onnx.save(model, temp_path)
+    if not _probe_batch(temp_path, execution_providers):
+        # remembered so the next start does not load and probe the model again
+        os.remove(temp_path)
+        open(batch_path + '.fixed', 'w').close()
+        log.warn(words.get('inference/resolve_batch_path'), __name__.upper())
+        return model_path
+    os.replace(temp_path, batch_path)
+    return batch_path
+
+
+@contextlib.contextmanager
+def acquire_session(model_path: str, model_type: type.ModelType) -> Iterator[onnxruntime.InferenceSession]:
+    sessions = get_sessions(model_path, model_type)
+    with _schedulers[model_type].schedule(sessions) as session:
+        yield session
+
+
+def run_session(session: onnxruntime.InferenceSession, model_type: type.ModelType, inputs: Dict[str, np.ndarray]) -> List[np.ndarray]:
+    # outputs are owned by the caller, nothing returned here is reused by a later run
+    if not get_session_profile(model_type)['use_io_binding']:
+        return session.run(None, inputs)
+    io_binding = session.io_binding()
+    for input_name, input_value in inputs.items():
+        io_binding.bind_cpu_input(input_name, np.ascontiguousarray(input_value))
+    for output_name in get_output_names(session):
+        io_binding.bind_output(output_name, 'cpu')
+    session.run_with_iobinding(io_binding)
+    return io_binding.copy_outputs_to_cpu()
+
+
+def get_session_profile(model_type: type.ModelType) -> type.SessionProfile:
+    return globals.SESSION_PROFILES[globals.MODEL_SESSION_PROFILE.get(model_type, 'default')]
+
+
+def get_scheduler_stats() -> Dict[type.ModelType, type.SchedulerStats]:
+    return { model_type: scheduler.get_stats() for model_type, scheduler in _schedulers.items() }
+
+
+def log_scheduler_stats() -> None:
+    for model_type, stats in get_scheduler_stats().items():
+        if stats['run_count'] == 0:
+            continue
+        log.info(f"{model_type}: runs {stats['run_count']}, waiting {stats['waiting']}, wait mean {stats['wait_time_mean'] * 1000:.1f}ms, wait max {stats['wait_time_max'] * 1000:.1f}ms, run mean {stats['run_time_mean'] * 1000:.1f}ms", __name__.upper())
+
+
+def end_profiling() -> None:
+    if not globals.SESSION_PROFILING:
+        return
+    for model_type in _schedulers:
+        for session in instance.get_instance(model_type) or []:
+            log.info(model_type + ': ' + session.end_profiling(), __name__.upper())
+
+
+def _create_session(model_path: str, model_type: type.ModelType, execution_providers: List[str], session_options: onnxruntime.SessionOptions) -> onnxruntime.InferenceSession:
+    cache_path = _get_cache_path(model_path, model_type, execution_providers)
+    if cache_path and os.path.isfile(cache_path):
+        model_path = cache_path
+        session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
+    elif cache_path:
+        os.makedirs(os.path.dirname(cache_path), exist_ok = True)
+        session_options.optimized_model_filepath = cache_path + '.' + str(os.getpid())
+    try:
+        session = onnxruntime.InferenceSession(str(model_path), sess_options=session_options, providers=execution_providers)
+    except:
+        log.error(words.get('inference/get_session'), __name__.upper())
+        session = onnxruntime.InferenceSession(str(model_path), sess_options=session_options, providers=['CPUExecutionProvider'])
+    if session_options.optimized_model_filepath and os.path.isfile(session_options.optimized_model_filepath):
+        os.replace(session_options.optimized_model_filepath, cache_path)
+    return session
+
+
+def _create_session_options(model_type: type.ModelType) -> List[onnxruntime.SessionOptions]:
+    profile = get_session_profile(model_type)
+    replica_total = max(1, globals.MODEL_REPLICAS.get(model_type, 1))
+    cores = _get_cores()
+    core_total = max(1, len(cores) // replica_total)
+    session_options_list = []
+    for replica_index in range(replica_total):
+        replica_cores = cores[replica_index * core_total:(replica_index + 1) * core_total] or cores[-core_total:]
+        session_options = onnxruntime.SessionOptions()
+        session_options.graph_optimization_level = _GRAPH_OPTIMIZATION_LEVELS[profile['graph_optimization_level']]
+        session_options.execution_mode = _EXECUTION_MODES[profile['execution_mode']]
+        session_options.enable_cpu_mem_arena = profile['enable_cpu_mem_arena']
+        session_options.enable_mem_pattern = profile['enable_mem_pattern']
+        session_options.intra_op_num_threads = profile['intra_op_threads']
+        session_options.inter_op_num_threads = profile['inter_op_threads']
+        if profile['partition_threads']:
+            session_options.intra_op_num_threads = max(1, len(replica_cores) // max(1, globals.MODEL_CONCURRENCY.get(model_type, 1)))
+        if replica_total > 1 or globals.MODEL_PIN_CORES:
+            session_options.intra_op_num_threads = len(replica_cores)
+            session_options.inter_op_num_threads = 1
+        if globals.MODEL_PIN_CORES and len(replica_cores) > 1:
+            session_options.add_session_config_entry('session.intra_op_thread_affinities', ';'.join(str(core + 1) for core in replica_cores[1:]))
+        if globals.SESSION_PROFILING:
+            os.makedirs(globals.SESSION_PROFILE_DIR, exist_ok = True)
+            session_options.enable_profiling = True
+            session_options.profile_file_prefix = os.path.join(globals.SESSION_PROFILE_DIR, model_type + '_' + str(replica_index))
+        session_options_list.append(session_options)
+    return session_options_list
+
+
+def _get_cache_path(model_path: str, model_type: type.ModelType, execution_providers: List[str]) -> Optional[str]:
+    profile = get_session_profile(model_type)
+    if not profile['cache_optimized_model'] or execution_providers[0] != 'CPUExecutionProvider' or not os.path.isfile(model_path):
+        return None
+    model_stat = os.stat(model_path)
+    model_name = os.path.splitext(os.path.basename(model_path))[0]
+    cache_name = '_'.join([ model_name, profile['graph_optimization_level'], str(model_stat.st_size), str(model_stat.st_mtime_ns), onnxruntime.__version__, _get_host_key(tuple(execution_providers)) ]) + '.onnx'
+    return os.path.join(globals.SESSION_CACHE_DIR, cache_name)
+
+
+def _get_batch_path(model_path: str) -> Optional[str]:
+    if not os.path.isfile(model_path):
+        return None
+    model_stat = os.stat(model_path)
+    model_name = os.path.splitext(os.path.basename(model_path))[0]
+    batch_name = '_'.join([ model_name, str(model_stat.st_size), str(model_stat.st_mtime_ns) ]) + '.batch.onnx'
+    return os.path.join(globals.SESSION_CACHE_DIR, batch_name)
+
+
+def _set_batch_dim(model: onnx.ModelProto) -> bool:
+    # a fixed batch of 1 on the graph inputs and outputs becomes a symbolic dim, inner shapes are inferred again
+    initializer_names = { initializer.name for initializer in model.graph.initializer }
+    is_rewritten = False
+    for value in list(model.graph.input) + list(model.graph.output):
+        dims = value.type.tensor_type.shape.dim
+        if value.name not in initializer_names and len(dims) > 0 and dims[0].HasField('dim_value') and dims[0].dim_value == 1:
+            dims[0].dim_param = 'batch'
+            is_rewritten = True
+    del model.graph.value_info[:]
+    return is_rewritten
+
+
+def _probe_batch(model_path: str, execution_providers: List[str]) -> bool:
+    # graphs that reshape to a constant batch still load, only a run with two rows shows it
+    session_options = onnxruntime.SessionOptions()
+    session_options.log_severity_level = 4
+    try:
+        session = onnxruntime.InferenceSession(model_path, sess_options = session_options, providers = execution_providers)
+        inputs = { input.name: np.zeros([ 2 ] + [ dim if isinstance(dim, int) else 1 for dim in input.shape[1:] ], dtype = _TENSOR_DTYPES.get(input.type, np.float32)) for input in session.get_inputs() }
+        outputs = session.run(None, inputs)
+    except Exception:
+        return False
+    return all(output.shape[0] == 2 for output, output_info in zip(outputs, session.get_outputs()) if len(output_info.shape) > 0 and output_info.shape[0] == 'batch')
+
+
+@lru_cache(maxsize = None)
+def _get_host_key(execution_providers: Tuple[str, ...]) -> str:
+    # graphs optimized at 'extended' or 'all' carry kernels chosen for this cpu
+    cpu_flags = ''
+    if os.path.isfile('/proc/cpuinfo'):
+        with open('/proc/cpuinfo') as cpuinfo_file:
+            cpu_flags = next((line for line in cpuinfo_file if line.startswith(('flags', 'Features'))), '')
+    host_key = '|'.join([ platform.machine(), platform.processor(), cpu_flags.strip(), ','.join(execution_providers) ])
+    return hashlib.sha256(host_key.encode()).hexdigest()[:12]
+
+
+def _get_cores() -> List[int]:
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
 
 def get_input_names(session: onnxruntime.InferenceSession) -> List[str]:
     return [input.name for input in session.get_inputs()]
@@ -104,4 +401,12 @@ def get_input_shape(session: onnxruntime.InferenceSession) -> List[List[int]]:
 
 
 def get_output_shape(session: onnxruntime.InferenceSession) -> List[List[int]]:
-    return [output.shape for output in session.get_outputs()]
\ No newline at end of file
+    return [output.shape for output in session.get_outputs()]
+
+
+def has_dynamic_batch(session: onnxruntime.InferenceSession) -> bool:
+    input_shapes = get_input_shape(session)
+    return all(len(shape) > 0 and not isinstance(shape[0], int) for shape in input_shapes)
+
+
+atexit.register(end_profiling)
@@ -0,0 +1,189 @@
+from typing import Any, Callable, Coroutine, Deque, Dict, List, Optional, Tuple
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+import asyncio
+import threading
+import time
+import uuid
+
+import DeepFake.config.type as type
+import DeepFake.config.globals as globals
+import DeepFake.config.words as words
+import DeepFake.utils.log as log
+
+
+'''
+queues: { user: deque[Job] }, workers take the oldest job of the next user in turn
+workers: JOB_CONCURRENCY asyncio tasks, frame work runs in threads
+cancel: queued jobs are dropped, running jobs stop at the next raise_if_cancelled
+'''
+
+
+JobRun = Callable[..., Coroutine[Any, Any, Any]]
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+
+    def __init__(self, user: str, kind: str, run: JobRun, args: Tuple[Any, ...]) -> None:
+        self.job_id = uuid.uuid4().hex
+        self.user = user
+        self.kind = kind
+        self.run = run
+        self.args = args
+        self.status: type.JobStatus = 'queued'
+        self.stage: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._frame_count = 0
+        self._frame_total = 0
+        self._lock = threading.Lock()
+        self._cancel_event = threading.Event()
+
+
+    def start_stage(self, stage: str, frame_total: int) -> None:
+        with self._lock:
+            self.stage = stage
+            self._frame_total += frame_total
+
+
+    def update(self, frame_count: int = 1) -> None:
+        with self._lock:
+            self._frame_count += frame_count
+
+
+    def cancel(self) -> None:
+        self._cancel_event.set()
+        if self.status == 'running':
+            self.status = 'cancelling'
+
+
+    def is_cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+
+    def finish(self, status: type.JobStatus, error: Optional[str] = None) -> None:
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+
+
+    def to_dict(self) -> type.JobInfo:
+        with self._lock:
+            frame_count, frame_total = self._frame_count, self._frame_total
+        return\
+        {
+            'job_id': self.job_id,
+            'user': self.user,
+            'kind': self.kind,
+            'status': self.status,
+            'stage': self.stage,
+            'frame_count': frame_count,
+            'frame_total': frame_total,
+            'progress': min(frame_count / frame_total, 1.0) if frame_total else 0.0,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+
+_job: ContextVar[Optional[Job]] = ContextVar('job_queue_job', default = None)
+_queues: OrderedDict[str, Deque[Job]] = OrderedDict()
+_jobs: OrderedDict[str, Job] = OrderedDict()
+_running_total = 0
+_condition: Optional[asyncio.Condition] = None
+_workers: List[asyncio.Task] = []
+
+
+def start(concurrency: Optional[int] = None) -> None:
+    global _condition
+    if _condition is None:
+        _condition = asyncio.Condition()
+        for _ in range(concurrency or globals.JOB_CONCURRENCY):
+            _workers.append(asyncio.create_task(work()))
+
+
+async def submit(user: str, kind: str, run: JobRun, *args: Any) -> Job:
+    start()
+    job = Job(user, kind, run, args)
+    async with _condition: # type: ignore
+        _jobs[job.job_id] = job
+        _queues.setdefault(user, deque()).append(job)
+        forget_jobs()
+        _condition.notify() # type: ignore
+    return job
+
+
+def get_job(job_id: str) -> Optional[Job]:
+    return _jobs.get(job_id)
+
+
+def cancel(job_id: str) -> Optional[Job]:
+    job = _jobs.get(job_id)
+    if job is None:
+        return None
+    if job.status == 'queued':
+        _queues[job.user].remove(job)
+        if not _queues[job.user]:
+            del _queues[job.user]
+        job.finish('cancelled')
+    job.cancel()
+    return job
+
+
+def get_stats() -> Dict[str, int]:
+    return { 'queued': sum(len(queue) for queue in _queues.values()), 'running': _running_total, 'concurrency': len(_workers) }
+
+
+def get_current_job() -> Optional[Job]:
+    return _job.get()
+
+
+def raise_if_cancelled() -> None:
+    job = _job.get()
+    if job and job.is_cancelled():
+        raise JobCancelled(job.job_id)
+
+
+async def work() -> None:
+    global _running_total
+    while True:
+        async with _condition: # type: ignore
+            await _condition.wait_for(lambda: bool(_queues)) # type: ignore
+            job = pop_job()
+        _running_total += 1
+        job.status = 'running'
+        job.started_at = time.time()
+        token = _job.set(job)
+        try:
+            await job.run(*job.args)
+            job.finish('cancelled' if job.is_cancelled() else 'succeeded')
+        except JobCancelled:
+            job.finish('cancelled')
+        except Exception as exception:
+            log.error(words.get('job_queue/run') + ' ' + job.job_id + ': ' + repr(exception), __name__.upper())
+            job.finish('failed', repr(exception))
+        finally:
+            _job.reset(token)
+            _running_total -= 1
+
+
+def pop_job() -> Job:
+    user, queue = next(iter(_queues.items()))
+    job = queue.popleft()
+    del _queues[user]
+    if queue:
+        _queues[user] = queue
+    return job
+
+
+def forget_jobs() -> None:
+    finished_jobs = [ job_id for job_id, job in _jobs.items() if job.finished_at is not None ]
+    for job_id in finished_jobs[:max(len(finished_jobs) - globals.JOB_HISTORY_SIZE, 0)]:
+        del _jobs[job_id]
@@ -0,0 +1,165 @@
+from typing import Deque, Dict, List, Optional, Tuple
+from collections import deque
+from itertools import count
+import threading
+import time
+
+import psutil
+
+import DeepFake.config.type as type
+import DeepFake.config.globals as globals
+import DeepFake.utils.inference as inference
+
+
+'''
+samples: last METRICS_WINDOW SystemResources, one every METRICS_INTERVAL seconds
+render: prometheus text exposition of the samples and job frame totals
+'''
+
+
+class JobMeter:
+
+    def __init__(self, stage: str) -> None:
+        self.job_id = next(_job_ids)
+        self.stage = stage
+        self._started_at = time.monotonic()
+        self._frame_count = 0
+        self._lock = threading.Lock()
+        self._samples: Deque[Tuple[float, int]] = deque(maxlen = globals.METRICS_WINDOW)
+
+
+    def update(self, frame_count: int = 1) -> None:
+        with self._lock:
+            self._frame_count += frame_count
+        with _lock:
+            _frame_totals[self.stage] = _frame_totals.get(self.stage, 0) + frame_count
+
+
+    def sample(self, timestamp: float) -> None:
+        with self._lock:
+            self._samples.append((timestamp, self._frame_count))
+
+
+    def get_fps(self) -> float:
+        with self._lock:
+            first_time, first_count = self._samples[0] if self._samples else (self._started_at, 0)
+            last_time, last_count = time.monotonic(), self._frame_count
+        if last_time <= first_time:
+            return 0.0
+        return (last_count - first_count) / (last_time - first_time)
+
+
+_lock = threading.Lock()
+_samples: Deque[type.SystemResources] = deque(maxlen = globals.METRICS_WINDOW)
+_jobs: Dict[int, JobMeter] = {}
+_frame_totals: Dict[str, int] = {}
+_job_ids = count()
+_sampler: Optional[threading.Thread] = None
+
+
+def start() -> None:
+    global _sampler
+    with _lock:
+        if _sampler is None:
+            _sampler = threading.Thread(target = sample_loop, daemon = True)
+            _sampler.start()
+
+
+def sample_loop() -> None:
+    psutil.cpu_percent(interval = None)
+    disk = psutil.disk_io_counters()
+    last_time = time.monotonic()
+    while True:
+        time.sleep(globals.METRICS_INTERVAL)
+        timestamp = time.monotonic()
+        next_disk = psutil.disk_io_counters()
+        resources = create_resources(psutil.cpu_percent(interval = None), disk, next_disk, timestamp - last_time)
+        with _lock:
+            _samples.append(resources)
+            jobs = list(_jobs.values())
+        for job in jobs:
+            job.sample(timestamp)
+        disk, last_time = next_disk, timestamp
+
+
+def create_resources(cpu_usage: float, disk: Optional[psutil._common.sdiskio], next_disk: Optional[psutil._common.sdiskio], elapsed: float) -> type.SystemResources:
+    memory = psutil.virtual_memory()
+    disk_read_rate = 0.0
+    disk_write_rate = 0.0
+    io_usage = 0.0
+    if disk and next_disk and elapsed > 0:
+        disk_read_rate = (next_disk.read_bytes - disk.read_bytes) / elapsed
+        disk_write_rate = (next_disk.write_bytes - disk.write_bytes) / elapsed
+        # busy_time is linux only, read and write time overlap on parallel devices
+        if hasattr(next_disk, 'busy_time'):
+            busy_time = next_disk.busy_time - disk.busy_time # type: ignore
+        else:
+            busy_time = next_disk.read_time + next_disk.write_time - disk.read_time - disk.write_time
+        io_usage = min(100.0, busy_time / (elapsed * 1000) * 100)
+    return\
+    {
+        'cpu_count': psutil.cpu_count(logical = True),
+        'memory_total': memory.total / (1024 ** 3),
+        'memory_available': memory.available / (1024 ** 3),
+        'cpu_usage': cpu_usage,
+        'memory_usage': memory.percent,
+        'io_usage': io_usage,
+        'disk_read_rate': disk_read_rate,
+        'disk_write_rate': disk_write_rate
+    }
+
+
+def get_system_resources() -> type.SystemResources:
+    start()
+    with _lock:
+        samples = list(_samples)
+    if not samples:
+        return create_resources(psutil.cpu_percent(interval = None), None, None, 0.0)
+    resources = samples[-1].copy()
+    for key in [ 'cpu_usage', 'io_usage', 'disk_read_rate', 'disk_write_rate' ]:
+        resources[key] = sum(sample[key] for sample in samples) / len(samples) # type: ignore
+    return resources
+
+
+def start_job(stage: str) -> JobMeter:
+    start()
+    job = JobMeter(stage)
+    with _lock:
+        _jobs[job.job_id] = job
+    return job
+
+
+def finish_job(job: JobMeter) -> None:
+    with _lock:
+        _jobs.pop(job.job_id, None)
+
+
+def render() -> str:
+    resources = get_system_resources()
+    with _lock:
+        jobs = list(_jobs.values())
+        frame_totals = dict(_frame_totals)
+    lines: List[str] = []
+    add_metric(lines, 'df_cpu_usage_percent', 'gauge', 'cpu usage averaged over the sample window', [ ('', resources['cpu_usage']) ])
+    add_metric(lines, 'df_memory_usage_percent', 'gauge', 'memory usage', [ ('', resources['memory_usage']) ])
+    add_metric(lines, 'df_memory_available_bytes', 'gauge', 'available memory', [ ('', resources['memory_available'] * 1024 ** 3) ])
+    add_metric(lines, 'df_disk_busy_percent', 'gauge', 'disk busy time averaged over the sample window', [ ('', resources['io_usage']) ])
+    add_metric(lines, 'df_disk_read_bytes_per_second', 'gauge', 'disk reads averaged over the sample window', [ ('', resources['disk_read_rate']) ])
+    add_metric(lines, 'df_disk_write_bytes_per_second', 'gauge', 'disk writes averaged over the sample window', [ ('', resources['disk_write_rate']) ])
+    add_metric(lines, 'df_jobs_active', 'gauge', 'running frame jobs', [ ('', len(jobs)) ])
+    add_metric(lines, 'df_job_frames_per_second', 'gauge', 'frames/s of each running job over the sample window', [ (f'job="{job.job_id}",stage="{job.stage}"', job.get_fps()) for job in jobs ])
+    add_metric(lines, 'df_frames_total', 'counter', 'frames processed per stage', [ (f'stage="{stage}"', frame_total) for stage, frame_total in frame_totals.items() ])
+    scheduler_stats = inference.get_scheduler_stats()
+    add_metric(lines, 'df_model_queue_depth', 'gauge', 'callers waiting for a model session', [ (f'model="{model_type}"', stats['waiting']) for model_type, stats in scheduler_stats.items() ])
+    add_metric(lines, 'df_model_running', 'gauge', 'model runs in flight', [ (f'model="{model_type}"', stats['running']) for model_type, stats in scheduler_stats.items() ])
+    add_metric(lines, 'df_model_runs_total', 'counter', 'model runs', [ (f'model="{model_type}"', stats['run_count']) for model_type, stats in scheduler_stats.items() ])
+    add_metric(lines, 'df_model_wait_seconds', 'gauge', 'mean wait for a model session', [ (f'model="{model_type}"', stats['wait_time_mean']) for model_type, stats in scheduler_stats.items() ])
+    add_metric(lines, 'df_model_run_seconds', 'gauge', 'mean model run time', [ (f'model="{model_type}"', stats['run_time_mean']) for model_type, stats in scheduler_stats.items() ])
+    return '\n'.join(lines) + '\n'
+
+
+def add_metric(lines: List[str], name: str, metric_type: str, description: str, values: List[Tuple[str, float]]) -> None:
+    lines.append(f'# HELP {name} {description}')
+    lines.append(f'# TYPE {name} {metric_type}')
+    for labels, value in values:
+        lines.append(f'{name}{{{labels}}} {value}' if labels else f'{name} {value}')
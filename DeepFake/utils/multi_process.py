@@ -1,32 +1,344 @@
-from typing import List, Dict, Any, Tuple
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Tuple, Iterable, Iterator, Optional, Callable
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from queue import Queue
 from logging import INFO
+from itertools import chain, count, islice
+import contextlib
+import contextvars
+import multiprocessing
+import os
+import pickle
+import threading
 
-import psutil
+import cv2
+import numpy as np
 from tqdm import tqdm
 
 import DeepFake.config.type as type
+import DeepFake.config.globals as globals
+import DeepFake.config.words as words
+import DeepFake.utils.log as log
+import DeepFake.utils.shared_frame as shared_frame
+import DeepFake.utils.autotune as autotune
+import DeepFake.utils.metrics as metrics
+import DeepFake.utils.job_queue as job_queue
+import DeepFake.utils.trace as trace
+import DeepFake.utils.frame_sink as frame_sink
+import DeepFake.utils.artifact_store as artifact_store
 
 
-def run(process_frames: type.ProcessFrames, frame_paths: List[str], *args: str) -> None:
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_worker_total = 0
+_process_pool_lock = threading.Lock()
+_progress_queue: Any = None
+_progress_listeners: Dict[int, Tuple[Callable[[int], Any], threading.Event]] = {}
+_run_ids = count()
+_worker_initializers: List[Tuple[Callable[..., Any], Tuple[Any, ...]]] = []
+
+
+def run(process_frames: type.ProcessFrames, frame_paths: List[str], *args: Any, chunk_size: Optional[int] = None) -> None:
+    if globals.AUTOTUNE or globals.EXECUTION_BACKEND == 'process':
+        return run_stream(process_frames, frame_paths, len(frame_paths), *args, chunk_size = chunk_size)
     # thread, queue = calculate_optimal_params(len(frame_paths))
     thread = 20
     queue = 1
-    with tqdm(total = len(frame_paths), desc = 'processing', unit = 'frame', ascii = ' =', disable = INFO in [ 'warn', 'error' ]) as progress:
+    with open_progress(process_frames, len(frame_paths)) as (progress, update_progress):
         progress.set_postfix(get_progress_info(thread, queue))
         with ThreadPoolExecutor(max_workers = thread) as executor:
             futures = []
             queue_frame_paths: Queue[str] = create_queue(frame_paths)
-            queue_per_future = int(max(len(frame_paths) // thread * queue, 1))
+            queue_per_future = chunk_size or int(max(len(frame_paths) // thread * queue, 1))
             while not queue_frame_paths.empty():
+                job_queue.raise_if_cancelled()
                 submit_frame_paths = pick_queue(queue_frame_paths, queue_per_future)
-                future = executor.submit(process_frames, progress.update, submit_frame_paths, *args)
+                future = executor.submit(contextvars.copy_context().run, process_frames, update_progress, submit_frame_paths, *args)
                 futures.append(future)
             for future_done in as_completed(futures):
                 future_done.result()
 
 
+def run_stream(process_frames: type.ProcessFrames, frame_items: Iterable[Any], frame_total: int, *args: Any, frame_shape: Optional[Tuple[int, ...]] = None, chunk_size: Optional[int] = None) -> None:
+    if globals.EXECUTION_BACKEND == 'process' and can_run_process(args):
+        return run_process(process_frames, frame_items, frame_total, *args, frame_shape = frame_shape, chunk_size = chunk_size)
+    frame_items = iter(frame_items)
+    fixed_chunk_size = chunk_size
+    thread, chunk_size = autotune.get_default_params()
+    with open_progress(process_frames, frame_total) as (progress, update_progress):
+        if globals.AUTOTUNE:
+            thread, chunk_size = autotune.tune(process_frames, frame_items, lambda trial_items, trial_thread, trial_chunk_size: run_chunks(process_frames, trial_items, update_progress, trial_thread, fixed_chunk_size or trial_chunk_size, *args))
+        chunk_size = fixed_chunk_size or chunk_size
+        progress.set_postfix(get_progress_info(thread, chunk_size))
+        run_chunks(process_frames, frame_items, update_progress, thread, chunk_size, *args)
+
+
+def run_chunks(process_frames: type.ProcessFrames, frame_items: Iterable[Any], update_progress: type.UpdateProcess, thread: int, chunk_size: int, *args: Any) -> None:
+    window = threading.BoundedSemaphore(thread * globals.STREAM_WINDOW_PER_THREAD)
+    with ThreadPoolExecutor(max_workers = thread) as executor:
+        futures = []
+        try:
+            for chunk_items in pick_chunks(frame_items, chunk_size):
+                job_queue.raise_if_cancelled()
+                window.acquire()
+                future = executor.submit(contextvars.copy_context().run, process_frames, update_progress, chunk_items, *args)
+                future.add_done_callback(lambda _: window.release())
+                futures.append(future)
+                futures = raise_failed(futures)
+            for future_done in as_completed(futures):
+                future_done.result()
+        except BaseException:
+            # frames of the failed chunk never arrive, release the workers waiting on the sink before the pool joins them
+            abort_sinks(args)
+            raise
+
+
+def run_process(process_frames: type.ProcessFrames, frame_items: Iterable[Any], frame_total: int, *args: Any, frame_shape: Optional[Tuple[int, ...]] = None, chunk_size: Optional[int] = None) -> None:
+    executor, worker_total = get_process_pool()
+    chunk_size = chunk_size or globals.STREAM_CHUNK_SIZE
+    chunks = pick_chunks(frame_items, chunk_size)
+    first_chunk = next(chunks, None)
+    if first_chunk is None:
+        return
+    frame_shape = frame_shape or shared_frame.get_frame_shape(first_chunk[0])
+    pool = create_frame_pool(frame_shape, worker_total, chunk_size)
+    window_total = worker_total * globals.STREAM_WINDOW_PER_THREAD
+    window = threading.BoundedSemaphore(window_total)
+    sinks = [ arg for arg in args if isinstance(arg, frame_sink.FrameSink) ]
+    writers = [ arg for arg in args if isinstance(arg, artifact_store.ArtifactWriter) ]
+    process_args = [ pack_arg(arg) for arg in args ]
+    trace_job = trace.get_job()
+    errors: List[BaseException] = []
+    with open_progress(process_frames, frame_total) as (progress, update_progress):
+        progress.set_postfix(get_progress_info(worker_total, chunk_size))
+        run_id = listen_progress(update_progress)
+        futures = []
+        try:
+            for chunk_items in chain([ first_chunk ], chunks):
+                job_queue.raise_if_cancelled()
+                for sink in sinks:
+                    sink.wait_for_capacity()
+                window.acquire()
+                slots = pool.acquire(len(chunk_items)) if pool else []
+                packed_items = [ shared_frame.pack_item(pool, slot, item) for slot, item in zip(slots, chunk_items) ] if pool else chunk_items
+                try:
+                    future = executor.submit(run_chunk, run_id, process_frames, pool.name if pool else None, pool.slot_size if pool else 0, slots, packed_items, process_args, trace_job is not None)
+                except BaseException:
+                    if pool:
+                        pool.release(slots)
+                    window.release()
+                    raise
+                future.add_done_callback(lambda future, slots = slots: finish_chunk(future, pool, slots, sinks, writers, trace_job, errors, window))
+                futures.append(future)
+                futures = raise_failed(futures)
+                if errors:
+                    raise errors[0]
+            for future_done in as_completed(futures):
+                future_done.result()
+            if errors:
+                raise errors[0]
+        except BrokenProcessPool:
+            abort_sinks(sinks)
+            reset_process_pool()
+            raise
+        except BaseException:
+            abort_sinks(sinks)
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+            # every finish_chunk returns its window slot, wait for all of them before the pool goes away
+            for _ in range(window_total):
+                window.acquire()
+            unlisten_progress(run_id)
+            if pool:
+                pool.close()
+
+
+def run_chunk(run_id: int, process_frames: type.ProcessFrames, pool_name: Optional[str], slot_size: int, slots: List[int], chunk_items: List[Any], args: List[Any], is_traced: bool = False) -> Dict[str, Any]:
+    memory = shared_frame.attach(pool_name) if pool_name else None
+    items = [ shared_frame.unpack_item(memory, slot_size, item) for item in chunk_items ]
+    sink = shared_frame.SinkProxy(memory, slot_size, slots, shared_frame.get_item_slots(chunk_items))
+    writer = shared_frame.WriterProxy()
+    args = [ unpack_arg(arg, sink, writer) for arg in args ]
+    with trace.collect('worker') if is_traced else contextlib.nullcontext() as trace_job:
+        process_frames(lambda: _progress_queue.put((run_id, 1)), items, *args) # type: ignore
+    return { 'sink': sink.writes, 'writer': writer.writes, 'trace': trace_job.export() if trace_job else None }
+
+
+def finish_chunk(future: Future, pool: Optional[shared_frame.SharedFramePool], slots: List[int], sinks: List[frame_sink.FrameSink], writers: List[artifact_store.ArtifactWriter], trace_job: Optional[trace.TraceJob], errors: List[BaseException], window: threading.BoundedSemaphore) -> None:
+    try:
+        if not future.cancelled() and future.exception():
+            # run_process may wait for sink capacity that the failed chunk would have freed
+            abort_sinks(sinks)
+        elif not future.cancelled():
+            records = future.result()
+            if trace_job and records['trace']:
+                trace_job.merge(*records['trace'])
+            for frame_number, frame in records['sink']:
+                frame = pool.view(frame).copy() if isinstance(frame, shared_frame.FrameRef) else frame # type: ignore
+                for sink in sinks:
+                    # done callbacks share one thread, run_process waits for capacity before submitting instead
+                    sink.write(frame_number, frame, wait = False)
+            for write_args in records['writer']:
+                for writer in writers:
+                    writer.write(*write_args)
+    except BaseException as exception:
+        errors.append(exception)
+        abort_sinks(sinks)
+    finally:
+        if pool:
+            pool.release(slots)
+        window.release()
+
+
+def abort_sinks(args: Iterable[Any]) -> None:
+    for arg in args:
+        if isinstance(arg, frame_sink.FrameSink):
+            arg.abort()
+
+
+def pack_arg(arg: Any) -> Any:
+    if isinstance(arg, frame_sink.FrameSink):
+        return shared_frame.ProxyMarker('sink')
+    if isinstance(arg, artifact_store.ArtifactWriter):
+        return shared_frame.ProxyMarker('writer')
+    return arg
+
+
+def unpack_arg(arg: Any, sink: shared_frame.SinkProxy, writer: shared_frame.WriterProxy) -> Any:
+    if isinstance(arg, shared_frame.ProxyMarker):
+        return sink if arg.kind == 'sink' else writer
+    return arg
+
+
+def can_run_process(args: Tuple[Any, ...]) -> bool:
+    try:
+        pickle.dumps([ pack_arg(arg) for arg in args ])
+        return True
+    except Exception:
+        log.warn(words.get('multi_process/run_process'), __name__.upper())
+        return False
+
+
+def create_frame_pool(frame_shape: Optional[Tuple[int, ...]], worker_total: int, chunk_size: int) -> Optional[shared_frame.SharedFramePool]:
+    if not frame_shape:
+        return None
+    slot_size = int(np.prod(frame_shape))
+    slot_total = min(worker_total * globals.STREAM_WINDOW_PER_THREAD * chunk_size, globals.SHARED_FRAME_MEMORY * 1024 ** 2 // slot_size)
+    try:
+        return shared_frame.SharedFramePool(max(slot_total, chunk_size), slot_size)
+    except OSError as exception:
+        log.debug(str(exception), __name__.upper())
+        return None
+
+
+def get_process_pool() -> Tuple[ProcessPoolExecutor, int]:
+    global _process_pool, _process_worker_total, _progress_queue
+    with _process_pool_lock:
+        if _process_pool is None:
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+            _process_worker_total = globals.PROCESS_WORKERS or max(1, (os.cpu_count() or 1) // globals.PROCESS_WORKER_THREADS)
+            _progress_queue = context.SimpleQueue()
+            _process_pool = ProcessPoolExecutor(max_workers = _process_worker_total, mp_context = context, initializer = init_worker, initargs = (_progress_queue, globals.PROCESS_WORKER_THREADS, list(_worker_initializers)))
+            threading.Thread(target = dispatch_progress, args = (_progress_queue,), daemon = True).start()
+        return _process_pool, _process_worker_total
+
+
+def reset_process_pool() -> None:
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool:
+            _process_pool.shutdown(wait = False, cancel_futures = True)
+        _process_pool = None
+
+
+def add_worker_initializer(initializer: Callable[..., Any], *args: Any) -> None:
+    # workers start from a fresh import, state the parent changes after import reaches them through an initializer
+    _worker_initializers.append((initializer, args))
+    reset_process_pool()
+
+
+def init_worker(progress_queue: Any, worker_threads: int, initializers: List[Tuple[Callable[..., Any], Tuple[Any, ...]]]) -> None:
+    global _progress_queue
+    _progress_queue = progress_queue
+    for initializer, args in initializers:
+        initializer(*args)
+    cv2.setNumThreads(worker_threads)
+    for session_profile in globals.SESSION_PROFILES.values():
+        session_profile['intra_op_threads'] = worker_threads
+        session_profile['inter_op_threads'] = 1
+        session_profile['partition_threads'] = False
+    globals.MODEL_REPLICAS = { model_type: 1 for model_type in globals.MODEL_REPLICAS }
+    globals.MODEL_PIN_CORES = False
+
+
+def listen_progress(update_progress: Callable[[int], Any]) -> int:
+    run_id = next(_run_ids)
+    with _process_pool_lock:
+        _progress_listeners[run_id] = (update_progress, threading.Event())
+    return run_id
+
+
+def unlisten_progress(run_id: int) -> None:
+    _progress_queue.put((run_id, None)) # type: ignore
+    _progress_listeners[run_id][1].wait()
+    with _process_pool_lock:
+        del _progress_listeners[run_id]
+
+
+def dispatch_progress(progress_queue: Any) -> None:
+    while True:
+        run_id, progress = progress_queue.get()
+        update_progress, is_drained = _progress_listeners.get(run_id, (None, None))
+        if is_drained is None:
+            continue
+        if progress is None:
+            is_drained.set()
+        else:
+            update_progress(progress) # type: ignore
+
+
+@contextlib.contextmanager
+def open_progress(process_frames: type.ProcessFrames, frame_total: int) -> Iterator[Tuple[tqdm, Callable[..., None]]]:
+    stage = process_frames.__module__.split('.')[-1]
+    job = metrics.start_job(stage)
+    # the queued job of the caller counts frames of every stage it runs
+    queue_job = job_queue.get_current_job()
+    if queue_job:
+        queue_job.start_stage(stage, frame_total)
+    try:
+        with tqdm(total = frame_total, desc = 'processing', unit = 'frame', ascii = ' =', disable = INFO in [ 'warn', 'error' ]) as progress:
+
+            def update_progress(frame_count: int = 1) -> None:
+                progress.update(frame_count)
+                job.update(frame_count)
+                if queue_job:
+                    queue_job.update(frame_count)
+
+            yield progress, update_progress
+    finally:
+        metrics.finish_job(job)
+
+
+def pick_chunks(items: Iterable[Any], chunk_size: int) -> Iterator[List[Any]]:
+    iterator = iter(items)
+    while True:
+        chunk_items = list(islice(iterator, chunk_size))
+        if not chunk_items:
+            return
+        yield chunk_items
+
+
+def raise_failed(futures: List[Any]) -> List[Any]:
+    pending_futures = []
+    for future in futures:
+        if not future.done():
+            pending_futures.append(future)
+        elif future.exception():
+            raise future.exception() # type: ignore
+    return pending_futures
+
+
 def create_queue(temp_frame_paths: List[str]) -> Queue[str]:
 	queue: Queue[str] = Queue()
 	for frame_path in temp_frame_paths:
@@ -53,26 +365,7 @@ def get_progress_info(max_workers: int, queue_ratio: float) -> Dict[str, Any]:
 
 
 def get_system_resources() -> type.SystemResources:
-    cpu_count = psutil.cpu_count(logical=True)
-    memory = psutil.virtual_memory()
-    disk = psutil.disk_io_counters()
-    memory_total = memory.total / (1024 ** 3)
-    memory_available = memory.available / (1024 ** 3)
-    cpu_usage = psutil.cpu_percent(interval=1)
-    memory_usage = memory.percent
-    try:
-        io_usage = disk.read_bytes + disk.write_bytes / disk.read_time + disk.write_time # type: ignore
-    except:
-        io_usage = 0.0
-    return {
-            'cpu_count': cpu_count,
-            'memory_total': memory_total,
-            'memory_available': memory_available,
-            'cpu_usage': cpu_usage,
-            'memory_usage': memory_usage,
-            'io_usage': io_usage
-            }
-
+    return metrics.get_system_resources()
 
 
 def calculate_optimal_params(queue_items_count: int, estimated_memory_per_item: float = 0.1) -> Tuple[int, float]:
@@ -0,0 +1,91 @@
+from typing import Dict, List, Optional
+import os
+
+import numpy as np
+import onnx
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, quantize_static
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+import DeepFake.config.type as type
+import DeepFake.utils.log as log
+import DeepFake.utils.inference as inference
+import DeepFake.utils.swap_util as swap_util
+import DeepFake.core.model_zoo.yolox as detector
+import DeepFake.core.model_zoo.face_occluder as masker
+import DeepFake.core.model_zoo.arcface_inswapper as embedder
+import DeepFake.core.model_zoo.inswapper as swapper
+
+
+'''
+variants are written next to the fp32 model
+*.int8_dynamic.onnx: int8 weights, activations quantized at run time
+*.int8_static.onnx: int8 weights and activations, QDQ with calibrated ranges
+'''
+
+
+MODEL_PATHS: Dict[type.ModelType, str] =\
+{
+    'detector': detector.MODEL_PATH,
+    'masker': masker.MODEL_PATH,
+    'embedder': embedder.MODEL_PATH,
+    'swapper': swapper.MODEL_PATH
+}
+
+
+class CalibrationReader(CalibrationDataReader):
+
+    def __init__(self, input_names: List[str], calibration_inputs: List[List[np.ndarray]]) -> None:
+        self._feeds = iter([ dict(zip(input_names, inputs)) for inputs in calibration_inputs ])
+
+
+    def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+        return next(self._feeds, None)
+
+
+def quantize_model(model_type: type.ModelType, model_precision: type.ModelPrecision, frames: List[type.Frame]) -> str:
+    model_path = MODEL_PATHS[model_type]
+    variant_path = inference.get_variant_path(model_path, model_precision)
+    prepare_path = prepare_model(model_path, variant_path + '.prepare.onnx')
+    if model_precision == 'int8_dynamic':
+        quantize_dynamic(prepare_path, variant_path, weight_type = QuantType.QUInt8)
+    if model_precision == 'int8_static':
+        calibration_reader = CalibrationReader(get_input_names(model_path), create_calibration_inputs(model_type, frames))
+        quantize_static(prepare_path, variant_path, calibration_reader, quant_format = QuantFormat.QDQ, activation_type = QuantType.QUInt8, weight_type = QuantType.QInt8)
+    if prepare_path != model_path:
+        os.remove(prepare_path)
+    return variant_path
+
+
+def prepare_model(model_path: str, prepare_path: str) -> str:
+    try:
+        quant_pre_process(model_path, prepare_path)
+        return prepare_path
+    except Exception as exception:
+        log.debug(str(exception), __name__.upper())
+        return model_path
+
+
+def create_calibration_inputs(model_type: type.ModelType, frames: List[type.Frame]) -> List[List[np.ndarray]]:
+    if model_type == 'detector':
+        return detector.prepare_calibration(frames)
+    kps_lists = detector.run_batch(frames)
+    if model_type == 'embedder':
+        return embedder.prepare_calibration(crop_faces(frames, kps_lists, embedder.MODEL_SIZE, embedder.MODEL_TEMPLATE))
+    crop_frames = crop_faces(frames, kps_lists, swapper.MODEL_SIZE, swapper.MODEL_TEMPLATE)
+    if model_type == 'masker':
+        return masker.prepare_calibration(crop_frames)
+    source_crop_frames = crop_faces(frames, kps_lists, embedder.MODEL_SIZE, embedder.MODEL_TEMPLATE)
+    source_latents = [ swapper.prepare_source(embedder.run(source_crop_frame)) for source_crop_frame in source_crop_frames ]
+    # swap every face with the identity of the next one
+    source_latents = source_latents[1:] + source_latents[:1]
+    return swapper.prepare_calibration(crop_frames, source_latents)
+
+
+def crop_faces(frames: List[type.Frame], kps_lists: List[type.KpsList], model_size: type.Size, model_template: type.Template) -> List[type.Frame]:
+    return [ crop_frame for crop_frames, _ in swap_util.crop_frames(frames, model_size, model_template, kps_lists) for crop_frame in crop_frames ]
+
+
+def get_input_names(model_path: str) -> List[str]:
+    graph = onnx.load(model_path, load_external_data = False).graph
+    initializer_names = { initializer.name for initializer in graph.initializer }
+    return [ input.name for input in graph.input if input.name not in initializer_names ]
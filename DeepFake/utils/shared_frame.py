@@ -0,0 +1,151 @@
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from multiprocessing import shared_memory
+from queue import Queue
+
+import numpy as np
+
+import DeepFake.config.type as type
+
+
+'''
+pool: [slot_total * slot_size] uint8, one frame per slot
+item: uint8 frames up to slot_size -> FrameRef(slot, shape), the rest stay inline
+SinkProxy.writes: [(frame_number, FrameRef | Frame)], replayed into the FrameSink by the parent
+WriterProxy.writes: [args], replayed into the ArtifactWriter by the parent
+'''
+
+
+class FrameRef(NamedTuple):
+    slot: int
+    shape: Tuple[int, ...]
+
+
+class ProxyMarker(NamedTuple):
+    kind: str
+
+
+class SharedFramePool:
+
+    def __init__(self, slot_total: int, slot_size: int) -> None:
+        self._memory = shared_memory.SharedMemory(create = True, size = slot_total * slot_size)
+        self.name = self._memory.name
+        self.slot_size = slot_size
+        self._free_slots: Queue[int] = Queue()
+        for slot in range(slot_total):
+            self._free_slots.put(slot)
+
+
+    def acquire(self, slot_total: int) -> List[int]:
+        return [ self._free_slots.get() for _ in range(slot_total) ]
+
+
+    def release(self, slots: List[int]) -> None:
+        for slot in slots:
+            self._free_slots.put(slot)
+
+
+    def view(self, frame_ref: FrameRef) -> type.Frame:
+        return get_view(self._memory, self.slot_size, frame_ref)
+
+
+    def close(self) -> None:
+        self._memory.close()
+        self._memory.unlink()
+
+
+class SinkProxy:
+
+    def __init__(self, memory: Optional[shared_memory.SharedMemory], slot_size: int, slots: List[int], input_slots: List[int]) -> None:
+        self._memory = memory
+        self._slot_size = slot_size
+        self._free_slots = [ slot for slot in slots if slot not in input_slots ]
+        self._input_slots = input_slots
+        self.writes: List[Tuple[int, Any]] = []
+
+
+    def write(self, frame_number: int, frame: type.Frame) -> None:
+        slot = self._find_slot(frame)
+        if slot is None:
+            self.writes.append((frame_number, np.array(frame)))
+            return
+        frame_ref = FrameRef(slot, frame.shape)
+        view = get_view(self._memory, self._slot_size, frame_ref) # type: ignore
+        if view.ctypes.data != frame.ctypes.data:
+            np.copyto(view, frame)
+        self.writes.append((frame_number, frame_ref))
+
+
+    def _find_slot(self, frame: type.Frame) -> Optional[int]:
+        if self._memory is None or frame.dtype != np.uint8 or frame.nbytes > self._slot_size:
+            return None
+        for slot in self._input_slots:
+            if get_view(self._memory, self._slot_size, FrameRef(slot, frame.shape)).ctypes.data == frame.ctypes.data:
+                return slot
+        if self._free_slots:
+            return self._free_slots.pop(0)
+        return None
+
+
+class WriterProxy:
+
+    def __init__(self) -> None:
+        self.writes: List[Tuple[Any, ...]] = []
+
+
+    def write(self, *args: Any) -> None:
+        self.writes.append(args)
+
+
+_attached_memories: Dict[str, shared_memory.SharedMemory] = {}
+
+
+def attach(name: str) -> shared_memory.SharedMemory:
+    memory = _attached_memories.get(name)
+    if memory is None:
+        detach_stale(name)
+        memory = shared_memory.SharedMemory(name = name)
+        _attached_memories[name] = memory
+    return memory
+
+
+def detach_stale(name: str) -> None:
+    for stale_name in [ attached_name for attached_name in _attached_memories if attached_name != name ]:
+        try:
+            _attached_memories[stale_name].close()
+            del _attached_memories[stale_name]
+        except BufferError:
+            pass
+
+
+def get_view(memory: shared_memory.SharedMemory, slot_size: int, frame_ref: FrameRef) -> type.Frame:
+    return np.ndarray(frame_ref.shape, dtype = np.uint8, buffer = memory.buf, offset = frame_ref.slot * slot_size)
+
+
+def get_frame_shape(item: Any) -> Optional[Tuple[int, ...]]:
+    for value in item if isinstance(item, tuple) else (item,):
+        if isinstance(value, np.ndarray):
+            return value.shape
+    return None
+
+
+def pack_item(pool: Optional[SharedFramePool], slot: int, item: Any) -> Any:
+    if pool is None or not isinstance(item, tuple):
+        return item
+    packed_item = []
+    for value in item:
+        if isinstance(value, np.ndarray) and value.dtype == np.uint8 and value.nbytes <= pool.slot_size:
+            frame_ref = FrameRef(slot, value.shape)
+            np.copyto(pool.view(frame_ref), value)
+            value = frame_ref
+        packed_item.append(value)
+    return tuple(packed_item)
+
+
+def unpack_item(memory: Optional[shared_memory.SharedMemory], slot_size: int, item: Any) -> Any:
+    if memory is None or not isinstance(item, tuple):
+        return item
+    return tuple(get_view(memory, slot_size, value) if isinstance(value, FrameRef) else value for value in item)
+
+
+def get_item_slots(items: List[Any]) -> List[int]:
+    return [ value.slot for item in items if isinstance(item, tuple) for value in item if isinstance(value, FrameRef) ]
@@ -1,26 +1,71 @@
-from typing import Tuple, List
+from typing import Tuple, List, Optional
 
 import cv2
 import numpy as np
+from numpy.typing import NDArray
 
 import DeepFake.config.type as type
 import DeepFake.core.model_zoo.yolox as detector
+import DeepFake.utils.detection_cache as detection_cache
 
 
 def crop_frame(frame: type.Frame, model_size: type.Size, model_template: type.Template) -> Tuple[List[type.Frame], List[type.Matrix]]:
-    normed_template = model_template * model_size
-    kps_list = detector.run(frame)
+    kps_list = detection_cache.detect([ frame ])[0]
+    return crop_faces(frame, kps_list, model_size, model_template)
+
+
+def crop_frames(frames: List[type.Frame], model_size: type.Size, model_template: type.Template, kps_lists: Optional[List[type.KpsList]] = None) -> List[Tuple[List[type.Frame], List[type.Matrix]]]:
+    if kps_lists is None:
+        kps_lists = detector.run_batch(frames)
+    return [ crop_faces(frame, kps_list, model_size, model_template) for frame, kps_list in zip(frames, kps_lists) ]
+
+
+def crop_faces(frame: type.Frame, kps_list: type.KpsList, model_size: type.Size, model_template: type.Template) -> Tuple[List[type.Frame], List[type.Matrix]]:
     if len(kps_list) == 0:
         return [], []
-    crop_frame_list = []
-    affine_matrix_list = []
-    for kps in kps_list:
-        filtered_kps = np.array([row for row in kps if row is not None and not np.isnan(row).any()])
-        filtered_template = np.array([row for row, reference_row in zip(normed_template, kps) if reference_row is not None and not np.isnan(reference_row).any()])
-        if len(filtered_kps) < 2:
-            continue
-        affine_matrix = cv2.estimateAffinePartial2D(filtered_kps, filtered_template, method=cv2.RANSAC, ransacReprojThreshold=100)[0]
-        crop_frame = cv2.warpAffine(frame, affine_matrix, model_size, borderMode=cv2.BORDER_REPLICATE, flags=cv2.INTER_AREA)
-        crop_frame_list.append(crop_frame)
-        affine_matrix_list.append(affine_matrix)
-    return crop_frame_list, affine_matrix_list
\ No newline at end of file
+    affine_matrices, is_valid = estimate_matrices(kps_list, model_size, model_template)
+    affine_matrices = affine_matrices[is_valid]
+    crop_frames = warp_faces(frame, affine_matrices, model_size)
+    return list(crop_frames), list(affine_matrices)
+
+
+def estimate_matrices(kps_list: type.KpsList, model_size: type.Size, model_template: type.Template) -> Tuple[NDArray[np.float64], NDArray[np.bool_]]:
+    kps = np.asarray(kps_list, dtype = np.float64).reshape(-1, len(model_template), 2)
+    normed_template = np.asarray(model_template * model_size, dtype = np.float64)
+    weights = (~np.isnan(kps).any(axis = 2)).astype(np.float64)[:, :, np.newaxis]
+    point_totals = weights.sum(axis = 1)
+    kps = np.nan_to_num(kps) * weights
+    kps_mean = kps.sum(axis = 1) / np.maximum(point_totals, 1)
+    template_mean = (normed_template * weights).sum(axis = 1) / np.maximum(point_totals, 1)
+    centered_kps = (kps - kps_mean[:, np.newaxis]) * weights
+    centered_template = (normed_template - template_mean[:, np.newaxis]) * weights
+    covariance = centered_template.transpose(0, 2, 1) @ centered_kps / np.maximum(point_totals, 1)[:, :, np.newaxis]
+    kps_variance = (centered_kps ** 2).sum(axis = (1, 2)) / np.maximum(point_totals[:, 0], 1)
+    u, s, vt = np.linalg.svd(covariance)
+    # similarity only, flip the last axis instead of reflecting
+    signs = np.ones_like(s)
+    signs[:, 1] = np.where(np.linalg.det(u) * np.linalg.det(vt) < 0, -1, 1)
+    rotations = (u * signs[:, np.newaxis]) @ vt
+    scales = (s * signs).sum(axis = 1) / np.where(kps_variance > 0, kps_variance, 1)
+    translations = template_mean - scales[:, np.newaxis] * (rotations @ kps_mean[:, :, np.newaxis])[:, :, 0]
+    affine_matrices = np.concatenate([ scales[:, np.newaxis, np.newaxis] * rotations, translations[:, :, np.newaxis] ], axis = 2)
+    is_valid = (point_totals[:, 0] >= 2) & (kps_variance > 0)
+    return affine_matrices, is_valid
+
+
+def warp_faces(frame: type.Frame, affine_matrices: NDArray[np.float64], model_size: type.Size) -> type.Frames:
+    crop_frames = np.empty((len(affine_matrices), model_size[1], model_size[0]) + frame.shape[2:], dtype = frame.dtype)
+    for affine_matrix, crop_frame in zip(affine_matrices, crop_frames):
+        cv2.warpAffine(frame, affine_matrix, model_size, dst = crop_frame, borderMode = cv2.BORDER_REPLICATE, flags = cv2.INTER_AREA)
+    return crop_frames
+
+
+def get_paste_box(matrix: type.Matrix, crop_size: type.Size, frame_size: type.Size) -> Tuple[int, int, int, int]:
+    crop_width, crop_height = crop_size
+    frame_width, frame_height = frame_size
+    # bilinear sampling reaches one crop pixel past each edge
+    corners = np.array([ [ -1, -1, 1 ], [ crop_width, -1, 1 ], [ -1, crop_height, 1 ], [ crop_width, crop_height, 1 ] ])
+    points = corners @ np.asarray(matrix, dtype = np.float64).T
+    x1, y1 = np.floor(points.min(axis = 0)).astype(int) - 1
+    x2, y2 = np.ceil(points.max(axis = 0)).astype(int) + 2
+    return max(x1, 0), max(y1, 0), min(x2, frame_width), min(y2, frame_height)
\ No newline at end of file
@@ -0,0 +1,173 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from contextvars import ContextVar
+import contextlib
+import json
+import os
+import threading
+import time
+
+import DeepFake.config.globals as globals
+import DeepFake.utils.log as log
+
+
+'''
+enabled by DF_TRACE=1, spans are recorded inside a job only
+event: (name, category, start_ns, duration_ns, thread_id, bytes), first TRACE_MAX_EVENTS per job
+counter: <name>/skipped_frames is also reported as a ratio of <name>/frames
+export: TRACE_DIR/<job>_<time>_<pid>.json in chrome trace format when TRACE_EXPORT is set
+'''
+
+
+Event = Tuple[str, str, int, int, int, int]
+
+
+class TraceJob:
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.started_at = time.perf_counter_ns()
+        self.events: List[Event] = []
+        self.dropped_event_total = 0
+        self.rows: Dict[str, List[int]] = {}
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+
+    def record(self, event: Event) -> None:
+        name, _, _, duration, _, byte_count = event
+        with self._lock:
+            self._add_row(name, 1, duration, duration, byte_count)
+            if len(self.events) < globals.TRACE_MAX_EVENTS:
+                self.events.append(event)
+            else:
+                self.dropped_event_total += 1
+
+
+    def merge(self, rows: Dict[str, List[int]], counters: Dict[str, int]) -> None:
+        with self._lock:
+            for name, (count, total, maximum, byte_count) in rows.items():
+                self._add_row(name, count, total, maximum, byte_count)
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+
+    def export(self) -> Tuple[Dict[str, List[int]], Dict[str, int]]:
+        with self._lock:
+            return { name: list(row) for name, row in self.rows.items() }, dict(self.counters)
+
+
+    def _add_row(self, name: str, count: int, total: int, maximum: int, byte_count: int) -> None:
+        row = self.rows.setdefault(name, [ 0, 0, 0, 0 ])
+        row[0] += count
+        row[1] += total
+        row[2] = max(row[2], maximum)
+        row[3] += byte_count
+
+
+    def count(self, name: str, value: int) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+
+    def summarize(self) -> List[Dict[str, Any]]:
+        wall_time = max(time.perf_counter_ns() - self.started_at, 1)
+        rows = []
+        for name, (count, total, maximum, byte_count) in self.export()[0].items():
+            rows.append({ 'name': name, 'count': count, 'total_ms': total / 1e6, 'max_ms': maximum / 1e6, 'bytes': byte_count, 'mean_ms': total / 1e6 / count, 'wall_percent': total / wall_time * 100 })
+        return sorted(rows, key = lambda row: row['total_ms'], reverse = True)
+
+
+    def format_summary(self) -> str:
+        lines = [ f"{'span':<32} {'count':>8} {'total ms':>12} {'mean ms':>10} {'max ms':>10} {'wall %':>8} {'MB':>10}" ]
+        for row in self.summarize():
+            lines.append(f"{row['name']:<32} {row['count']:>8} {row['total_ms']:>12.1f} {row['mean_ms']:>10.2f} {row['max_ms']:>10.2f} {row['wall_percent']:>8.1f} {row['bytes'] / 1024 ** 2:>10.1f}")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f'{name:<32} {value:>8}')
+            frame_total = self.counters.get(name.replace('/skipped_frames', '/frames')) if name.endswith('/skipped_frames') else None
+            if frame_total:
+                lines.append(f"{name.replace('/skipped_frames', '/skip_ratio'):<32} {value / frame_total:>8.3f}")
+        if self.dropped_event_total:
+            lines.append(f"{'trace/dropped_events':<32} {self.dropped_event_total:>8}")
+        return '\n'.join(lines)
+
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        trace_events = []
+        for name, category, start, duration, thread_id, byte_count in list(self.events):
+            trace_event = { 'name': name, 'cat': category, 'ph': 'X', 'ts': (start - self.started_at) / 1e3, 'dur': duration / 1e3, 'pid': os.getpid(), 'tid': thread_id }
+            if byte_count:
+                trace_event['args'] = { 'bytes': byte_count }
+            trace_events.append(trace_event)
+        return { 'traceEvents': trace_events, 'displayTimeUnit': 'ms', 'otherData': { 'job': self.name, 'counters': self.counters, 'dropped_events': self.dropped_event_total } }
+
+
+class Span:
+
+    __slots__ = ('bytes',)
+
+    def __init__(self) -> None:
+        self.bytes = 0
+
+
+_job: ContextVar[Optional[TraceJob]] = ContextVar('trace_job', default = None)
+
+
+@contextlib.contextmanager
+def job(name: str) -> Iterator[Optional[TraceJob]]:
+    current_job = _job.get()
+    if current_job or not globals.TRACE:
+        with span(name, 'job'):
+            yield current_job
+        return
+    trace_job = TraceJob(name)
+    token = _job.set(trace_job)
+    try:
+        with span(name, 'job'):
+            yield trace_job
+    finally:
+        _job.reset(token)
+        finish_job(trace_job)
+
+
+@contextlib.contextmanager
+def collect(name: str) -> Iterator[TraceJob]:
+    trace_job = TraceJob(name)
+    token = _job.set(trace_job)
+    try:
+        yield trace_job
+    finally:
+        _job.reset(token)
+
+
+@contextlib.contextmanager
+def span(name: str, category: str = 'stage') -> Iterator[Span]:
+    trace_job = _job.get()
+    current_span = Span()
+    if trace_job is None:
+        yield current_span
+        return
+    start = time.perf_counter_ns()
+    try:
+        yield current_span
+    finally:
+        trace_job.record((name, category, start, time.perf_counter_ns() - start, threading.get_ident(), current_span.bytes))
+
+
+def count(name: str, value: int = 1) -> None:
+    trace_job = _job.get()
+    if trace_job:
+        trace_job.count(name, value)
+
+
+def get_job() -> Optional[TraceJob]:
+    return _job.get()
+
+
+def finish_job(trace_job: TraceJob) -> None:
+    log.info(trace_job.name + '\n' + trace_job.format_summary(), __name__.upper())
+    if globals.TRACE_EXPORT:
+        os.makedirs(globals.TRACE_DIR, exist_ok = True)
+        trace_path = os.path.join(globals.TRACE_DIR, trace_job.name.replace('/', '_') + '_' + time.strftime('%Y%m%d_%H%M%S') + '_' + str(os.getpid()) + '.json')
+        with open(trace_path, 'w') as trace_file:
+            json.dump(trace_job.to_chrome_trace(), trace_file)
+        log.info(trace_path, __name__.upper())
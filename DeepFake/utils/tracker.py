@@ -0,0 +1,90 @@
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+import DeepFake.config.type as type
+import DeepFake.config.globals as globals
+import DeepFake.utils.swap_util as swap_util
+import DeepFake.utils.trace as trace
+import DeepFake.core.model_zoo.yolox as detector
+
+
+'''
+keyframe: detector every TRACKING_KEYFRAME_INTERVAL frames or below TRACKING_MIN_POINTS points
+between keyframes: kps [N, 5, 2] follow lucas kanade flow, matrices blend with TRACKING_SMOOTHING
+'''
+
+
+LK_PARAMS =\
+{
+    'winSize': (21, 21),
+    'maxLevel': 3,
+    'criteria': (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03)
+}
+
+
+class FaceTracker:
+
+    def __init__(self, model_size: type.Size, model_template: type.Template) -> None:
+        self._model_size = model_size
+        self._model_template = model_template
+        self._gray_frame: Optional[type.Frame] = None
+        self._kps = np.empty((0, 5, 2))
+        self._matrices = np.empty((0, 2, 3))
+        self._frame_count = 0
+
+
+    def crop_frame(self, frame: type.Frame) -> Tuple[List[type.Frame], List[type.Matrix]]:
+        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        kps = self._track(gray_frame)
+        is_keyframe = kps is None
+        if is_keyframe:
+            kps = np.asarray(detector.run(frame), dtype = np.float64).reshape(-1, 5, 2)
+            self._frame_count = 0
+        trace.count('tracker/keyframes' if is_keyframe else 'tracker/tracked_frames')
+        matrices, is_valid = swap_util.estimate_matrices(kps, self._model_size, self._model_template)
+        kps, matrices = kps[is_valid], matrices[is_valid]
+        previous_indices = match_faces(self._kps, kps) if is_keyframe else np.flatnonzero(is_valid)
+        is_matched = previous_indices >= 0
+        matrices[is_matched] = globals.TRACKING_SMOOTHING * self._matrices[previous_indices[is_matched]] + (1 - globals.TRACKING_SMOOTHING) * matrices[is_matched]
+        self._gray_frame = gray_frame
+        self._kps = kps
+        self._matrices = matrices
+        self._frame_count += 1
+        crop_frames = swap_util.warp_faces(frame, matrices, self._model_size)
+        return list(crop_frames), list(matrices)
+
+
+    def _track(self, gray_frame: type.Frame) -> Optional[type.KpsList]:
+        if self._gray_frame is None or self._frame_count >= globals.TRACKING_KEYFRAME_INTERVAL:
+            return None
+        if len(self._kps) == 0:
+            return self._kps
+        points = self._kps.reshape(-1, 1, 2).astype(np.float32)
+        is_present = ~np.isnan(points[:, 0, 0])
+        points[~is_present] = 0
+        next_points, status, _ = cv2.calcOpticalFlowPyrLK(self._gray_frame, gray_frame, points, None, **LK_PARAMS)
+        back_points, back_status, _ = cv2.calcOpticalFlowPyrLK(gray_frame, self._gray_frame, next_points, None, **LK_PARAMS)
+        errors = np.linalg.norm(back_points - points, axis = 2)[:, 0]
+        is_tracked = is_present & (status[:, 0] == 1) & (back_status[:, 0] == 1) & (errors < globals.TRACKING_MAX_ERROR)
+        if np.any(is_tracked.reshape(-1, 5).sum(axis = 1) < np.minimum(is_present.reshape(-1, 5).sum(axis = 1), globals.TRACKING_MIN_POINTS)):
+            return None
+        kps = np.where(is_tracked[:, np.newaxis], next_points[:, 0], np.nan)
+        return kps.reshape(-1, 5, 2).astype(np.float64)
+
+
+def match_faces(previous_kps: type.KpsList, kps: type.KpsList) -> np.ndarray:
+    indices = np.full(len(kps), -1)
+    if len(previous_kps) == 0 or len(kps) == 0:
+        return indices
+    previous_centers = np.nanmean(previous_kps, axis = 1)
+    centers = np.nanmean(kps, axis = 1)
+    distances = np.linalg.norm(centers[:, np.newaxis] - previous_centers[np.newaxis], axis = 2)
+    # the previous frame is one step away, a face moves less than half its keypoint spread
+    spreads = np.nanmax(np.linalg.norm(kps - centers[:, np.newaxis], axis = 2), axis = 1)
+    for index in np.argsort(distances.min(axis = 1)):
+        previous_index = np.argmin(distances[index])
+        if distances[index, previous_index] <= spreads[index] / 2 and previous_index not in indices:
+            indices[index] = previous_index
+    return indices
@@ -1,10 +1,17 @@
 from typing import Optional, List, Tuple
 from functools import lru_cache
 import cv2
+import numpy as np
 
-from DeepFake.config.type import Frame, Resolution
+from DeepFake.config.type import Frame, Frames, Resolution, Size
 from DeepFake.config.choices import video_template_sizes
-from DeepFake.utils.filesystem import is_image, is_video
+from DeepFake.utils.filesystem import is_image, is_video, notify_file, wait_for_file
+import DeepFake.config.words as words
+import DeepFake.utils.trace as trace
+
+
+# cv2 handles at most 512 channels per image, batches are folded into channels up to that limit
+RESIZE_CHANNEL_LIMIT = 512
 
 
 def get_video_frame(video_path: str, frame_number: int = 0) -> Optional[Frame]:
@@ -30,6 +37,14 @@ def count_video_frame_total(video_path: str) -> int:
 	return 0
 
 
+def estimate_video_frame_total(video_path: str, video_fps: float) -> int:
+	video_frame_total = count_video_frame_total(video_path)
+	source_video_fps = detect_video_fps(video_path)
+	if source_video_fps:
+		return round(video_frame_total * video_fps / source_video_fps)
+	return video_frame_total
+
+
 def detect_video_fps(video_path: str) -> float:
 	video_capture = cv2.VideoCapture(video_path)
 	if video_capture.isOpened():
@@ -101,6 +116,19 @@ def resize_frame_resolution(frame: Frame, max_width: int, max_height: int) -> Fr
 	return frame
 
 
+def resize_frames(frames: Frames, size: Size, interpolation: int = cv2.INTER_LINEAR) -> Frames:
+	frame_total, height, width, channel_total = frames.shape
+	chunk_size = max(1, RESIZE_CHANNEL_LIMIT // channel_total)
+	resized_frames = []
+	for start in range(0, frame_total, chunk_size):
+		chunk = frames[start:start + chunk_size]
+		chunk_total = chunk.shape[0]
+		folded_frame = chunk.transpose(1, 2, 0, 3).reshape(height, width, chunk_total * channel_total)
+		folded_frame = cv2.resize(folded_frame, size, interpolation = interpolation)
+		resized_frames.append(folded_frame.reshape(size[1], size[0], chunk_total, channel_total).transpose(2, 0, 1, 3))
+	return np.concatenate(resized_frames)
+
+
 def normalize_frame_color(frame: Frame) -> Frame:
 	return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
 
@@ -119,12 +147,20 @@ def read_static_images(image_paths: List[str]) -> List[Frame]:
 
 
 def read_image(image_path: str) -> Frame:
-	if is_image(image_path):
-		return cv2.imread(image_path)
-	raise
+	if wait_for_file(image_path) and is_image(image_path):
+		with trace.span('vision/read_image', 'io') as span:
+			frame = cv2.imread(image_path)
+			span.bytes = frame.nbytes if frame is not None else 0
+		return frame
+	raise OSError(words.get('vision/read_image') + ' ' + image_path)
 
 
 def write_image(image_path: str, frame: Frame) -> bool:
 	if image_path:
-		return cv2.imwrite(image_path, frame)
+		with trace.span('vision/write_image', 'io') as span:
+			span.bytes = frame.nbytes
+			is_written = cv2.imwrite(image_path, frame)
+		if is_written:
+			notify_file(image_path)
+		return is_written
 	return False
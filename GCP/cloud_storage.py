@@ -1,11 +1,15 @@
 import os
-from typing import List, Tuple
+from typing import Any, Callable, Dict, List, Tuple
 import logging
 import asyncio
 import aiofiles
 
 from google.cloud import storage
 
+import DeepFake.config.globals as globals
+import DeepFake.utils.filesystem as filesystem
+import DeepFake.utils.trace as trace
+
 
 PROJECT_ID = 'df-backend'
 BUCKET_NAME = 'df-backend'
@@ -25,6 +29,13 @@ if not logger.handlers:
     logger.addHandler(handler)
 
 
+def _transfer(span_name: str, local_path: str, function: Callable[..., Any], *args: Any) -> Any:
+    with trace.span(span_name, 'io') as span:
+        result = function(*args)
+        span.bytes = os.path.getsize(local_path)
+        return result
+
+
 async def _upload_file(local_path: str, gcs_path: str) -> bool:
     try:
         blob = bucket.blob(gcs_path)
@@ -32,9 +43,9 @@ async def _upload_file(local_path: str, gcs_path: str) -> bool:
             async with aiofiles.open(local_path, 'rb') as f:
                 file_data = await f.read()
                 blob.content_type = 'video/mp4'
-                await asyncio.to_thread(blob.upload_from_string, file_data, content_type='video/mp4')
+                await asyncio.to_thread(_transfer, 'gcs/upload_file', local_path, lambda: blob.upload_from_string(file_data, content_type='video/mp4'))
         else:
-            await asyncio.to_thread(blob.upload_from_filename, local_path)
+            await asyncio.to_thread(_transfer, 'gcs/upload_file', local_path, blob.upload_from_filename, local_path)
             
         logger.info(f"Uploaded: {local_path} -> {gcs_path}")
         return True
@@ -43,6 +54,12 @@ async def _upload_file(local_path: str, gcs_path: str) -> bool:
         return False
 
 
+def _get_gcs_path(local_path: str, local_dir_parent: str, gcs_base_path: str) -> str:
+    relative_path = os.path.relpath(local_path, local_dir_parent)
+    gcs_path = os.path.join(gcs_base_path, relative_path)
+    return gcs_path.replace('\\', '/')
+
+
 def _get_all_files(local_dir: str) -> List[str]:
     all_files = []
     for root, _, files in os.walk(local_dir):
@@ -71,13 +88,12 @@ async def upload_directory(local_dir: str, gcs_base_path: str) -> Tuple[int, int
             return await _upload_file(local_path, gcs_path)
     
     for local_path in all_files:
-        relative_path = os.path.relpath(local_path, local_dir_parent)
-        gcs_path = os.path.join(gcs_base_path, relative_path)
-        gcs_path = gcs_path.replace('\\', '/')
+        gcs_path = _get_gcs_path(local_path, local_dir_parent, gcs_base_path)
         task = upload_with_semaphore(local_path, gcs_path)
         upload_tasks.append(task)
 
-    results = await asyncio.gather(*upload_tasks)
+    with trace.span('gcs/upload_directory', 'io'):
+        results = await asyncio.gather(*upload_tasks)
     successful_uploads = sum(1 for result in results if result)
 
     logger.info(
@@ -105,7 +121,7 @@ async def download_directory(gcs_base_path: str, local_dir: str) -> Tuple[int, i
                     relative_path = os.path.relpath(blob.name, gcs_base_path)
                     local_path = os.path.join(local_dir, relative_path)
                     os.makedirs(os.path.dirname(local_path), exist_ok=True)
-                    await asyncio.to_thread(blob.download_to_filename, local_path)
+                    await asyncio.to_thread(_transfer, 'gcs/download_file', local_path, blob.download_to_filename, local_path)
                     logger.info(f"Downloaded: {blob.name} -> {local_path}")
                     return True
                 except Exception as e:
@@ -113,7 +129,8 @@ async def download_directory(gcs_base_path: str, local_dir: str) -> Tuple[int, i
                     return False
 
         download_tasks = [download_blob(blob) for blob in blobs]
-        results = await asyncio.gather(*download_tasks)
+        with trace.span('gcs/download_directory', 'io'):
+            results = await asyncio.gather(*download_tasks)
         successful_downloads = sum(1 for result in results if result)
 
         logger.info(
@@ -130,9 +147,123 @@ async def download_file(gcs_path: str, local_path: str) -> bool:
     try:
         blob = bucket.blob(gcs_path)
         os.makedirs(os.path.dirname(local_path), exist_ok=True)
-        await asyncio.to_thread(blob.download_to_filename, local_path)
+        await asyncio.to_thread(_transfer, 'gcs/download_file', local_path, blob.download_to_filename, local_path)
         logger.info(f"Downloaded: {gcs_path} -> {local_path}")
         return True
     except Exception as e:
         logger.error(f"Error downloading {gcs_path}: {str(e)}")
-        return False
\ No newline at end of file
+        return False
+
+
+# files under local_dir upload as soon as they are written, finish uploads whatever was missed
+# or rewritten since, such as files written by process workers or closed at the end
+class Uploader:
+
+    def __init__(self, local_dir: str, gcs_base_path: str) -> None:
+        self._local_dir = os.path.abspath(local_dir)
+        self._local_dir_parent = os.path.dirname(self._local_dir)
+        self._gcs_base_path = gcs_base_path
+        self._loop = asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(max_workers)
+        self._tasks: List[asyncio.Task] = []
+        self._uploaded: Dict[str, int] = {}
+        self._is_cancelled = False
+
+
+    def submit(self, local_path: str) -> None:
+        local_path = os.path.abspath(local_path)
+        if local_path.startswith(self._local_dir + os.sep):
+            self._loop.call_soon_threadsafe(self._start, local_path)
+
+
+    def cancel(self) -> None:
+        # a failed run must not keep uploading partial output
+        self._is_cancelled = True
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+
+    def _start(self, local_path: str) -> None:
+        if self._is_cancelled:
+            return
+        self._tasks.append(self._loop.create_task(self._upload(local_path)))
+
+
+    async def _upload(self, local_path: str) -> bool:
+        async with self._semaphore:
+            try:
+                modified_at = os.stat(local_path).st_mtime_ns
+            except OSError:
+                return False
+            is_uploaded = await _upload_file(local_path, _get_gcs_path(local_path, self._local_dir_parent, self._gcs_base_path))
+            if is_uploaded:
+                self._uploaded[local_path] = modified_at
+            return is_uploaded
+
+
+    async def finish(self) -> Tuple[int, int]:
+        with trace.span('gcs/upload_pending', 'io'):
+            while self._tasks:
+                tasks, self._tasks = self._tasks, []
+                await asyncio.gather(*tasks)
+            remaining_files = [ local_path for local_path in _get_all_files(self._local_dir) if self._uploaded.get(local_path) != os.stat(local_path).st_mtime_ns ]
+            results = await asyncio.gather(*[ self._upload(local_path) for local_path in remaining_files ])
+        total_files = len(self._uploaded) + sum(1 for result in results if not result)
+        logger.info(f"Upload completed: {len(self._uploaded)}/{total_files} files successful")
+        return len(self._uploaded), total_files
+
+
+async def start_download_directory(gcs_base_path: str, local_dir: str, streamed_dir: str) -> asyncio.Task:
+    # files outside streamed_dir are downloaded before returning, files inside are announced as landing
+    # and downloaded by the returned task in name order while the caller already reads them
+    blobs = await asyncio.to_thread(lambda: list(bucket.list_blobs(prefix=gcs_base_path)))
+    blobs = sorted((blob for blob in blobs if not blob.name.endswith('/')), key=lambda blob: blob.name)
+    local_paths = [ os.path.join(local_dir, os.path.relpath(blob.name, gcs_base_path)) for blob in blobs ]
+    streamed_prefix = os.path.join(local_dir, streamed_dir) + os.sep
+    streamed_items = [ (blob, local_path) for blob, local_path in zip(blobs, local_paths) if local_path.startswith(streamed_prefix) ]
+    direct_items = [ (blob, local_path) for blob, local_path in zip(blobs, local_paths) if not local_path.startswith(streamed_prefix) ]
+    filesystem.expect_files([ local_path for _, local_path in streamed_items ])
+    marked_paths = set()
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def download_blob(blob, local_path: str) -> bool:
+        async with semaphore:
+            try:
+                os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                # readers only ever see complete files, the final name appears once the download is done
+                part_path = local_path + globals.PART_EXTENSION
+                await asyncio.to_thread(_transfer, 'gcs/download_file', part_path, blob.download_to_filename, part_path)
+                os.replace(part_path, local_path)
+                logger.info(f"Downloaded: {blob.name} -> {local_path}")
+                return True
+            except Exception as e:
+                logger.error(f"Error downloading {blob.name}: {str(e)}")
+                return False
+
+    async def download_streamed_blob(blob, local_path: str) -> bool:
+        is_landed = await download_blob(blob, local_path)
+        filesystem.mark_file(local_path, is_landed)
+        marked_paths.add(local_path)
+        return is_landed
+
+    async def download_streamed() -> Tuple[int, int]:
+        # semaphore waiters are served first come first served, so files start in name order
+        try:
+            with trace.span('gcs/download_streamed', 'io'):
+                results = await asyncio.gather(*[ download_streamed_blob(blob, local_path) for blob, local_path in streamed_items ])
+            return sum(1 for result in results if result), len(results)
+        finally:
+            # a cancelled download must not leave readers waiting
+            for _, local_path in streamed_items:
+                if local_path not in marked_paths:
+                    filesystem.mark_file(local_path, False)
+
+    try:
+        with trace.span('gcs/download_directory', 'io'):
+            await asyncio.gather(*[ download_blob(blob, local_path) for blob, local_path in direct_items ])
+    except BaseException:
+        for _, local_path in streamed_items:
+            filesystem.mark_file(local_path, False)
+        raise
+    return asyncio.create_task(download_streamed())
@@ -1,18 +1,35 @@
 import uvicorn
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 
-from typing import Dict
+from typing import Dict, Optional
 from pathlib import Path
+import contextlib
 
 import video_processor
 import swap_processor
+import fuse_processor
+import DeepFake.config.globals as globals
+import DeepFake.utils.log as log
+import DeepFake.utils.metrics as metrics
+import DeepFake.utils.job_queue as job_queue
 
-app = FastAPI()
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    log.init(globals.LOG_LEVEL)
+    metrics.start()
+    job_queue.start()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 class DetectVideoRequestBody(BaseModel):
     video_path: str
+    user_dir: Optional[str] = None
 
 
 class SwapVideoRequestBody(BaseModel):
@@ -20,29 +37,87 @@ class SwapVideoRequestBody(BaseModel):
     video_dir: str
 
 
+class FuseVideoRequestBody(BaseModel):
+    user_dir: str
+    video_path: str
+
+
 class ResponseBody(BaseModel):
     success: bool
+    job_id: Optional[str] = None
+
+
+class JobResponseBody(BaseModel):
+    job_id: str
+    user: str
+    kind: str
+    status: str
+    stage: Optional[str]
+    frame_count: int
+    frame_total: int
+    progress: float
+    error: Optional[str]
+    created_at: float
+    started_at: Optional[float]
+    finished_at: Optional[float]
+
+
+class HealthResponseBody(BaseModel):
+    status: str
+    queued: int
+    running: int
+    concurrency: int
 
 
 @app.post("/detect-video", response_model=ResponseBody)
 async def detect_video(request: DetectVideoRequestBody):
     video_path = request.video_path
-    try:
-        await video_processor.run(video_path)
-        return ResponseBody(success=True)
-    except Exception as e:
-        return ResponseBody(success=False)
+    # without a user, jobs of the same video directory share a turn
+    user_dir = request.user_dir or '/'.join(video_path.split('/')[:-1])
+    job = await job_queue.submit(user_dir, 'detect-video', video_processor.run, video_path)
+    return ResponseBody(success=True, job_id=job.job_id)
 
 
 @app.post("/swap-video", response_model=ResponseBody)
 async def swap_video(request: SwapVideoRequestBody):
     user_dir = request.user_dir
     video_dir = request.video_dir
-    try:
-        await swap_processor.run(user_dir, video_dir)
-        return ResponseBody(success=True)
-    except Exception as e:
-        return ResponseBody(success=False)
+    job = await job_queue.submit(user_dir, 'swap-video', swap_processor.run, user_dir, video_dir)
+    return ResponseBody(success=True, job_id=job.job_id)
+
+
+@app.post("/detect-swap-video", response_model=ResponseBody)
+async def detect_swap_video(request: FuseVideoRequestBody):
+    user_dir = request.user_dir
+    video_path = request.video_path
+    job = await job_queue.submit(user_dir, 'detect-swap-video', fuse_processor.run, user_dir, video_path)
+    return ResponseBody(success=True, job_id=job.job_id)
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponseBody)
+async def get_job(job_id: str):
+    job = job_queue.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return JobResponseBody(**job.to_dict())
+
+
+@app.delete("/jobs/{job_id}", response_model=JobResponseBody)
+async def cancel_job(job_id: str):
+    job = job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return JobResponseBody(**job.to_dict())
+
+
+@app.get("/health", response_model=HealthResponseBody)
+async def get_health():
+    return HealthResponseBody(status="ok", **job_queue.get_stats())
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,50 @@
+import sys
+import time
+
+import numpy as np
+
+import DeepFake.config.globals as globals
+import DeepFake.utils.log as log
+import DeepFake.utils.blend as blend
+
+
+SIZES = [ (128, 128), (512, 512), (1080, 1080) ]
+REPEAT = 20
+TOLERANCE = 1
+
+
+def create_inputs(size, seed = 0):
+    width, height = size
+    rng = np.random.default_rng(seed)
+    target_frame = rng.integers(0, 256, (height, width, 3), dtype = np.uint8)
+    source_frame = rng.integers(0, 256, (height, width, 3), dtype = np.uint8)
+    mask = rng.integers(0, 256, (height, width), dtype = np.uint8)
+    return target_frame, source_frame, mask
+
+
+def measure(paste, target_frame, source_frame, mask):
+    output_frame = target_frame.copy()
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        output_frame[:] = target_frame
+        paste(output_frame, source_frame, mask)
+    return (time.perf_counter() - start) / REPEAT * 1000, output_frame
+
+
+def main() -> None:
+    log.init(globals.LOG_LEVEL)
+    is_within_tolerance = True
+    for size in SIZES:
+        target_frame, source_frame, mask = create_inputs(size)
+        float_time, float_frame = measure(blend.paste_float, target_frame, source_frame, mask)
+        fixed_time, fixed_frame = measure(blend.paste, target_frame, source_frame, mask)
+        difference = np.abs(float_frame.astype(np.int16) - fixed_frame.astype(np.int16))
+        is_within_tolerance = is_within_tolerance and int(difference.max()) <= TOLERANCE
+        log.info(f'{size[0]}x{size[1]}: float {float_time:.2f}ms, fixed {fixed_time:.2f}ms, speedup {float_time / fixed_time:.1f}x, max diff {difference.max()}, mean diff {difference.mean():.3f}', 'BENCHMARK.BLEND')
+    if not is_within_tolerance:
+        log.error(f'difference exceeds tolerance {TOLERANCE}', 'BENCHMARK.BLEND')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
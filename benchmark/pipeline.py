@@ -0,0 +1,182 @@
+import argparse
+import glob
+import itertools
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import onnxruntime
+
+import DeepFake.config.globals as globals
+import DeepFake.utils.log as log
+import DeepFake.utils.ffmpeg as ffmpeg
+import DeepFake.utils.inference as inference
+import DeepFake.utils.multi_process as multi_process
+import DeepFake.utils.swap_util as swap_util
+import DeepFake.utils.trace as trace
+import DeepFake.utils.vision as vision
+import DeepFake.core.model_zoo.yolox as detector
+import DeepFake.core.model_zoo.face_occluder as masker
+import DeepFake.core.model_zoo.arcface_inswapper as embedder
+import DeepFake.core.model_zoo.inswapper as swapper
+import DeepFake.core.mask as mask
+import DeepFake.core.swap as swap
+import benchmark.synthetic as synthetic
+
+
+'''
+models: synthetic stand-ins unless --model-dir, video: synthetic unless --video-path
+output: { config, models: per model latency, stages: per stage wall time, fps and span totals }
+'''
+
+
+MODEL_MODULES =\
+{
+    'detector': detector,
+    'masker': masker,
+    'embedder': embedder,
+    'swapper': swapper
+}
+
+
+def use_models(model_paths):
+    for model_type, model_path in model_paths.items():
+        MODEL_MODULES[model_type].MODEL_PATH = model_path
+
+
+def init_worker(model_paths, face_tracking):
+    use_models(model_paths)
+    globals.FACE_TRACKING = face_tracking
+
+
+def read_sample_frames(video_path, frame_total):
+    video_resolution = vision.pack_resolution(vision.detect_video_resolution(video_path))
+    return list(itertools.islice(ffmpeg.read_frames(video_path, video_resolution, globals.VIDEO_FPS), frame_total))
+
+
+def time_models(frames, repeat):
+    kps_lists = detector.run_batch(frames)
+    swap_crop_frames = crop_faces(frames, kps_lists, swapper.MODEL_SIZE, swapper.MODEL_TEMPLATE)
+    embed_crop_frames = crop_faces(frames, kps_lists, embedder.MODEL_SIZE, embedder.MODEL_TEMPLATE)
+    source_latent = swapper.prepare_source(embedder.run(embed_crop_frames[0]))
+    calls =\
+    {
+        'detector': (lambda: detector.run_batch(frames), len(frames)),
+        'masker': (lambda: masker.run_batch(swap_crop_frames), len(swap_crop_frames)),
+        'embedder': (lambda: [ embedder.run(crop_frame) for crop_frame in embed_crop_frames ], len(embed_crop_frames)),
+        'swapper': (lambda: swapper.run_batch(swap_crop_frames, [ source_latent ] * len(swap_crop_frames)), len(swap_crop_frames))
+    }
+    results = []
+    for model_type, (call, item_total) in calls.items():
+        call()
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            call()
+            latencies.append((time.perf_counter() - start) * 1000)
+        result =\
+        {
+            'model_type': model_type,
+            'model_path': MODEL_MODULES[model_type].MODEL_PATH,
+            'item_total': item_total,
+            'call_ms_mean': float(np.mean(latencies)),
+            'call_ms_p50': float(np.percentile(latencies, 50)),
+            'call_ms_p95': float(np.percentile(latencies, 95)),
+            'item_ms_mean': float(np.mean(latencies)) / max(item_total, 1)
+        }
+        results.append(result)
+        log.info(f"{model_type}: {result['call_ms_mean']:.2f}ms per call, {result['item_ms_mean']:.2f}ms per item", 'BENCHMARK.PIPELINE')
+    return results
+
+
+def crop_faces(frames, kps_lists, model_size, model_template):
+    return [ crop_frame for crop_frames, _ in swap_util.crop_frames(frames, model_size, model_template, kps_lists) for crop_frame in crop_frames ]
+
+
+def time_stage(stage, frame_total, run_stage, *args):
+    with trace.job('benchmark/' + stage) as trace_job:
+        start = time.perf_counter()
+        run_stage(*args)
+        wall_time = time.perf_counter() - start
+    result =\
+    {
+        'stage': stage,
+        'frame_total': frame_total,
+        'wall_s': wall_time,
+        'fps': frame_total / wall_time if wall_time > 0 else 0.0,
+        'spans': trace_job.summarize() if trace_job else []
+    }
+    log.info(f'{stage}: {wall_time:.2f}s, {result["fps"]:.1f} frame/s', 'BENCHMARK.PIPELINE')
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--work-dir')
+    parser.add_argument('--model-dir')
+    parser.add_argument('--video-path')
+    parser.add_argument('--resolution', default = '640x360')
+    parser.add_argument('--duration', type = float, default = 2)
+    parser.add_argument('--fps', type = int, default = globals.VIDEO_FPS)
+    parser.add_argument('--sample-frames', type = int, default = 8)
+    parser.add_argument('--repeat', type = int, default = 10)
+    parser.add_argument('--execution-backend', default = globals.EXECUTION_BACKEND, choices = [ 'thread', 'process' ])
+    parser.add_argument('--face-tracking', action = 'store_true')
+    parser.add_argument('--output-path')
+    args = parser.parse_args()
+    log.init(globals.LOG_LEVEL)
+    globals.VIDEO_FPS = args.fps
+    globals.EXECUTION_BACKEND = args.execution_backend
+    globals.FACE_TRACKING = args.face_tracking
+    globals.TRACE = True
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix = 'df_benchmark_')
+    model_paths = { model_type: os.path.join(args.model_dir, model_file) for model_type, model_file in synthetic.MODEL_FILES.items() } if args.model_dir else synthetic.create_models(os.path.join(work_dir, 'models'))
+    use_models(model_paths)
+    # process workers import the modules afresh and would load the real models otherwise
+    multi_process.add_worker_initializer(init_worker, model_paths, args.face_tracking)
+    video_path = args.video_path or os.path.join(work_dir, 'videos', 'synthetic', 'synthetic.mp4')
+    if not args.video_path and not synthetic.create_video(video_path, args.resolution, args.duration, args.fps):
+        log.error('cannot create ' + video_path, 'BENCHMARK.PIPELINE')
+        sys.exit(1)
+    source_dir = os.path.join(work_dir, 'source')
+    if not glob.glob(os.path.join(source_dir, '*')):
+        synthetic.create_source_frames(source_dir, args.resolution, 2)
+    mask_dir = os.path.join(work_dir, 'mask')
+    swap_dir = os.path.join(work_dir, 'swap')
+    for stage_dir in [ mask_dir, swap_dir ]:
+        shutil.rmtree(stage_dir, ignore_errors = True)
+    models = time_models(read_sample_frames(video_path, args.sample_frames), args.repeat)
+    frame_total = vision.estimate_video_frame_total(video_path, globals.VIDEO_FPS)
+    stages = [ time_stage('mask', frame_total, mask.run, video_path, mask_dir) ]
+    stages.append(time_stage('swap', len(glob.glob(os.path.join(mask_dir + globals.FRAME_DIR, '*'))), swap.run, source_dir, mask_dir, swap_dir, video_path))
+    results =\
+    {
+        'config':
+        {
+            'host': platform.node(),
+            'cpu_count': os.cpu_count(),
+            'onnxruntime': onnxruntime.__version__,
+            'execution_providers': inference.get_execution_providers(),
+            'execution_backend': globals.EXECUTION_BACKEND,
+            'face_tracking': globals.FACE_TRACKING,
+            'model_precision': globals.MODEL_PRECISION,
+            'video_path': video_path,
+            'resolution': vision.pack_resolution(vision.detect_video_resolution(video_path)),
+            'fps': globals.VIDEO_FPS,
+            'frame_total': frame_total
+        },
+        'models': models,
+        'stages': stages
+    }
+    if args.output_path:
+        with open(args.output_path, 'w') as output_file:
+            json.dump(results, output_file, indent = 4)
+
+
+if __name__ == '__main__':
+    main()
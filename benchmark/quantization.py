@@ -0,0 +1,123 @@
+import argparse
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+import onnxruntime
+
+import DeepFake.config.globals as globals
+import DeepFake.utils.log as log
+import DeepFake.utils.ffmpeg as ffmpeg
+import DeepFake.utils.inference as inference
+import DeepFake.utils.quantize as quantize
+import DeepFake.utils.vision as vision
+
+
+MODEL_TYPES = [ 'detector', 'masker', 'embedder', 'swapper' ]
+PRECISIONS = [ 'int8_dynamic', 'int8_static' ]
+REPEAT = 5
+
+
+def read_sample_frames(video_path, frame_total):
+    video_resolution = vision.pack_resolution(vision.detect_video_resolution(video_path))
+    step = max(1, vision.estimate_video_frame_total(video_path, globals.VIDEO_FPS) // frame_total)
+    frames = ffmpeg.read_frames(video_path, video_resolution, globals.VIDEO_FPS)
+    return list(itertools.islice(frames, 0, None, step))[:frame_total]
+
+
+def run_model(model_path, calibration_inputs):
+    session = onnxruntime.InferenceSession(model_path, providers = inference.get_execution_providers())
+    input_names = inference.get_input_names(session)
+    outputs = []
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        outputs = [ session.run(None, dict(zip(input_names, inputs)))[0] for inputs in calibration_inputs ]
+    latency = (time.perf_counter() - start) / REPEAT / max(len(calibration_inputs), 1) * 1000
+    return latency, outputs
+
+
+def measure_drift(model_type, reference_outputs, variant_outputs):
+    if model_type == 'detector':
+        return 'face box iou', np.nanmean([ box_iou(get_face_box(reference), get_face_box(variant)) for reference, variant in zip(reference_outputs, variant_outputs) ])
+    if model_type == 'masker':
+        return 'mask iou', np.nanmean([ mask_iou(reference > 0.5, variant > 0.5) for reference, variant in zip(reference_outputs, variant_outputs) ])
+    if model_type == 'embedder':
+        return 'embedding cosine', np.mean([ cosine(reference.ravel(), variant.ravel()) for reference, variant in zip(reference_outputs, variant_outputs) ])
+    return 'crop psnr', np.mean([ psnr(reference.clip(0, 1), variant.clip(0, 1)) for reference, variant in zip(reference_outputs, variant_outputs) ])
+
+
+def get_face_box(detections):
+    face_boxes = detections[detections[:, 1] == 3]
+    if len(face_boxes) == 0:
+        return None
+    return face_boxes[np.argmax(face_boxes[:, 2]), 3:7]
+
+
+def box_iou(reference_box, variant_box):
+    if reference_box is None or variant_box is None:
+        return np.nan if reference_box is None and variant_box is None else 0.0
+    x1, y1 = np.maximum(reference_box[:2], variant_box[:2])
+    x2, y2 = np.minimum(reference_box[2:], variant_box[2:])
+    intersection = max(x2 - x1, 0) * max(y2 - y1, 0)
+    union = np.prod(reference_box[2:] - reference_box[:2]) + np.prod(variant_box[2:] - variant_box[:2]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def mask_iou(reference_mask, variant_mask):
+    union = np.logical_or(reference_mask, variant_mask).sum()
+    return np.logical_and(reference_mask, variant_mask).sum() / union if union > 0 else np.nan
+
+
+def cosine(reference, variant):
+    return float(np.dot(reference, variant) / (np.linalg.norm(reference) * np.linalg.norm(variant)))
+
+
+def psnr(reference, variant):
+    mse = np.mean((reference.astype(np.float64) - variant.astype(np.float64)) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(1 / mse)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('video_path')
+    parser.add_argument('--frame-total', type = int, default = 32)
+    parser.add_argument('--precisions', nargs = '+', default = PRECISIONS, choices = PRECISIONS)
+    parser.add_argument('--rebuild', action = 'store_true')
+    parser.add_argument('--output-path')
+    args = parser.parse_args()
+    log.init(globals.LOG_LEVEL)
+    frames = read_sample_frames(args.video_path, args.frame_total)
+    results = []
+    for model_type in MODEL_TYPES:
+        model_path = quantize.MODEL_PATHS[model_type]
+        calibration_inputs = quantize.create_calibration_inputs(model_type, frames)
+        reference_latency, reference_outputs = run_model(model_path, calibration_inputs)
+        for model_precision in args.precisions:
+            variant_path = inference.get_variant_path(model_path, model_precision)
+            if args.rebuild or not os.path.isfile(variant_path):
+                quantize.quantize_model(model_type, model_precision, frames)
+            variant_latency, variant_outputs = run_model(variant_path, calibration_inputs)
+            drift_name, drift = measure_drift(model_type, reference_outputs, variant_outputs)
+            result =\
+            {
+                'model_type': model_type,
+                'precision': model_precision,
+                'sample_total': len(calibration_inputs),
+                'size_mb': os.path.getsize(variant_path) / 1024 ** 2,
+                'fp32_size_mb': os.path.getsize(model_path) / 1024 ** 2,
+                'latency_ms': variant_latency,
+                'fp32_latency_ms': reference_latency,
+                'drift_metric': drift_name,
+                'drift': float(drift)
+            }
+            results.append(result)
+            log.info(f"{model_type} {model_precision}: {variant_latency:.2f}ms vs fp32 {reference_latency:.2f}ms, speedup {reference_latency / variant_latency:.2f}x, {drift_name} {drift:.4f}, size {result['size_mb']:.1f}MB vs {result['fp32_size_mb']:.1f}MB", 'BENCHMARK.QUANTIZATION')
+    if args.output_path:
+        with open(args.output_path, 'w') as output_file:
+            json.dump(results, output_file, indent = 4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+import argparse
+import os
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
+
+import DeepFake.config.globals as globals
+import DeepFake.utils.log as log
+import DeepFake.utils.ffmpeg as ffmpeg
+
+
+'''
+yolox.onnx: images ['batch', 3, 640, 640] -> output ['N', 7], DETECTIONS for every image with its batch index in column 0
+face_occluder.onnx: in_face:0 [N, 256, 256, 3] -> out_mask:0 [N, 256, 256, 1]
+arcface_w600k_r50.onnx: input.1 [N, 3, 112, 112] -> 683 [N, 512]
+inswapper_128.onnx: target ['batch', 3, 128, 128], source ['batch', 512] -> output ['batch', 3, 128, 128], emap [512, 512] is the last initializer
+'''
+
+
+OPSET = 13
+MODEL_FILES =\
+{
+    'detector': 'yolox.onnx',
+    'masker': 'face_occluder.onnx',
+    'embedder': 'arcface_w600k_r50.onnx',
+    'swapper': 'inswapper_128.onnx'
+}
+# batchno, classid, score, x1, y1, x2, y2 in the 640x640 letterbox
+DETECTIONS = np.array(
+[
+    [ 0, 3, 0.9, 220, 150, 420, 430 ],
+    [ 0, 4, 0.8, 260, 240, 300, 265 ],
+    [ 0, 4, 0.8, 340, 240, 380, 265 ],
+    [ 0, 5, 0.8, 300, 280, 340, 330 ],
+    [ 0, 6, 0.8, 270, 350, 370, 385 ]
+], dtype = np.float32)
+
+
+def create_video(video_path, resolution, duration, fps):
+    os.makedirs(os.path.dirname(video_path), exist_ok = True)
+    commands = [ '-f', 'lavfi', '-i', f'testsrc2=size={resolution}:rate={fps}:duration={duration}', '-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}' ]
+    commands.extend([ '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-shortest', '-y', video_path ])
+    return ffmpeg.run_ffmpeg(commands)
+
+
+def create_source_frames(source_dir, resolution, frame_total):
+    os.makedirs(source_dir, exist_ok = True)
+    commands = [ '-f', 'lavfi', '-i', f'testsrc2=size={resolution}:rate=1', '-frames:v', str(frame_total), '-q:v', '2', '-y', os.path.join(source_dir, '%5d.jpg') ]
+    return ffmpeg.run_ffmpeg(commands)
+
+
+def create_models(model_dir):
+    os.makedirs(model_dir, exist_ok = True)
+    builders =\
+    {
+        'detector': create_detector,
+        'masker': create_masker,
+        'embedder': create_embedder,
+        'swapper': create_swapper
+    }
+    model_paths = {}
+    for model_type, create_model in builders.items():
+        model_path = os.path.join(model_dir, MODEL_FILES[model_type])
+        if not os.path.isfile(model_path):
+            save_model(create_model(np.random.default_rng(0)), model_path)
+        model_paths[model_type] = model_path
+    return model_paths
+
+
+def create_detector(rng):
+    nodes =\
+    [
+        helper.make_node('ReduceMean', [ 'images' ], [ 'mean' ], axes = [ 1, 2, 3 ], keepdims = 0),
+        helper.make_node('Mul', [ 'mean', 'zero' ], [ 'zeros' ]),
+        helper.make_node('Add', [ 'zeros', 'one' ], [ 'ones' ]),
+        helper.make_node('CumSum', [ 'ones', 'axis' ], [ 'counts' ]),
+        helper.make_node('Sub', [ 'counts', 'one' ], [ 'batch_indices' ]),
+        helper.make_node('Reshape', [ 'batch_indices', 'column_shape' ], [ 'batch_column' ]),
+        helper.make_node('Mul', [ 'batch_column', 'batch_mask' ], [ 'batch_offsets' ]),
+        helper.make_node('Add', [ 'detections', 'batch_offsets' ], [ 'batch_detections' ]),
+        helper.make_node('Reshape', [ 'batch_detections', 'output_shape' ], [ 'output' ])
+    ]
+    initializers =\
+    [
+        numpy_helper.from_array(DETECTIONS[np.newaxis], 'detections'),
+        numpy_helper.from_array(np.array(0, dtype = np.float32), 'zero'),
+        numpy_helper.from_array(np.array(1, dtype = np.float32), 'one'),
+        numpy_helper.from_array(np.array(0, dtype = np.int64), 'axis'),
+        numpy_helper.from_array(np.array([ -1, 1, 1 ], dtype = np.int64), 'column_shape'),
+        numpy_helper.from_array(np.eye(1, DETECTIONS.shape[1], dtype = np.float32)[np.newaxis], 'batch_mask'),
+        numpy_helper.from_array(np.array([ -1, DETECTIONS.shape[1] ], dtype = np.int64), 'output_shape')
+    ]
+    inputs = [ helper.make_tensor_value_info('images', TensorProto.FLOAT, [ 'batch', 3, 640, 640 ]) ]
+    outputs = [ helper.make_tensor_value_info('output', TensorProto.FLOAT, [ 'N', DETECTIONS.shape[1] ]) ]
+    return helper.make_graph(nodes, 'yolox', inputs, outputs, initializers)
+
+
+def create_masker(rng):
+    nodes =\
+    [
+        helper.make_node('ReduceMean', [ 'in_face:0' ], [ 'mean' ], axes = [ 3 ], keepdims = 1),
+        helper.make_node('Mul', [ 'mean', 'scale' ], [ 'logits' ]),
+        helper.make_node('Sigmoid', [ 'logits' ], [ 'out_mask:0' ])
+    ]
+    initializers = [ numpy_helper.from_array(np.array(8, dtype = np.float32), 'scale') ]
+    inputs = [ helper.make_tensor_value_info('in_face:0', TensorProto.FLOAT, [ 'unk__359', 256, 256, 3 ]) ]
+    outputs = [ helper.make_tensor_value_info('out_mask:0', TensorProto.FLOAT, [ 'unk__360', 256, 256, 1 ]) ]
+    return helper.make_graph(nodes, 'face_occluder', inputs, outputs, initializers)
+
+
+def create_embedder(rng):
+    nodes =\
+    [
+        helper.make_node('AveragePool', [ 'input.1' ], [ 'pool' ], kernel_shape = [ 8, 8 ], strides = [ 8, 8 ]),
+        helper.make_node('Flatten', [ 'pool' ], [ 'flatten' ]),
+        helper.make_node('MatMul', [ 'flatten', 'weight' ], [ '683' ])
+    ]
+    initializers = [ numpy_helper.from_array(rng.standard_normal((3 * 14 * 14, 512)).astype(np.float32), 'weight') ]
+    inputs = [ helper.make_tensor_value_info('input.1', TensorProto.FLOAT, [ 'None', 3, 112, 112 ]) ]
+    outputs = [ helper.make_tensor_value_info('683', TensorProto.FLOAT, [ 'None', 512 ]) ]
+    return helper.make_graph(nodes, 'arcface', inputs, outputs, initializers)
+
+
+def create_swapper(rng):
+    nodes =\
+    [
+        helper.make_node('MatMul', [ 'source', 'weight' ], [ 'style' ]),
+        helper.make_node('Reshape', [ 'style', 'style_shape' ], [ 'style_map' ]),
+        helper.make_node('Sigmoid', [ 'style_map' ], [ 'tint' ]),
+        helper.make_node('Mul', [ 'target', 'keep' ], [ 'kept' ]),
+        helper.make_node('Mul', [ 'tint', 'blend' ], [ 'blended' ]),
+        helper.make_node('Add', [ 'kept', 'blended' ], [ 'output' ])
+    ]
+    initializers =\
+    [
+        numpy_helper.from_array((rng.standard_normal((512, 3)) / 16).astype(np.float32), 'weight'),
+        numpy_helper.from_array(np.array([ -1, 3, 1, 1 ], dtype = np.int64), 'style_shape'),
+        numpy_helper.from_array(np.array(0.8, dtype = np.float32), 'keep'),
+        numpy_helper.from_array(np.array(0.2, dtype = np.float32), 'blend'),
+        # read by inswapper.get_model_matrix, not used by the graph
+        numpy_helper.from_array((rng.standard_normal((512, 512)) / np.sqrt(512)).astype(np.float32), 'emap')
+    ]
+    inputs = [ helper.make_tensor_value_info('target', TensorProto.FLOAT, [ 'batch', 3, 128, 128 ]), helper.make_tensor_value_info('source', TensorProto.FLOAT, [ 'batch', 512 ]) ]
+    outputs = [ helper.make_tensor_value_info('output', TensorProto.FLOAT, [ 'batch', 3, 128, 128 ]) ]
+    return helper.make_graph(nodes, 'inswapper', inputs, outputs, initializers)
+
+
+def save_model(graph, model_path):
+    model = helper.make_model(graph, opset_imports = [ helper.make_opsetid('', OPSET) ])
+    model.ir_version = 8
+    onnx.checker.check_model(model)
+    onnx.save(model, model_path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('output_dir')
+    parser.add_argument('--resolution', default = '640x360')
+    parser.add_argument('--duration', type = float, default = 2)
+    parser.add_argument('--fps', type = int, default = 30)
+    args = parser.parse_args()
+    log.init(globals.LOG_LEVEL)
+    model_paths = create_models(os.path.join(args.output_dir, 'models'))
+    video_path = os.path.join(args.output_dir, 'videos', 'synthetic', 'synthetic.mp4')
+    create_video(video_path, args.resolution, args.duration, args.fps)
+    create_source_frames(os.path.join(args.output_dir, 'source'), args.resolution, 2)
+    for output_path in list(model_paths.values()) + [ video_path ]:
+        log.info(output_path, 'BENCHMARK.SYNTHETIC')
+
+
+if __name__ == '__main__':
+    main()
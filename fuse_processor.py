@@ -0,0 +1,31 @@
+import os
+import shutil
+import asyncio
+
+import GCP.cloud_storage as cs
+import DeepFake.core.fuse as fuse
+import DeepFake.utils.filesystem as filesystem
+import DeepFake.utils.trace as trace
+
+
+async def run(user_dir: str, cloud_video_path: str):
+    cloud_source_dir = user_dir + '/source'
+    cloud_embeddnig_dir = user_dir + '/output/embedding'
+    video_name = cloud_video_path.split('/')[-1]
+    temp_dir = filesystem.resolve_relative_path('./temp')
+    local_user_dir = temp_dir + '/' + cloud_source_dir.split('/')[-2]
+    local_source_dir = local_user_dir + '/source'
+    local_embeddnig_dir = local_user_dir + '/output/embedding'
+    local_video_dir = local_user_dir + '/' + video_name.split('.')[0]
+    local_video_path = os.path.join(local_video_dir, video_name)
+    local_output_dir = local_user_dir + '/output'
+    upload_output_dir = filesystem.get_parent_dir(cloud_source_dir)
+    try:
+        with trace.job('fuse_processor'):
+            await cs.download_directory(cloud_source_dir, local_source_dir)
+            await cs.download_directory(cloud_embeddnig_dir, local_embeddnig_dir)
+            await cs.download_file(cloud_video_path, local_video_path)
+            await asyncio.to_thread(fuse.run, local_source_dir, local_video_path, local_output_dir)
+            await cs.upload_directory(local_output_dir, upload_output_dir)
+    finally:
+        shutil.rmtree(local_user_dir, ignore_errors = True)
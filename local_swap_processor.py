@@ -1,7 +1,10 @@
+import DeepFake.config.globals as globals
+import DeepFake.utils.log as log
 import DeepFake.core.swap as swap
 
 
 if __name__ == '__main__':
+    log.init(globals.LOG_LEVEL)
     local_source_dir = './sources/trump'
     local_target_dir = './targets/7022012_20s_Adult_3840x2160_1_1.mp4/output'
     local_output_dir = './outputs'
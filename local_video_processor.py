@@ -1,4 +1,6 @@
 import os
+import DeepFake.config.globals as globals
+import DeepFake.utils.log as log
 import DeepFake.core.mask as mask
 
 
@@ -14,4 +16,5 @@ def run():
 
 
 if __name__ == '__main__':
+  log.init(globals.LOG_LEVEL)
   run()
\ No newline at end of file
@@ -4,8 +4,10 @@ import argparse
 import asyncio
 
 import GCP.cloud_storage as cs
+import DeepFake.config.globals as globals
 import DeepFake.core.swap as swap
 import DeepFake.utils.filesystem as filesystem
+import DeepFake.utils.trace as trace
 
 
 # def parse_arguments():
@@ -59,11 +61,22 @@ async def run(user_dir: str, cloud_video_dir: str):
     original_video_path = os.path.join(local_video_dir, cloud_video_dir.split('/')[-1] + '.mp4')
     upload_output_dir = filesystem.get_parent_dir(cloud_source_dir)
     try:
-        await cs.download_directory(cloud_source_dir, local_source_dir)
-        await cs.download_directory(cloud_embeddnig_dir, local_embeddnig_dir)
-        await cs.download_directory(cloud_video_dir, local_video_dir)
-        swap.run(local_source_dir, local_target_dir, local_output_dir, original_video_path)
-        await cs.upload_directory(local_output_dir, upload_output_dir)
-    except:
-        raise
-    shutil.rmtree(local_user_dir)
\ No newline at end of file
+        with trace.job('swap_processor'):
+            # process workers do not share the landing state, they would read frames that are still downloading
+            if globals.PIPELINED_TRANSFER and globals.EXECUTION_BACKEND != 'process':
+                await asyncio.gather(cs.download_directory(cloud_source_dir, local_source_dir), cs.download_directory(cloud_embeddnig_dir, local_embeddnig_dir))
+                frame_download = await cs.start_download_directory(cloud_video_dir, local_video_dir, 'output' + globals.FRAME_DIR)
+                try:
+                    await asyncio.to_thread(swap.run, local_source_dir, local_target_dir, local_output_dir, original_video_path)
+                except BaseException:
+                    frame_download.cancel()
+                    raise
+                await frame_download
+            else:
+                await cs.download_directory(cloud_source_dir, local_source_dir)
+                await cs.download_directory(cloud_embeddnig_dir, local_embeddnig_dir)
+                await cs.download_directory(cloud_video_dir, local_video_dir)
+                await asyncio.to_thread(swap.run, local_source_dir, local_target_dir, local_output_dir, original_video_path)
+            await cs.upload_directory(local_output_dir, upload_output_dir)
+    finally:
+        shutil.rmtree(local_user_dir, ignore_errors = True)
\ No newline at end of file
@@ -0,0 +1,77 @@
+import os
+import pickle
+
+import numpy as np
+
+import DeepFake.utils.artifact_store as artifact_store
+
+
+CROP_SIZE = (8, 6)
+
+
+def create_faces(face_count, seed):
+    rng = np.random.default_rng(seed)
+    crop_frames = [ rng.integers(0, 256, (CROP_SIZE[1], CROP_SIZE[0], 3), dtype = np.uint8) for _ in range(face_count) ]
+    masks = [ rng.integers(0, 256, (CROP_SIZE[1], CROP_SIZE[0]), dtype = np.uint8) for _ in range(face_count) ]
+    matrices = [ rng.standard_normal((2, 3)) for _ in range(face_count) ]
+    return crop_frames, masks, matrices
+
+
+def test_round_trip(tmp_path):
+    store_dir = str(tmp_path / 'artifacts')
+    faces = { 1: create_faces(2, 1), 2: create_faces(0, 2), 3: create_faces(1, 3) }
+    writer = artifact_store.ArtifactWriter(store_dir, CROP_SIZE)
+    for frame_number in [ 3, 1, 2 ]:
+        writer.write(frame_number, *faces[frame_number])
+    writer.close()
+    assert artifact_store.is_store(store_dir)
+    reader = artifact_store.ArtifactReader(store_dir)
+    for frame_number, (crop_frames, masks, matrices) in faces.items():
+        read_crop_frames, read_masks, read_matrices = reader.read(frame_number)
+        assert len(read_crop_frames) == len(crop_frames)
+        for crop_frame, read_crop_frame in zip(crop_frames, read_crop_frames):
+            np.testing.assert_array_equal(crop_frame, read_crop_frame)
+        for mask, read_mask in zip(masks, read_masks):
+            np.testing.assert_array_equal(mask, read_mask)
+        for matrix, read_matrix in zip(matrices, read_matrices):
+            np.testing.assert_array_equal(matrix, read_matrix)
+
+
+def test_missing_frame(tmp_path):
+    store_dir = str(tmp_path / 'artifacts')
+    writer = artifact_store.ArtifactWriter(store_dir, CROP_SIZE)
+    writer.write(1, *create_faces(1, 1))
+    writer.close()
+    crop_frames, masks, matrices = artifact_store.ArtifactReader(store_dir).read(5)
+    assert len(crop_frames) == len(masks) == len(matrices) == 0
+
+
+def test_empty_store(tmp_path):
+    store_dir = str(tmp_path / 'artifacts')
+    artifact_store.ArtifactWriter(store_dir, CROP_SIZE).close()
+    crop_frames, _, _ = artifact_store.ArtifactReader(store_dir).read(1)
+    assert crop_frames.shape == (0, CROP_SIZE[1], CROP_SIZE[0], 3)
+
+
+def test_pickle(tmp_path):
+    store_dir = str(tmp_path / 'artifacts')
+    crop_frames, masks, matrices = create_faces(1, 1)
+    writer = artifact_store.ArtifactWriter(store_dir, CROP_SIZE)
+    writer.write(1, crop_frames, masks, matrices)
+    writer.close()
+    reader = pickle.loads(pickle.dumps(artifact_store.ArtifactReader(store_dir)))
+    np.testing.assert_array_equal(reader.read(1)[0][0], crop_frames[0])
+
+
+def test_alias(tmp_path):
+    store_dir = str(tmp_path / 'artifacts')
+    crop_frames, masks, matrices = create_faces(2, 1)
+    writer = artifact_store.ArtifactWriter(store_dir, CROP_SIZE)
+    writer.write(1, crop_frames, masks, matrices)
+    writer.write(2, [], [], [], source_frame_number = 1)
+    writer.close()
+    reader = artifact_store.ArtifactReader(store_dir)
+    assert reader.get_source(2) == 1
+    assert reader.get_source(1) is None
+    np.testing.assert_array_equal(reader.read(2)[0], reader.read(1)[0])
+    assert os.path.getsize(os.path.join(store_dir, artifact_store.CROP_FILE)) == sum(crop_frame.nbytes for crop_frame in crop_frames)
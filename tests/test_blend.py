@@ -0,0 +1,26 @@
+import numpy as np
+
+import DeepFake.utils.blend as blend
+
+
+def create_inputs(seed):
+    rng = np.random.default_rng(seed)
+    target_frame = rng.integers(0, 256, (24, 32, 3), dtype = np.uint8)
+    source_frame = rng.integers(0, 256, (24, 32, 3), dtype = np.uint8)
+    mask = rng.integers(0, 256, (24, 32), dtype = np.uint8)
+    return target_frame, source_frame, mask
+
+
+def test_paste_matches_float():
+    target_frame, source_frame, mask = create_inputs(0)
+    fixed_frame = blend.paste(target_frame.copy(), source_frame, mask)
+    float_frame = blend.paste_float(target_frame.copy(), source_frame, mask)
+    assert np.abs(fixed_frame.astype(np.int16) - float_frame.astype(np.int16)).max() <= 1
+
+
+def test_paste_read_only():
+    target_frame, source_frame, mask = create_inputs(1)
+    read_only_frame = np.frombuffer(target_frame.tobytes(), dtype = np.uint8).reshape(target_frame.shape)
+    paste_frame = blend.paste(read_only_frame, source_frame, mask)
+    np.testing.assert_array_equal(paste_frame, blend.paste(target_frame.copy(), source_frame, mask))
+    np.testing.assert_array_equal(read_only_frame, target_frame)
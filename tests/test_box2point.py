@@ -0,0 +1,86 @@
+import numpy as np
+
+import DeepFake.utils.box2point as box2point
+
+
+def get_center(box):
+    return np.array([ (box[0] + box[2]) / 2, (box[1] + box[3]) / 2 ])
+
+
+def get_angle(vector):
+    return np.arctan2(vector[1], vector[0])
+
+
+def filter_boxes(boxes, face_box, max_items):
+    inface_boxes = [ box for box in boxes if np.all(face_box[:2] <= get_center(box)) and np.all(get_center(box) <= face_box[2:]) ]
+    if len(inface_boxes) > max_items:
+        inface_boxes = sorted(inface_boxes, key = lambda box: np.sum((get_center(box) - get_center(face_box)) ** 2))[:max_items]
+    return inface_boxes
+
+
+def reference_kps(face_box, eye_boxes, nose_boxes, mouth_boxes):
+    # one face at a time, as box2point did before it was vectorized
+    eye_boxes = filter_boxes(eye_boxes, face_box, 2)
+    nose_boxes = filter_boxes(nose_boxes, face_box, 1)
+    mouth_boxes = filter_boxes(mouth_boxes, face_box, 1)
+    eyes_center = np.mean([ get_center(box) for box in eye_boxes ], axis = 0) if len(eye_boxes) == 2 else None
+    nose_center = get_center(nose_boxes[0]) if nose_boxes else None
+    mouth_center = get_center(mouth_boxes[0]) if mouth_boxes else None
+    if eyes_center is not None:
+        face_angle = get_angle(eyes_center - next(center for center in [ nose_center, mouth_center, face_box[:2] ] if center is not None))
+    elif mouth_center is not None:
+        face_angle = get_angle((nose_center if nose_center is not None else face_box[:2]) - mouth_center)
+    else:
+        face_angle = np.pi / 2
+    kps = np.full((5, 2), np.nan)
+    eye_centers = [ get_center(box) for box in eye_boxes ]
+    if len(eye_boxes) == 1:
+        reference = nose_boxes[0][:2] if nose_boxes else mouth_boxes[0][:2] if mouth_boxes else get_center(face_box)
+        kps[0 if get_angle(eye_centers[0] - reference) > face_angle else 1] = eye_centers[0]
+    if len(eye_boxes) == 2:
+        reference = mouth_boxes[0][:2] if mouth_boxes else nose_boxes[0][:2] if nose_boxes else get_center(face_box)
+        angles = [ get_angle(eye_center - reference) for eye_center in eye_centers ]
+        kps[:2] = eye_centers if angles[0] < angles[1] else eye_centers[::-1]
+    if nose_boxes:
+        nose_box = nose_boxes[0]
+        kps[2] = nose_center - np.array([ np.cos(face_angle), np.sin(face_angle) ]) * (nose_box[2:] - nose_box[:2]) / 2 * 0.25
+    if mouth_boxes:
+        mouth_box = mouth_boxes[0]
+        h_angle = face_angle - np.pi / 2
+        offset = np.array([ np.cos(h_angle), np.sin(h_angle) ]) * (mouth_box[2:] - mouth_box[:2]) / 2
+        kps[3], kps[4] = mouth_center - offset, mouth_center + offset
+        if h_angle < -np.pi / 2 or h_angle > np.pi / 2:
+            kps[3], kps[4] = kps[4].copy(), kps[3].copy()
+    return kps
+
+
+def create_boxes(rng, face_boxes, part_total, part_size):
+    boxes = []
+    for _ in range(part_total):
+        face_box = face_boxes[rng.integers(len(face_boxes))]
+        center = rng.uniform(face_box[:2] - 5, face_box[2:] + 5)
+        boxes.append(np.concatenate([ center - part_size / 2, center + part_size / 2 ]))
+    return np.array(boxes).reshape(-1, 4)
+
+
+def create_frame(rng):
+    face_total = rng.integers(1, 5)
+    corners = rng.uniform(0, 500, (face_total, 2))
+    face_boxes = np.concatenate([ corners, corners + rng.uniform(40, 150, (face_total, 2)) ], axis = 1)
+    eye_boxes = create_boxes(rng, face_boxes, rng.integers(0, 3 * face_total + 1), rng.uniform(5, 20))
+    nose_boxes = create_boxes(rng, face_boxes, rng.integers(0, 2 * face_total + 1), rng.uniform(5, 20))
+    mouth_boxes = create_boxes(rng, face_boxes, rng.integers(0, 2 * face_total + 1), rng.uniform(5, 30))
+    return face_boxes, eye_boxes, nose_boxes, mouth_boxes
+
+
+def test_matches_reference():
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        face_boxes, eye_boxes, nose_boxes, mouth_boxes = create_frame(rng)
+        kps_list = box2point.run(face_boxes, eye_boxes, nose_boxes, mouth_boxes)
+        reference_kps_list = np.array([ reference_kps(face_box, eye_boxes, nose_boxes, mouth_boxes) for face_box in face_boxes ])
+        np.testing.assert_allclose(kps_list, reference_kps_list, atol = 1e-9)
+
+
+def test_no_faces():
+    assert box2point.run([], [ [ 0, 0, 1, 1 ] ], [], []).shape == (0, 5, 2)
@@ -0,0 +1,79 @@
+from collections import OrderedDict
+import asyncio
+import threading
+import time
+
+import pytest
+
+import DeepFake.utils.job_queue as job_queue
+
+
+@pytest.fixture(autouse = True)
+def reset_queue(monkeypatch):
+    monkeypatch.setattr(job_queue, '_condition', None)
+    monkeypatch.setattr(job_queue, '_workers', [])
+    monkeypatch.setattr(job_queue, '_queues', OrderedDict())
+    monkeypatch.setattr(job_queue, '_jobs', OrderedDict())
+
+
+async def wait_finished(jobs):
+    while any(job.finished_at is None for job in jobs):
+        await asyncio.sleep(0.01)
+
+
+def test_round_robin():
+    order = []
+
+    async def record(name):
+        order.append(name)
+
+    async def main():
+        job_queue.start(1)
+        jobs = [ await job_queue.submit(user, 'test', record, name) for user, name in [ ('a', 'a1'), ('a', 'a2'), ('a', 'a3'), ('b', 'b1'), ('c', 'c1') ] ]
+        await wait_finished(jobs)
+        return jobs
+
+    jobs = asyncio.run(main())
+    assert order == [ 'a1', 'b1', 'c1', 'a2', 'a3' ]
+    assert all(job.status == 'succeeded' for job in jobs)
+
+
+def test_cancel():
+    started = threading.Event()
+
+    def process_frames():
+        started.set()
+        while True:
+            job_queue.raise_if_cancelled()
+            time.sleep(0.01)
+
+    async def run():
+        await asyncio.to_thread(process_frames)
+
+    async def main():
+        job_queue.start(1)
+        running_job = await job_queue.submit('a', 'test', run)
+        queued_job = await job_queue.submit('a', 'test', run)
+        await asyncio.to_thread(started.wait)
+        assert job_queue.cancel(queued_job.job_id).status == 'cancelled'
+        assert job_queue.get_stats()['queued'] == 0
+        assert job_queue.cancel(running_job.job_id).status == 'cancelling'
+        await wait_finished([ running_job ])
+        return running_job
+
+    assert asyncio.run(main()).status == 'cancelled'
+    assert job_queue.cancel('unknown') is None
+
+
+def test_failed_job():
+    async def fail():
+        raise ValueError('broken')
+
+    async def main():
+        job = await job_queue.submit('a', 'test', fail)
+        await wait_finished([ job ])
+        return job
+
+    job = asyncio.run(main())
+    assert job.status == 'failed'
+    assert 'broken' in job.error
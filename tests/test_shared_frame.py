@@ -0,0 +1,80 @@
+import subprocess
+import sys
+
+import numpy as np
+
+import DeepFake.utils.frame_sink as frame_sink
+import DeepFake.utils.shared_frame as shared_frame
+
+
+FRAME_SHAPE = (4, 6, 3)
+SLOT_SIZE = int(np.prod(FRAME_SHAPE))
+
+
+def create_frame(value):
+    return np.full(FRAME_SHAPE, value, dtype = np.uint8)
+
+
+def test_pool_acquire_release():
+    pool = shared_frame.SharedFramePool(3, SLOT_SIZE)
+    try:
+        slots = pool.acquire(3)
+        assert sorted(slots) == [ 0, 1, 2 ]
+        pool.release(slots[:1])
+        assert pool.acquire(1) == slots[:1]
+    finally:
+        pool.close()
+
+
+def test_pack_unpack_item():
+    pool = shared_frame.SharedFramePool(2, SLOT_SIZE)
+    try:
+        large_frame = np.zeros((8, 8, 3), dtype = np.uint8)
+        packed_item = shared_frame.pack_item(pool, 1, (7, create_frame(9), large_frame))
+        assert packed_item[0] == 7
+        assert packed_item[1] == shared_frame.FrameRef(1, FRAME_SHAPE)
+        assert packed_item[2] is large_frame
+        assert shared_frame.get_item_slots([ packed_item ]) == [ 1 ]
+        memory = shared_frame.attach(pool.name)
+        unpacked_item = shared_frame.unpack_item(memory, SLOT_SIZE, packed_item)
+        np.testing.assert_array_equal(unpacked_item[1], create_frame(9))
+        np.testing.assert_array_equal(pool.view(packed_item[1]), create_frame(9))
+        del unpacked_item
+        shared_frame.detach_stale('')
+    finally:
+        pool.close()
+
+
+def test_sink_proxy_reuses_input_slot():
+    pool = shared_frame.SharedFramePool(2, SLOT_SIZE)
+    try:
+        memory = shared_frame.attach(pool.name)
+        input_frame = shared_frame.unpack_item(memory, SLOT_SIZE, shared_frame.pack_item(pool, 0, (1, create_frame(3))))[1]
+        sink_proxy = shared_frame.SinkProxy(memory, SLOT_SIZE, [ 0, 1 ], [ 0 ])
+        input_frame += 1
+        sink_proxy.write(1, input_frame)
+        sink_proxy.write(2, create_frame(5))
+        sink_proxy.write(3, create_frame(6))
+        assert sink_proxy.writes[0] == (1, shared_frame.FrameRef(0, FRAME_SHAPE))
+        assert sink_proxy.writes[1] == (2, shared_frame.FrameRef(1, FRAME_SHAPE))
+        assert sink_proxy.writes[2][0] == 3
+        np.testing.assert_array_equal(sink_proxy.writes[2][1], create_frame(6))
+        np.testing.assert_array_equal(pool.view(shared_frame.FrameRef(0, FRAME_SHAPE)), create_frame(4))
+        np.testing.assert_array_equal(pool.view(shared_frame.FrameRef(1, FRAME_SHAPE)), create_frame(5))
+        del input_frame
+        shared_frame.detach_stale('')
+    finally:
+        pool.close()
+
+
+def test_frame_sink_reorder(tmp_path):
+    output_path = str(tmp_path / 'frames.bin')
+    commands = [ sys.executable, '-c', 'import shutil, sys; shutil.copyfileobj(sys.stdin.buffer, open(sys.argv[1], "wb"))', output_path ]
+    process = subprocess.Popen(commands, stdin = subprocess.PIPE, stderr = subprocess.PIPE)
+    sink = frame_sink.FrameSink(process)
+    for frame_number in [ 3, 1, 5, 2, 4 ]:
+        sink.write(frame_number, create_frame(frame_number))
+    assert sink.close()
+    with open(output_path, 'rb') as output_file:
+        frames = np.frombuffer(output_file.read(), dtype = np.uint8).reshape(-1, *FRAME_SHAPE)
+    assert [ int(frame[0, 0, 0]) for frame in frames ] == [ 1, 2, 3, 4, 5 ]
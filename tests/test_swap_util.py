@@ -0,0 +1,49 @@
+import cv2
+import numpy as np
+
+import DeepFake.utils.swap_util as swap_util
+
+
+MODEL_SIZE = (112, 112)
+MODEL_TEMPLATE = np.array(
+[
+    [ 0.36167656, 0.40387734 ],
+    [ 0.63696719, 0.40235469 ],
+    [ 0.50019687, 0.56044219 ],
+    [ 0.38710391, 0.72160547 ],
+    [ 0.61507734, 0.72034453 ]
+])
+
+
+def create_kps_list(rng, face_total, noise):
+    # template points through a random similarity transform plus some noise
+    angles = rng.uniform(-np.pi / 4, np.pi / 4, face_total)
+    scales = rng.uniform(0.5, 3, face_total)
+    rotations = np.stack([ np.stack([ np.cos(angles), -np.sin(angles) ], axis = 1), np.stack([ np.sin(angles), np.cos(angles) ], axis = 1) ], axis = 1)
+    kps_list = scales[:, np.newaxis, np.newaxis] * (MODEL_TEMPLATE * MODEL_SIZE) @ rotations.transpose(0, 2, 1)
+    return kps_list + rng.uniform(0, 500, (face_total, 1, 2)) + rng.normal(0, noise, kps_list.shape)
+
+
+def reference_matrix(kps, model_size, model_template):
+    # estimateAffinePartial2D as crop_frame used it before the batched solve
+    is_present = ~np.isnan(kps).any(axis = 1)
+    return cv2.estimateAffinePartial2D(kps[is_present], (model_template * model_size)[is_present], method = cv2.RANSAC, ransacReprojThreshold = 100)[0]
+
+
+def test_matches_reference():
+    rng = np.random.default_rng(0)
+    kps_list = create_kps_list(rng, 200, 1)
+    kps_list[rng.random(kps_list.shape[:2]) < 0.2] = np.nan
+    affine_matrices, is_valid = swap_util.estimate_matrices(kps_list, MODEL_SIZE, MODEL_TEMPLATE)
+    for kps, affine_matrix, valid in zip(kps_list, affine_matrices, is_valid):
+        assert valid == (np.sum(~np.isnan(kps).any(axis = 1)) >= 2)
+        if valid:
+            np.testing.assert_allclose(affine_matrix, reference_matrix(kps, MODEL_SIZE, MODEL_TEMPLATE), atol = 2e-3, rtol = 2e-3)
+
+
+def test_exact_similarity():
+    kps_list = create_kps_list(np.random.default_rng(1), 8, 0)
+    affine_matrices, is_valid = swap_util.estimate_matrices(kps_list, MODEL_SIZE, MODEL_TEMPLATE)
+    assert is_valid.all()
+    for kps, affine_matrix in zip(kps_list, affine_matrices):
+        np.testing.assert_allclose(cv2.transform(kps[np.newaxis], affine_matrix)[0], MODEL_TEMPLATE * MODEL_SIZE, atol = 1e-6)
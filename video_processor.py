@@ -4,8 +4,10 @@ import argparse
 import asyncio
 
 import GCP.cloud_storage as cs
+import DeepFake.config.globals as globals
 import DeepFake.core.mask as mask
 import DeepFake.utils.filesystem as filesystem
+import DeepFake.utils.trace as trace
 
 
 # def parse_arguments():
@@ -44,9 +46,19 @@ async def run(cloud_video_path: str):
     local_output_dir = local_video_dir + '/' + 'output'
     cloud_video_dir = '/'.join(cloud_video_path.split('/')[:-1])
     try:
-        await cs.download_file(cloud_video_path, local_video_path)
-        mask.run(local_video_path, local_output_dir)
-        await cs.upload_directory(local_output_dir, cloud_video_dir)
-    except:
-        raise
-    shutil.rmtree(local_video_dir)
\ No newline at end of file
+        with trace.job('mask_processor'):
+            await cs.download_file(cloud_video_path, local_video_path)
+            if globals.PIPELINED_TRANSFER:
+                uploader = cs.Uploader(local_output_dir, cloud_video_dir)
+                with filesystem.listen_files(uploader.submit):
+                    try:
+                        await asyncio.to_thread(mask.run, local_video_path, local_output_dir)
+                    except BaseException:
+                        uploader.cancel()
+                        raise
+                await uploader.finish()
+            else:
+                await asyncio.to_thread(mask.run, local_video_path, local_output_dir)
+                await cs.upload_directory(local_output_dir, cloud_video_dir)
+    finally:
+        shutil.rmtree(local_video_dir, ignore_errors = True)
\ No newline at end of file